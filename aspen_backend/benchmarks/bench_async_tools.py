@@ -0,0 +1,113 @@
+"""Inter-token latency of concurrent streams while tools are running.
+
+Simulates N client streams on one event loop (each "token" is a short sleep) while the
+agent runs a batch of tool calls. Compares calling the blocking `_run` methods on the
+loop (the old behavior) against the async `_arun` execution layer, and reports the
+p50/p99/max gap between tokens.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_async_tools --streams 8 --file-mb 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.tools import file_system_tools
+from src.tools.file_system_tools import FileReadTool, GrepTool, ListDirectoryTool
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_workspace(root: Path, file_mb: int, n_files: int) -> None:
+    line = "def handler(request):  # some representative source line for grep\n"
+    big = root / "big.log"
+    with open(big, "w", encoding="utf-8") as f:
+        repeats = (file_mb * 1024 * 1024) // len(line)
+        f.write(line * repeats)
+    src = root / "src"
+    src.mkdir()
+    for i in range(n_files):
+        (src / f"module_{i}.py").write_text(line * 200, encoding="utf-8")
+
+
+async def token_stream(interval: float, stop: asyncio.Event, gaps: list[float]) -> None:
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+async def run_tools(mode: str, rounds: int) -> None:
+    read, listing, grep = FileReadTool(), ListDirectoryTool(), GrepTool()
+    for _ in range(rounds):
+        if mode == "blocking":
+            # Old behavior: blocking calls on the loop, yielding only between calls.
+            read._run("big.log")
+            await asyncio.sleep(0)
+            listing._run("src")
+            await asyncio.sleep(0)
+            grep._run("handler", ".")
+            await asyncio.sleep(0)
+        else:
+            await asyncio.gather(
+                read._arun("big.log"),
+                listing._arun("src"),
+                grep._arun("handler", "."),
+            )
+
+
+async def measure(mode: str, streams: int, interval: float, rounds: int) -> dict:
+    stop = asyncio.Event()
+    gaps: list[float] = []
+    stream_tasks = [asyncio.create_task(token_stream(interval, stop, gaps)) for _ in range(streams)]
+    await asyncio.sleep(interval * 2)
+    started = time.perf_counter()
+    await run_tools(mode, rounds)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*stream_tasks)
+    gaps_ms = [g * 1000 for g in gaps]
+    return {
+        "mode": mode,
+        "tool_wall_s": elapsed,
+        "tokens": len(gaps_ms),
+        "p50_ms": statistics.median(gaps_ms) if gaps_ms else 0.0,
+        "p99_ms": percentile(gaps_ms, 99),
+        "max_ms": max(gaps_ms) if gaps_ms else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=8, help="Concurrent simulated client streams")
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="Target inter-token interval")
+    parser.add_argument("--rounds", type=int, default=5, help="Tool-call batches per run")
+    parser.add_argument("--file-mb", type=int, default=50, help="Size of the large file read by read_file")
+    parser.add_argument("--files", type=int, default=2000, help="Number of small files for list/grep")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        build_workspace(root, args.file_mb, args.files)
+        file_system_tools.WORKSPACE_ROOT = root
+
+        print(f"{'mode':<10}{'tool wall s':>12}{'tokens':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for mode in ("blocking", "async"):
+            r = asyncio.run(measure(mode, args.streams, args.interval_ms / 1000, args.rounds))
+            print(f"{r['mode']:<10}{r['tool_wall_s']:>12.2f}{r['tokens']:>8}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Write throughput through the mutation journal, and rollback time.
+
+Writes a burst of file edits through write_file in a temporary workspace with:
+
+  direct         no journal: write_atomic (temp file, fsync, rename) per write
+  journal-batch  the journal, commits every ASPEN_JOURNAL_SYNC_MS (writes don't wait)
+  journal-wait   the journal, each write waits until a group commit covering it is durable
+
+Each mode runs once with one writer and once with --writers concurrent threads (as
+parallel tool calls do). The time of the journal modes includes the final commit, so
+every write is durable at the end in all modes.
+
+Then rollback is timed after a history of --history writes, going back --rollback-depth
+writes (the cost should follow the depth, not the history), and compaction is timed.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_journal --writes 500 --files 50 --writers 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from src.journal import MutationJournal, close_journal, open_journal
+from src.tools import file_system_tools
+from src.tools.file_system_tools import FileWriteTool
+
+
+def file_body(file_index: int, version: int, size: int) -> str:
+    line = f"def function_{file_index}(version={version}):\n    return {version}\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def fsync_latency(directory: Path, samples: int = 100) -> float:
+    """Seconds per 4 KiB append + fsync on the filesystem of `directory`."""
+    path = directory / "fsync_probe"
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY)
+    try:
+        started = time.perf_counter()
+        for _ in range(samples):
+            os.write(fd, b"x" * 4096)
+            os.fsync(fd)
+        return (time.perf_counter() - started) / samples
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+
+def run_writes(workspace: Path, writes: int, files: int, writers: int, size: int) -> float:
+    tool = FileWriteTool()
+
+    def writer(worker: int) -> None:
+        # Each writer edits its own files, like independent tool calls of a step
+        for i in range(worker, writes, writers):
+            file_index = (i % files) // writers * writers + worker if files >= writers else i % files
+            result = tool._run(f"src/module_{file_index}.py", file_body(file_index, i, size))
+            if not result.startswith("Successfully"):
+                raise RuntimeError(result)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def measure_mode(mode: str, writes: int, files: int, writers: int, size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp) / "workspace"
+        (workspace / "src").mkdir(parents=True)
+        for i in range(files):
+            (workspace / "src" / f"module_{i}.py").write_text(file_body(i, -1, size), encoding="utf-8")
+        file_system_tools.WORKSPACE_ROOT = workspace.resolve()
+        journal = None
+        if mode != "direct":
+            journal = open_journal(workspace, Path(tmp) / "journal", sync=mode.split("-")[1])
+        try:
+            seconds = run_writes(workspace, writes, files, writers, size)
+            if journal is not None:
+                started = time.perf_counter()
+                journal.commit()
+                seconds += time.perf_counter() - started
+                stats = journal.snapshot()
+            else:
+                stats = {}
+        finally:
+            if journal is not None:
+                close_journal(workspace)
+    return {
+        "mode": mode,
+        "writers": writers,
+        "seconds": round(seconds, 4),
+        "writes_per_second": round(writes / seconds, 1),
+        "commits": stats.get("commits"),
+        "fsyncs": stats.get("fsyncs", writes),
+    }
+
+
+def measure_rollback(history: int, depths: list[int], files: int, size: int, repeats: int) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp) / "workspace"
+        (workspace / "src").mkdir(parents=True)
+        journal = MutationJournal(workspace, Path(tmp) / "journal")
+        for i in range(history):
+            journal.write(workspace / "src" / f"module_{i % files}.py", file_body(i % files, i, size))
+        journal.commit()
+        for depth in depths:
+            timings = []
+            restored = 0
+            for _ in range(repeats):
+                last = journal.snapshot()["last_seq"]
+                started = time.perf_counter()
+                # Back `depth` writes into the original history
+                restored = len(journal.rollback(history - depth))
+                timings.append(time.perf_counter() - started)
+                # Undo the rollback (it's journaled too) so every repeat starts equal
+                journal.rollback(last)
+            results.append({
+                "history": journal.snapshot()["entries"],
+                "depth": depth,
+                "files_restored": restored,
+                "rollback_ms": round(statistics.median(timings) * 1000, 3),
+            })
+        started = time.perf_counter()
+        dropped = journal.compact()
+        results.append({"compaction_ms": round((time.perf_counter() - started) * 1000, 1), "dropped": dropped,
+                        "stats": journal.snapshot()})
+        journal.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=500, help="Writes per run")
+    parser.add_argument("--files", type=int, default=50, help="Distinct files written")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writers in the parallel runs")
+    parser.add_argument("--size", type=int, default=8192, help="Bytes per written file")
+    parser.add_argument("--history", type=int, default=20_000, help="Journal length for the rollback timing")
+    parser.add_argument("--rollback-depth", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    writes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fsync_us = fsync_latency(Path(tmp)) * 1e6
+    print(f"{args.writes} writes of {args.size} B over {args.files} files; fsync here: {fsync_us:.0f} us")
+    print(f"{'mode':<15}{'writers':>8}{'writes/s':>11}{'seconds':>10}{'commits':>9}{'fsyncs':>8}")
+    for writers in (1, args.writers):
+        for mode in ("direct", "journal-batch", "journal-wait"):
+            r = measure_mode(mode, args.writes, args.files, writers, args.size)
+            writes.append(r)
+            print(f"{r['mode']:<15}{r['writers']:>8}{r['writes_per_second']:>11.1f}{r['seconds']:>10.3f}"
+                  f"{r['commits'] if r['commits'] is not None else '-':>9}{r['fsyncs']:>8}")
+
+    rollback = measure_rollback(args.history, args.rollback_depth, args.files, 1024, args.repeats)
+    print(f"rollback with {args.history} writes of history:")
+    for r in rollback[:-1]:
+        print(f"  back {r['depth']:>5} writes: {r['rollback_ms']:>9.3f} ms ({r['files_restored']} files restored)")
+    compaction = rollback[-1]
+    print(f"compaction: {compaction['compaction_ms']} ms, dropped {compaction['dropped']} entries, "
+          f"pack {compaction['stats']['pack_bytes']} B, {compaction['stats']['blobs']} blobs")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "fsync_us": round(fsync_us, 1), "writes": writes, "rollback": rollback},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
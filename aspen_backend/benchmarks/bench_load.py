@@ -0,0 +1,238 @@
+"""End-to-end load benchmark of the streaming endpoints against the stub model server.
+
+Starts benchmarks/stub_ollama.py and the real FastAPI app from src/main.py (served by
+uvicorn in this process, with a temporary checkpoint DB and workspace), then drives
+/agent_chat and /test_llm_stream with N concurrent clients over HTTP. Reports, per
+endpoint and round:
+
+  - time to first text chunk (TTFT) p50/p95/p99
+  - inter-chunk latency p50/p95/p99/max as seen by the client
+  - throughput (requests/s and text chunks/s) and errors
+  - resident memory after each round, to spot growth across rounds
+
+The default agent script makes one read_file call and then answers, so every agent
+request exercises the model pool, the tool layer and the checkpointer. Everything is
+deterministic and needs no GPU or network.
+
+--replay turns on the completion cache in record/replay mode (src/completion_cache.py).
+Clients send the same messages every round, so round 1 records the model calls and later
+rounds replay them. That shows the cost of the server without generation. Pass
+--completion-cache-db to keep the recordings between runs (e.g. ones made against a real
+Ollama).
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_load --clients 16 --requests 4 --rounds 3
+    python -m benchmarks.bench_load --endpoint test_llm_stream --json results.json
+    python -m benchmarks.bench_load --replay --rounds 3
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+from benchmarks.stub_ollama import StubConfig, StubOllamaServer
+
+DEFAULT_ANSWER = " ".join(f"word{i}" for i in range(40))
+DEFAULT_SCRIPT = [
+    {"tool_calls": [{"name": "read_file", "arguments": {"file_path": "notes.txt"}}]},
+    {"text": DEFAULT_ANSWER},
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_mb() -> float:
+    """Current resident set size (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_workspace(root: Path) -> None:
+    (root / "notes.txt").write_text("".join(f"line {i}: some notes for the agent\n" for i in range(500)), encoding="utf-8")
+    (root / "src").mkdir()
+    for i in range(50):
+        (root / "src" / f"module_{i}.py").write_text(f"def handler_{i}(request):\n    return {i}\n", encoding="utf-8")
+
+
+async def one_request(client: httpx.AsyncClient, endpoint: str, message: str) -> dict:
+    started = time.perf_counter()
+    arrivals: list[float] = []
+    error = None
+    try:
+        async with client.stream("POST", f"/{endpoint}", json={"message": message}) as response:
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                if "text" in record:
+                    arrivals.append(time.perf_counter())
+                elif "error" in record:
+                    error = record["error"]
+    except httpx.HTTPError as e:
+        error = str(e)
+    return {
+        "ttft": arrivals[0] - started if arrivals else None,
+        "gaps": [b - a for a, b in zip(arrivals, arrivals[1:])],
+        "chunks": len(arrivals),
+        "error": error,
+    }
+
+
+async def run_round(base_url: str, endpoint: str, clients: int, requests_per_client: int) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def client_loop(client_id: int) -> list[dict]:
+            return [await one_request(client, endpoint, f"client {client_id} request {i}") for i in range(requests_per_client)]
+
+        started = time.perf_counter()
+        per_client = await asyncio.gather(*(client_loop(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    results = [r for rs in per_client for r in rs]
+    ttfts = [r["ttft"] * 1000 for r in results if r["ttft"] is not None]
+    gaps = [g * 1000 for r in results for g in r["gaps"]]
+    chunks = sum(r["chunks"] for r in results)
+    gc.collect()
+    return {
+        "endpoint": endpoint,
+        "requests": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "wall_s": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "ttft_ms": {p: round(percentile(ttfts, q), 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "inter_chunk_ms": {
+            "p50": round(statistics.median(gaps), 2) if gaps else 0.0,
+            "p95": round(percentile(gaps, 95), 2),
+            "p99": round(percentile(gaps, 99), 2),
+            "max": round(max(gaps), 2) if gaps else 0.0,
+        },
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+class AppServer:
+    """Serves the Aspen app with uvicorn in a background thread."""
+
+    def __init__(self, app, port: int):
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True, name="aspen-app")
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "AppServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["agent_chat", "test_llm_stream", "both"], default="both")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=4, help="Sequential requests per client per round")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per endpoint (memory is sampled after each)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.02, help="Stub prefill latency in seconds")
+    parser.add_argument("--max-parallel", type=int, default=4, help="Requests the stub model serves at once")
+    parser.add_argument("--script", help="JSON file with the stub response script (see stub_ollama.py)")
+    parser.add_argument("--stub-port", type=int, default=11437)
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--replay", action="store_true", help="Record model calls in round 1 and replay them afterwards")
+    parser.add_argument("--completion-cache-db", help="Completion cache database for --replay (default: temporary)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+    config = StubConfig(
+        tokens_per_second=args.tokens_per_second,
+        first_token_latency=args.first_token_latency,
+        max_parallel=args.max_parallel,
+        script=script,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp).resolve()
+        workspace = tmp_path / "workspace"
+        workspace.mkdir()
+        build_workspace(workspace)
+        # src.main reads its configuration at import time
+        os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}"
+        os.environ["ASPEN_CHECKPOINT_DB"] = str(tmp_path / "checkpoints.sqlite")
+        os.environ.setdefault("ASPEN_LOG_LEVEL", "WARNING")
+        if args.replay:
+            os.environ["ASPEN_COMPLETION_CACHE"] = "all"
+            os.environ["ASPEN_COMPLETION_CACHE_DB"] = args.completion_cache_db or str(tmp_path / "completions.sqlite")
+
+        with StubOllamaServer(config, port=args.stub_port):
+            from src import main as aspen_main
+            from src.tools import file_system_tools
+
+            file_system_tools.WORKSPACE_ROOT = workspace
+            endpoints = ["agent_chat", "test_llm_stream"] if args.endpoint == "both" else [args.endpoint]
+            results = []
+            with AppServer(aspen_main.app, args.app_port) as app_server:
+                baseline = rss_mb()
+                print(f"{args.clients} clients x {args.requests} requests, stub {args.tokens_per_second:.0f} tok/s; baseline RSS {baseline:.1f} MB")
+                print(
+                    f"{'endpoint':<17}{'round':>6}{'req/s':>8}{'chunk/s':>9}{'err':>5}"
+                    f"{'ttft p50':>10}{'p95':>8}{'p99':>8}{'gap p50':>9}{'p95':>7}{'p99':>7}{'rss MB':>8}"
+                )
+                for endpoint in endpoints:
+                    for round_no in range(1, args.rounds + 1):
+                        r = asyncio.run(run_round(app_server.base_url, endpoint, args.clients, args.requests))
+                        r["round"] = round_no
+                        results.append(r)
+                        t, g = r["ttft_ms"], r["inter_chunk_ms"]
+                        print(
+                            f"{endpoint:<17}{round_no:>6}{r['requests_per_s']:>8.1f}{r['chunks_per_s']:>9.0f}{r['errors']:>5}"
+                            f"{t['p50']:>10.1f}{t['p95']:>8.1f}{t['p99']:>8.1f}{g['p50']:>9.2f}{g['p95']:>7.2f}{g['p99']:>7.2f}{r['rss_mb']:>8.1f}"
+                        )
+                print(f"RSS growth over the run: {rss_mb() - baseline:+.1f} MB")
+                if aspen_main.completion_cache is not None:
+                    stats = aspen_main.completion_cache.stats()
+                    print(f"completion cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Time-to-first-token of interactive requests while background work saturates a role.
+
+Starts the stub Ollama server (benchmarks/stub_ollama.py), floods the "chat" role with
+background requests, then issues interactive requests and measures how long each waits
+for its first token. Compares FIFO dispatch (everything at one priority, which is what a
+single shared ChatOllama gives) with the pool's priority queue, and prints the pool's
+own queue metrics. Also reports the first-request latency with and without preloading.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_model_pool --background 12 --interactive 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stub_ollama import StubConfig, StubOllamaServer
+from src.model_pool import ModelPool, ModelRole, Priority, request_priority
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def first_token_latency(pool: ModelPool, priority: Priority) -> float:
+    model = pool.chat_model("chat")
+    started = time.perf_counter()
+    ttft = None
+    with request_priority(priority):
+        async for _ in model.astream([HumanMessage(content="hello")]):
+            if ttft is None:
+                ttft = time.perf_counter() - started
+    return ttft if ttft is not None else time.perf_counter() - started
+
+
+async def run_mix(base_url: str, concurrency: int, background: int, interactive: int, prioritized: bool) -> dict:
+    pool = ModelPool([ModelRole("chat", "stub-chat", max_concurrency=concurrency)], base_url=base_url)
+    interactive_priority = Priority.INTERACTIVE if prioritized else Priority.BACKGROUND
+    bg_tasks = [asyncio.create_task(first_token_latency(pool, Priority.BACKGROUND)) for _ in range(background)]
+    # Let the background burst occupy the slots and queue up first
+    await asyncio.sleep(0.05)
+    fg = await asyncio.gather(*(first_token_latency(pool, interactive_priority) for _ in range(interactive)))
+    await asyncio.gather(*bg_tasks)
+    fg_ms = [v * 1000 for v in fg]
+    return {
+        "mode": "priority" if prioritized else "fifo",
+        "p50_ms": statistics.median(fg_ms),
+        "p95_ms": percentile(fg_ms, 95),
+        "max_ms": max(fg_ms),
+        "metrics": pool.metrics()["roles"]["chat"],
+    }
+
+
+async def run_preload(base_url: str, preload: bool) -> float:
+    pool = ModelPool([ModelRole("chat", f"stub-cold-{preload}", preload=preload)], base_url=base_url)
+    if preload:
+        await pool.preload()
+    return await first_token_latency(pool, Priority.INTERACTIVE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--background", type=int, default=12, help="Background requests in the burst")
+    parser.add_argument("--interactive", type=int, default=4, help="Interactive requests issued during the burst")
+    parser.add_argument("--concurrency", type=int, default=2, help="max_concurrency of the chat role")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--load-seconds", type=float, default=1.0, help="Simulated model load time")
+    parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        tokens_per_second=args.tokens_per_second,
+        max_parallel=args.concurrency,
+        load_seconds=args.load_seconds,
+    )
+    with StubOllamaServer(config, port=args.port) as server:
+        # The model used by the mix counts as loaded so load time doesn't skew it
+        server.stub.loaded_models.add("stub-chat")
+
+        print(f"interactive time-to-first-token, {args.background} background requests, concurrency {args.concurrency}")
+        print(f"{'mode':<10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'max queue':>11}{'wait p95 ms':>13}")
+        for prioritized in (False, True):
+            r = asyncio.run(run_mix(server.base_url, args.concurrency, args.background, args.interactive, prioritized))
+            m = r["metrics"]
+            print(
+                f"{r['mode']:<10}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['max_ms']:>9.1f}"
+                f"{m['max_queue_depth']:>11}{m['wait_seconds']['p95'] * 1000:>13.1f}"
+            )
+
+        cold = asyncio.run(run_preload(server.base_url, False))
+        warm = asyncio.run(run_preload(server.base_url, True))
+        print(f"first request TTFT: cold {cold * 1000:.0f} ms, preloaded {warm * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
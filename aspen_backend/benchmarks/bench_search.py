@@ -0,0 +1,113 @@
+"""Compare the ripgrep and trigram-index backends of search_file_content.
+
+Generates a synthetic source tree (50k files by default), then times a set of queries
+through GrepTool with ASPEN_SEARCH_BACKEND=rg and =index. Index build time and the cost
+of an incremental update after a write are reported separately.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_search --files 50000
+"""
+
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.tools import file_system_tools
+from src.tools.file_system_tools import FileWriteTool, GrepTool
+from src.tools.search_index import get_search_index
+
+WORDS = [
+    "request", "response", "handler", "session", "config", "buffer", "stream", "token",
+    "parse", "render", "cache", "index", "worker", "queue", "client", "server", "model",
+    "agent", "graph", "node", "event", "state", "error", "retry", "timeout", "payload",
+]
+
+QUERIES = [
+    "def handle_request",
+    "class SessionManager",
+    r"timeout_\d+",
+    "unique_marker_4242",
+    r"import (os|sys)",
+    "TODO",
+]
+
+
+def build_tree(root: Path, n_files: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    per_dir = 100
+    for i in range(n_files):
+        directory = root / f"pkg_{i // (per_dir * per_dir)}" / f"mod_{(i // per_dir) % per_dir}"
+        directory.mkdir(parents=True, exist_ok=True)
+        lines = ["import os", "import sys", ""]
+        for j in range(rng.randint(20, 60)):
+            a, b = rng.choice(WORDS), rng.choice(WORDS)
+            lines.append(f"def {a}_{b}_{j}({a}, {b}):")
+            lines.append(f"    return {a}.{b}(timeout_{rng.randint(0, 999)})")
+        if i % 1000 == 0:
+            lines.append("class SessionManager:\n    def handle_request(self):\n        pass  # TODO")
+        if i == n_files // 2:
+            lines.append("# unique_marker_4242")
+        (directory / f"file_{i}.py").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def time_queries(tool: GrepTool, repeats: int) -> dict[str, float]:
+    results = {}
+    for query in QUERIES:
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            tool._run(query, ".")
+            samples.append(time.perf_counter() - started)
+        results[query] = statistics.median(samples)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50000, help="Number of files in the synthetic tree")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per query (median is reported)")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp()).resolve()
+    try:
+        started = time.perf_counter()
+        build_tree(tmp, args.files)
+        print(f"generated {args.files} files in {time.perf_counter() - started:.1f}s")
+        file_system_tools.WORKSPACE_ROOT = tmp
+        tool = GrepTool()
+
+        rg_times = None
+        if shutil.which("rg"):
+            file_system_tools.SEARCH_BACKEND = "rg"
+            rg_times = time_queries(tool, args.repeats)
+        else:
+            print("rg not found on PATH; skipping the ripgrep backend")
+
+        file_system_tools.SEARCH_BACKEND = "index"
+        index = get_search_index(tmp)
+        started = time.perf_counter()
+        index.refresh(force=True)
+        print(f"index build: {time.perf_counter() - started:.2f}s")
+        index_times = time_queries(tool, args.repeats)
+
+        writer = FileWriteTool()
+        started = time.perf_counter()
+        writer._run("pkg_0/mod_0/file_0.py", "def fresh_symbol_xyz():\n    pass\n")
+        write_s = time.perf_counter() - started
+        found = "fresh_symbol_xyz" in tool._run("fresh_symbol_xyz", ".")
+        print(f"write + incremental index update: {write_s * 1000:.2f}ms (visible to next query: {found})")
+
+        print(f"\n{'query':<24}{'rg ms':>10}{'index ms':>10}")
+        for query in QUERIES:
+            rg_ms = f"{rg_times[query] * 1000:.1f}" if rg_times else "-"
+            print(f"{query:<24}{rg_ms:>10}{index_times[query] * 1000:>10.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
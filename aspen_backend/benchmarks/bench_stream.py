@@ -0,0 +1,166 @@
+"""Streaming cost per token by framing mode, and generation wasted after a disconnect.
+
+Starts the stub model server and the real app (as benchmarks/bench_load.py does), then:
+
+  framing     N concurrent clients stream a long answer with framing "token" (one NDJSON
+              line per model chunk) and "coalesce" (chunks merged into frames, see
+              src/streaming.py). Reports the CPU time of the app's event-loop thread per
+              streamed token, frames and bytes per request, and time to first text.
+  disconnect  Each client reads a few frames and then drops the connection. Reports
+              how many tokens the model generated after the disconnect and how long
+              it took until no generation was running. Both should be about zero.
+
+The event-loop thread's CPU clock is read directly, so the stub server and the
+clients in the same process don't count.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_stream --clients 8 --tokens 400 --tokens-per-second 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_load import AppServer, percentile
+from benchmarks.stub_ollama import StubConfig, StubOllamaServer
+
+
+def thread_cpu_seconds(thread) -> float:
+    return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+
+
+async def stream_one(client: httpx.AsyncClient, endpoint: str, framing: str, stop_after: int = 0) -> dict:
+    started = time.perf_counter()
+    first = None
+    frames = 0
+    payload = 0
+    async with client.stream("POST", f"/{endpoint}", json={"message": "write a long answer", "framing": framing}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            payload += len(line) + 1
+            if "text" in json.loads(line):
+                frames += 1
+                if first is None:
+                    first = time.perf_counter() - started
+                if stop_after and frames >= stop_after:
+                    break
+    return {"ttft": first, "frames": frames, "bytes": payload}
+
+
+async def measure_framing(base_url: str, endpoint: str, framing: str, clients: int, requests: int, loop_thread) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def client_loop() -> list[dict]:
+            return [await stream_one(client, endpoint, framing) for _ in range(requests)]
+
+        cpu_before = thread_cpu_seconds(loop_thread)
+        started = time.perf_counter()
+        per_client = await asyncio.gather(*(client_loop() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        cpu = thread_cpu_seconds(loop_thread) - cpu_before
+    results = [r for rs in per_client for r in rs]
+    return {
+        "framing": framing,
+        "requests": len(results),
+        "wall_s": round(elapsed, 3),
+        "cpu_s": round(cpu, 4),
+        "frames_per_request": round(statistics.mean(r["frames"] for r in results), 1),
+        "bytes_per_request": round(statistics.mean(r["bytes"] for r in results)),
+        "ttft_ms_p50": round(percentile([r["ttft"] * 1000 for r in results if r["ttft"]], 50), 1),
+    }
+
+
+async def measure_disconnect(base_url: str, endpoint: str, stub, requests: int, read_frames: int) -> dict:
+    wasted, abort_ms = [], []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        for _ in range(requests):
+            await stream_one(client, endpoint, "token", stop_after=read_frames)
+            # stream_one returned: the response was closed mid-stream
+            at_disconnect = stub.tokens_generated
+            closed = time.perf_counter()
+            while stub.active and time.perf_counter() - closed < 30:
+                await asyncio.sleep(0.005)
+            abort_ms.append((time.perf_counter() - closed) * 1000)
+            await asyncio.sleep(0.2)
+            wasted.append(stub.tokens_generated - at_disconnect)
+    return {
+        "requests": requests,
+        "wasted_tokens_mean": round(statistics.mean(wasted), 1),
+        "wasted_tokens_max": max(wasted),
+        "generation_stopped_ms_p50": round(percentile(abort_ms, 50), 1),
+        "generation_stopped_ms_max": round(max(abort_ms), 1),
+        "aborted_model_requests": stub.aborted,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["agent_chat", "test_llm_stream"], default="agent_chat")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients in the framing run")
+    parser.add_argument("--requests", type=int, default=3, help="Sequential requests per client")
+    parser.add_argument("--tokens", type=int, default=400, help="Length of the streamed answer")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0, help="Stub generation speed per stream")
+    parser.add_argument("--disconnects", type=int, default=5, help="Requests dropped mid-stream")
+    parser.add_argument("--read-frames", type=int, default=5, help="Frames read before dropping the connection")
+    parser.add_argument("--stub-port", type=int, default=11438)
+    parser.add_argument("--app-port", type=int, default=8766)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    answer = " ".join(f"token{i}" for i in range(args.tokens))
+    config = StubConfig(tokens_per_second=args.tokens_per_second, first_token_latency=0.01,
+                        max_parallel=args.clients, script=[{"text": answer}])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}"
+        os.environ["ASPEN_CHECKPOINT_DB"] = str(Path(tmp) / "checkpoints.sqlite")
+        os.environ.setdefault("ASPEN_LOG_LEVEL", "WARNING")
+
+        with StubOllamaServer(config, port=args.stub_port) as stub_server:
+            from src import main as aspen_main
+
+            with AppServer(aspen_main.app, args.app_port) as app_server:
+                loop_thread = app_server._thread
+                # Warm-up (imports, connection pools, first checkpoint writes)
+                asyncio.run(measure_framing(app_server.base_url, args.endpoint, "token", 2, 1, loop_thread))
+
+                framing = []
+                for mode in ("token", "coalesce"):
+                    framing.append(asyncio.run(measure_framing(
+                        app_server.base_url, args.endpoint, mode, args.clients, args.requests, loop_thread
+                    )))
+                tokens = args.tokens * args.clients * args.requests
+                print(f"{args.endpoint}: {args.clients} clients x {args.requests} requests, {args.tokens} tokens each, "
+                      f"stub {args.tokens_per_second:.0f} tok/s per stream")
+                print(f"{'framing':<10}{'cpu us/token':>14}{'frames/req':>12}{'bytes/req':>11}{'ttft p50 ms':>13}{'wall s':>8}")
+                for r in framing:
+                    r["cpu_us_per_token"] = round(r["cpu_s"] / tokens * 1e6, 2)
+                    print(f"{r['framing']:<10}{r['cpu_us_per_token']:>14.2f}{r['frames_per_request']:>12.1f}"
+                          f"{r['bytes_per_request']:>11}{r['ttft_ms_p50']:>13.1f}{r['wall_s']:>8.2f}")
+
+                disconnect = asyncio.run(measure_disconnect(
+                    app_server.base_url, args.endpoint, stub_server.stub, args.disconnects, args.read_frames
+                ))
+                print(
+                    f"disconnect after {args.read_frames} frames: {disconnect['wasted_tokens_mean']:.1f} tokens generated "
+                    f"afterwards (max {disconnect['wasted_tokens_max']}), generation stopped after "
+                    f"{disconnect['generation_stopped_ms_p50']:.1f} ms p50 ({disconnect['generation_stopped_ms_max']:.1f} max), "
+                    f"{disconnect['aborted_model_requests']} model requests aborted"
+                )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "framing": framing, "disconnect": disconnect}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Steps and tokens per code-navigation task, with and without code_symbols.
+
+Replays the tool calls an agent makes for two kinds of task against a real source tree
+(this repository by default), through the real tools, and counts the calls and the
+tokens of their results (~4 chars/token, as in context_manager.py):
+
+  lookup   "show me the definition of X", for definitions sampled from the tree
+             without  search_file_content for X (index backend), then read_file from the
+                      definition's line with the default window (more if it's longer)
+             with     code_symbols(name=X), then read_file of exactly its line range
+  outline  "what's in file Y"
+             without  read_file windows until the whole file has been seen
+             with     code_symbols(file_path=Y)
+
+Each task's "prefill" counts the result tokens the model is prompted with again on
+every later step of the task (a result of step i is in the prompt of steps i+1..n+1).
+The model's own choices (a wrong grep hit, a second search) aren't simulated, so the
+"without" numbers are a lower bound.
+
+Also times the first build of the index, reopening the persisted index, and the
+incremental update after a write.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_symbols --lookups 40 --outlines 15
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.tools import file_system_tools
+from src.tools.file_system_tools import READ_DEFAULT_LIMIT, FileReadTool, GrepTool
+from src.tools.output_budget import CHARS_PER_TOKEN
+from src.tools.search_index import get_search_index
+from src.tools.symbol_index import SymbolIndex, _indexes
+from src.tools.symbol_tools import CodeSymbolsTool
+
+DEFINITION_KINDS = ("class", "function", "method", "interface", "type", "enum")
+
+
+def tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def prefill(outputs: list[int]) -> int:
+    n = len(outputs)
+    return sum(size * (n - i) for i, size in enumerate(outputs))
+
+
+def read_range(path: str, first: int, last: int, limit: int) -> list[str]:
+    """read_file calls (windows of `limit` lines from `first`) until `last` is covered."""
+    reader = FileReadTool()
+    outputs = []
+    offset = first - 1
+    while True:
+        result = reader._run(path, offset=offset, limit=limit)
+        outputs.append(result)
+        match = re.search(r"next_offset=(\d+)", result)
+        if match is None or int(match.group(1)) >= last:
+            return outputs
+        offset = int(match.group(1))
+
+
+def lookup_task(path: str, name: str, qualname: str, line: int, end_line: int) -> dict:
+    without = [GrepTool()._run(rf"\b{re.escape(name)}\b")]
+    without += read_range(path, line, end_line, READ_DEFAULT_LIMIT)
+    with_index = [CodeSymbolsTool()._run(name=qualname)]
+    with_index += read_range(path, line, end_line, end_line - line + 1)
+    return {"without": [tokens(o) for o in without], "with": [tokens(o) for o in with_index]}
+
+
+def outline_task(path: str) -> dict:
+    without = read_range(path, 1, 10**9, READ_DEFAULT_LIMIT)
+    with_index = [CodeSymbolsTool()._run(file_path=path)]
+    return {"without": [tokens(o) for o in without], "with": [tokens(o) for o in with_index]}
+
+
+def summarize(tasks: list[dict]) -> dict:
+    out = {}
+    for mode in ("without", "with"):
+        out[mode] = {
+            "steps": round(statistics.mean(len(t[mode]) for t in tasks), 2),
+            "result_tokens": round(statistics.mean(sum(t[mode]) for t in tasks), 1),
+            "result_tokens_p90": sorted(sum(t[mode]) for t in tasks)[int(0.9 * (len(tasks) - 1))],
+            "prefill_tokens": round(statistics.mean(prefill(t[mode]) for t in tasks), 1),
+        }
+    return out
+
+
+def time_index(root: Path) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "symbols.sqlite"
+        started = time.perf_counter()
+        index = SymbolIndex(root, db)
+        index.refresh()
+        build = time.perf_counter() - started
+        stats = index.stats()
+        started = time.perf_counter()
+        reopened = SymbolIndex(root, db)
+        ready = reopened.ready
+        reopened.refresh()
+        reopen = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp).resolve()
+        source = "\n\n".join(f"def function_{i}(a, b):\n    return a + b" for i in range(300)) + "\n"
+        (workspace / "module.py").write_text(source, encoding="utf-8")
+        index = SymbolIndex(workspace)
+        index.refresh()
+        started = time.perf_counter()
+        index.update_file(workspace / "module.py")
+        update = time.perf_counter() - started
+    return {"files": stats["files"], "symbols": stats["symbols"], "build_ms": round(build * 1000, 1),
+            "reopen_ready": ready, "reopen_and_check_ms": round(reopen * 1000, 1),
+            "update_300_defs_ms": round(update * 1000, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=str(Path(__file__).resolve().parents[2]), help="Source tree to navigate")
+    parser.add_argument("--lookups", type=int, default=40, help="Definition lookups sampled")
+    parser.add_argument("--outlines", type=int, default=15, help="Files outlined")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    index_timing = time_index(root)
+    print(f"index of {root}: {index_timing['files']} files, {index_timing['symbols']} symbols, "
+          f"built in {index_timing['build_ms']} ms; reopened (ready={index_timing['reopen_ready']}) and checked "
+          f"in {index_timing['reopen_and_check_ms']} ms; update of a 300-definition file "
+          f"{index_timing['update_300_defs_ms']} ms")
+
+    file_system_tools.WORKSPACE_ROOT = root
+    # The search index answers like rg (and doesn't need it installed); built up front so
+    # the searches aren't timed against a build
+    file_system_tools.SEARCH_BACKEND = "index"
+    get_search_index(root).refresh(force=True)
+    _indexes.clear()
+    index = SymbolIndex(root)
+    index.refresh()
+    _indexes[str(root)] = index
+
+    rng = random.Random(args.seed)
+    rows = index._conn.execute(
+        f"SELECT path, name, qualname, line, end_line FROM symbols WHERE kind IN ({','.join('?' * len(DEFINITION_KINDS))})",
+        DEFINITION_KINDS,
+    ).fetchall()
+    # Names defined once, so both ways find the same definition
+    counts: dict[str, int] = {}
+    for row in rows:
+        counts[row[2]] = counts.get(row[2], 0) + 1
+    candidates = [row for row in rows if counts[row[2]] == 1 and not row[1].startswith("__")]
+    lookups = [lookup_task(*row) for row in rng.sample(candidates, min(args.lookups, len(candidates)))]
+    files = [row[0] for row in index._conn.execute("SELECT path FROM files WHERE lines > 0 ORDER BY path")]
+    outlines = [outline_task(path) for path in rng.sample(files, min(args.outlines, len(files)))]
+
+    results = {"index": index_timing}
+    print(f"{'task':<9}{'mode':<9}{'steps':>7}{'result tok':>12}{'p90':>7}{'prefill tok':>13}")
+    for label, tasks in (("lookup", lookups), ("outline", outlines)):
+        summary = summarize(tasks)
+        results[label] = {"tasks": len(tasks), **summary}
+        for mode in ("without", "with"):
+            s = summary[mode]
+            print(f"{label:<9}{mode:<9}{s['steps']:>7}{s['result_tokens']:>12}{s['result_tokens_p90']:>7}"
+                  f"{s['prefill_tokens']:>13}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Wall-clock time of one agent step that issues several tool calls.
+
+Runs the tools node on an AIMessage with N read_file calls, a list_directory and a
+search_file_content. It compares calling them one after another with the
+ToolCallScheduler (src/tools/tool_scheduler.py). Each read can be given an extra
+simulated I/O latency (slow disk, network filesystem), so the effect is visible even
+when the synthetic files are in the page cache.
+
+With the scheduler the step should take about as long as its slowest call (times
+ceil(N / max_parallel) when the calls outnumber the cap), not the sum of all calls.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_tool_step --reads 6 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import START, MessagesState, StateGraph
+from langgraph.prebuilt import ToolNode
+
+from src.tools import file_system_tools
+from src.tools.file_system_tools import FileReadTool, GrepTool, ListDirectoryTool
+from src.tools.result_cache import TOOL_RESULT_CACHE
+from src.tools.tool_scheduler import ToolCallScheduler
+
+
+class SlowFileReadTool(FileReadTool):
+    """read_file with an added fixed latency per call."""
+
+    latency: float = 0.0
+
+    async def _arun(self, *args, **kwargs) -> str:
+        await asyncio.sleep(self.latency)
+        return await super()._arun(*args, **kwargs)
+
+
+def build_graph(tools, wrapper):
+    graph = StateGraph(MessagesState)
+    graph.add_node("tools", ToolNode(tools, awrap_tool_call=wrapper))
+    graph.add_edge(START, "tools")
+    return graph.compile()
+
+
+def sequential_wrapper():
+    # One call at a time, in order: what running the calls back to back costs
+    lock = asyncio.Lock()
+
+    async def wrapper(request, execute):
+        async with lock:
+            return await execute(request)
+
+    return wrapper
+
+
+async def run_step(graph, tool_calls: list[dict], step: int) -> float:
+    TOOL_RESULT_CACHE.clear()
+    message = AIMessage(content="", tool_calls=tool_calls, id=f"step-{step}")
+    started = time.perf_counter()
+    await graph.ainvoke({"messages": [message]})
+    return time.perf_counter() - started
+
+
+async def measure(mode: str, tools, tool_calls: list[dict], repeats: int, max_parallel: int) -> list[float]:
+    wrapper = sequential_wrapper() if mode == "sequential" else ToolCallScheduler(max_parallel).awrap
+    graph = build_graph(tools, wrapper)
+    return [await run_step(graph, tool_calls, i) for i in range(repeats)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=6, help="read_file calls in the step")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated I/O latency per read")
+    parser.add_argument("--max-parallel", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        for i in range(max(args.reads, 1)):
+            (root / f"file_{i}.py").write_text("".join(f"value_{j} = {j}\n" for j in range(5000)), encoding="utf-8")
+        file_system_tools.WORKSPACE_ROOT = root
+
+        reader = SlowFileReadTool()
+        reader.latency = args.latency_ms / 1000
+        tools = [reader, ListDirectoryTool(), GrepTool()]
+        tool_calls = [
+            {"name": "read_file", "args": {"file_path": f"file_{i}.py", "offset": 2500}, "id": f"read-{i}"}
+            for i in range(args.reads)
+        ]
+        tool_calls.append({"name": "list_directory", "args": {"dir_path": "."}, "id": "list"})
+        tool_calls.append({"name": "search_file_content", "args": {"pattern": "value_4999", "path": "."}, "id": "grep"})
+
+        print(f"{len(tool_calls)} calls per step, {args.latency_ms:.0f} ms per read, max_parallel {args.max_parallel}")
+        print(f"{'mode':<12}{'p50 ms':>9}{'min ms':>9}")
+        for mode in ("sequential", "scheduled"):
+            samples = asyncio.run(measure(mode, tools, tool_calls, args.repeats, args.max_parallel))
+            print(f"{mode:<12}{statistics.median(samples) * 1000:>9.1f}{min(samples) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Micro-benchmarks for every tool in src/tools/file_system_tools.py.
+
+Builds a synthetic workspace and times each tool's `_run` for a fixed number of
+iterations. Read-only tools are timed twice: "cold", with the tool result cache and the
+directory snapshots cleared before every call, and "warm", served from them. Reports the median and p95 per
+call. The output has one line per case so successive runs can be diffed, and --json
+writes the same numbers for CI-style comparison.
+
+search_file_content is timed with the ripgrep backend (skipped when `rg` isn't on PATH)
+and with the in-process trigram index.
+
+Run from aspen_backend/:
+    python -m benchmarks.bench_tools --iterations 50
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.bench_load import percentile
+from src.tools import file_system_tools
+from src.tools.file_system_tools import FileEditTool, FileReadTool, FileWriteTool, GrepTool, ListDirectoryTool
+from src.tools.result_cache import TOOL_RESULT_CACHE
+from src.tools.search_index import get_search_index
+from src.tools.tree_listing import TREE_SNAPSHOTS
+
+
+def build_workspace(root: Path, n_files: int, big_file_mb: int, edit_functions: int) -> None:
+    src = root / "src"
+    src.mkdir()
+    for i in range(n_files):
+        body = "".join(f"def handler_{i}_{j}(request):\n    return process(request, {j})\n\n" for j in range(40))
+        (src / f"module_{i}.py").write_text(body, encoding="utf-8")
+    line = "2024-01-01 12:00:00 INFO request handled in 12ms path=/api/items\n"
+    with open(root / "big.log", "w", encoding="utf-8") as f:
+        f.write(line * ((big_file_mb * 1024 * 1024) // len(line)))
+    (root / "edit_target.py").write_text(
+        "".join(f"def function_{j}():\n    return {j}\n\n" for j in range(edit_functions)), encoding="utf-8"
+    )
+
+
+def time_calls(func: Callable[[], str], iterations: int, before: Callable[[], None] = lambda: None) -> dict:
+    samples = []
+    result = ""
+    for _ in range(iterations):
+        before()
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "error": result if result.startswith("Error") else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--files", type=int, default=500, help="Source files in the synthetic workspace")
+    parser.add_argument("--big-file-mb", type=int, default=20, help="Size of the large log file")
+    parser.add_argument("--edit-lines", type=int, default=50_000, help="Length of the file edited by edit_file")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        edit_functions = max(20, args.edit_lines // 3)
+        build_workspace(root, args.files, args.big_file_mb, edit_functions)
+        file_system_tools.WORKSPACE_ROOT = root
+        read, listing, grep = FileReadTool(), ListDirectoryTool(), GrepTool()
+        write, edit = FileWriteTool(), FileEditTool()
+        n = args.iterations
+
+        cases: list[tuple[str, str, Callable[[], str]]] = [
+            ("read_file", "small file head", lambda: read._run("src/module_0.py")),
+            ("read_file", "big file head", lambda: read._run("big.log")),
+            ("read_file", "big file tail window", lambda: read._run("big.log", offset=250_000, limit=200)),
+            ("list_directory", f"{args.files} entries", lambda: listing._run("src")),
+            ("list_directory", "recursive, whole tree", lambda: listing._run(".", recursive=True)),
+        ]
+        if shutil.which("rg"):
+            cases.append(("search_file_content", "rg literal", lambda: grep._run("handler_42_7", ".")))
+
+        def clear_caches() -> None:
+            TOOL_RESULT_CACHE.clear()
+            TREE_SNAPSHOTS.clear()
+
+        results = []
+        for tool, case, func in cases:
+            cold = time_calls(func, n, before=clear_caches)
+            func()
+            warm = time_calls(func, n)
+            results.append({"tool": tool, "case": case, "mode": "cold", **cold})
+            results.append({"tool": tool, "case": case, "mode": "warm", **warm})
+
+        # Trigram index: build once, then time queries (results aren't cached on this path)
+        index = get_search_index(root)
+        started = time.perf_counter()
+        index.refresh(force=True)
+        build_ms = (time.perf_counter() - started) * 1000
+        results.append({"tool": "search_index", "case": f"build ({args.files} files)", "mode": "once",
+                        "p50_ms": round(build_ms, 3), "p95_ms": round(build_ms, 3), "error": None})
+        for case, pattern in (("literal", "handler_42_7"), ("regex", r"handler_4\d_7\(")):
+            timing = time_calls(lambda: str(index.search(pattern, root)), n)
+            results.append({"tool": "search_index", "case": case, "mode": "query", **timing})
+
+        counter = iter(range(10**9))
+        timing = time_calls(lambda: write._run(f"out/file_{next(counter) % 10}.txt", "x" * 4096), n)
+        results.append({"tool": "write_file", "case": "4 KiB", "mode": "write", **timing})
+
+        def edit_once(hunks: int) -> str:
+            # Rewrites the bodies of `hunks` functions spread over the file (values stay
+            # the same so every iteration finds its anchors)
+            step = edit_functions // hunks
+            offset = next(counter) % step
+            code_edit = "\n".join(
+                f"# ... existing code ...\ndef function_{j}():\n    return {j}\n\ndef function_{j + 1}():"
+                for j in range(offset, edit_functions - 1, step)
+            )
+            return edit._run("edit_target.py", code_edit + "\n# ... existing code ...")
+
+        for hunks in (1, 20):
+            timing = time_calls(lambda: edit_once(hunks), n)
+            results.append({"tool": "edit_file", "case": f"{edit_functions * 3} lines, {hunks} hunk(s)", "mode": "edit", **timing})
+
+    print(f"{'tool':<22}{'case':<26}{'mode':<7}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        note = f"  {r['error'][:60]!r}" if r["error"] else ""
+        print(f"{r['tool']:<22}{r['case']:<26}{r['mode']:<7}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{note}")
+    if not shutil.which("rg"):
+        print("(rg not found on PATH: ripgrep search cases skipped)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
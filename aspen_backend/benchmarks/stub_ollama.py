@@ -0,0 +1,247 @@
+"""Deterministic stand-in for the Ollama HTTP API.
+
+Implements the parts of the API Aspen uses (/api/chat streaming and non-streaming,
+/api/generate for preloading, /api/tags, /api/version) with configurable
+latency, so the model pool and the backend can be exercised without a GPU or a real
+model. Responses follow a script: each entry is either text or a list of tool calls.
+Entry k answers the k-th model call of the current turn (k = assistant messages after
+the last user message), so concurrent conversations each walk the script on their own;
+the last entry repeats once the script is exhausted. Requests that don't offer tools
+get the first text entry.
+
+Run standalone from aspen_backend/:
+    python -m benchmarks.stub_ollama --port 11435 --tokens-per-second 50
+or start it in-process with `StubOllamaServer(...).start()`.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    # Generation speed once the first token is out
+    tokens_per_second: float = 50.0
+    # Prefill speed: the first token is delayed by prompt_tokens / prefill_tokens_per_second
+    prefill_tokens_per_second: float = 2000.0
+    # Fixed extra latency before the first token (network, scheduling)
+    first_token_latency: float = 0.0
+    # How many requests the "GPU" serves at once; the rest wait
+    max_parallel: int = 1
+    # Time to "load" a model the first time it is used
+    load_seconds: float = 0.0
+    # Response script, see module docstring. Example entries:
+    #   {"text": "Hello there"}
+    #   {"tool_calls": [{"name": "read_file", "arguments": {"file_path": "README.md"}}]}
+    script: list[dict[str, Any]] = field(default_factory=lambda: [{"text": "This is a deterministic stub response from the fake model."}])
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime())
+
+
+def _prompt_tokens(messages: list[dict]) -> int:
+    return sum(len(str(m.get("content", ""))) // 4 + 4 for m in messages)
+
+
+class StubOllama:
+    """State and request handling; separate from the HTTP server so tests can inspect it."""
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.requests: list[dict[str, Any]] = []
+        self.loaded_models: set[str] = set()
+        self.loads = 0
+        self.active = 0
+        self.max_active = 0
+        # Tokens produced over all requests, and requests whose client went away mid-stream
+        self.tokens_generated = 0
+        self.aborted = 0
+        self._gpu: Optional[asyncio.Semaphore] = None
+
+    def _response_for(self, body: dict[str, Any]) -> dict[str, Any]:
+        script = self.config.script
+        if not body.get("tools"):
+            return next((entry for entry in script if entry.get("text")), {"text": ""})
+        messages = body.get("messages", [])
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        step = sum(1 for m in messages[last_user + 1:] if m.get("role") == "assistant")
+        return script[min(step, len(script) - 1)]
+
+    async def _load(self, model: str) -> float:
+        if model in self.loaded_models:
+            return 0.0
+        self.loaded_models.add(model)
+        self.loads += 1
+        if self.config.load_seconds:
+            await asyncio.sleep(self.config.load_seconds)
+        return self.config.load_seconds
+
+    def _gpu_semaphore(self) -> asyncio.Semaphore:
+        if self._gpu is None:
+            self._gpu = asyncio.Semaphore(self.config.max_parallel)
+        return self._gpu
+
+    async def chat(self, body: dict[str, Any]):
+        """Yields the response objects of one /api/chat call."""
+        model = body.get("model", "stub")
+        messages = body.get("messages", [])
+        self.requests.append({"endpoint": "chat", "model": model, "messages": len(messages), "at": time.time()})
+        entry = self._response_for(body)
+        prompt_tokens = _prompt_tokens(messages)
+
+        async with self._gpu_semaphore():
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            finished = False
+            try:
+                started = time.perf_counter()
+                load_seconds = await self._load(model)
+                prefill = self.config.first_token_latency + prompt_tokens / self.config.prefill_tokens_per_second
+                await asyncio.sleep(prefill)
+                eval_count = 0
+                interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+                words = entry.get("text", "").split(" ") if entry.get("text") else []
+                for i, word in enumerate(words):
+                    token = word if i == 0 else " " + word
+                    eval_count += 1
+                    self.tokens_generated += 1
+                    yield {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": token}, "done": False}
+                    if interval:
+                        await asyncio.sleep(interval)
+                message: dict[str, Any] = {"role": "assistant", "content": ""}
+                if entry.get("tool_calls"):
+                    message["tool_calls"] = [
+                        {"function": {"name": call["name"], "arguments": call.get("arguments", {})}}
+                        for call in entry["tool_calls"]
+                    ]
+                    eval_count += 1
+                total = time.perf_counter() - started
+                yield {
+                    "model": model,
+                    "created_at": _now(),
+                    "message": message,
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int(total * 1e9),
+                    "load_duration": int(load_seconds * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": eval_count,
+                    "eval_duration": int(max(0.0, total - prefill - load_seconds) * 1e9),
+                }
+                finished = True
+            finally:
+                self.active -= 1
+                if not finished:
+                    self.aborted += 1
+
+    def build_app(self) -> FastAPI:
+        app = FastAPI(title="Stub Ollama")
+
+        @app.post("/api/chat")
+        async def api_chat(request: Request):
+            body = await request.json()
+            if body.get("stream", True):
+                async def ndjson():
+                    async for part in self.chat(body):
+                        yield json.dumps(part) + "\n"
+                return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+            content, final = "", None
+            tool_calls = None
+            async for part in self.chat(body):
+                content += part["message"].get("content", "")
+                tool_calls = part["message"].get("tool_calls", tool_calls)
+                final = part
+            final["message"] = {"role": "assistant", "content": content, **({"tool_calls": tool_calls} if tool_calls else {})}
+            return JSONResponse(final)
+
+        @app.post("/api/generate")
+        async def api_generate(request: Request):
+            # Only used for preloading (empty prompt): load the model and report done
+            body = await request.json()
+            model = body.get("model", "stub")
+            self.requests.append({"endpoint": "generate", "model": model, "at": time.time()})
+            load_seconds = await self._load(model)
+            part = {"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "load",
+                    "load_duration": int(load_seconds * 1e9)}
+            if body.get("stream", True):
+                return StreamingResponse(iter([json.dumps(part) + "\n"]), media_type="application/x-ndjson")
+            return JSONResponse(part)
+
+        @app.get("/api/tags")
+        async def api_tags():
+            return {"models": [{"name": m, "model": m} for m in sorted(self.loaded_models)]}
+
+        @app.get("/api/version")
+        async def api_version():
+            return {"version": "0.0.0-stub"}
+
+        return app
+
+
+class StubOllamaServer:
+    """Runs a StubOllama app with uvicorn in a background thread."""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 11435):
+        self.stub = StubOllama(config)
+        self.host = host
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(self.stub.build_app(), host=host, port=port, log_level="warning"))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "StubOllamaServer":
+        self._thread = threading.Thread(target=self._server.run, daemon=True, name="stub-ollama")
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--max-parallel", type=int, default=1)
+    parser.add_argument("--script", help="JSON file with the response script")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        tokens_per_second=args.tokens_per_second,
+        first_token_latency=args.first_token_latency,
+        max_parallel=args.max_parallel,
+    )
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            config.script = json.load(f)
+    uvicorn.run(StubOllama(config).build_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
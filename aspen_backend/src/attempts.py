@@ -0,0 +1,239 @@
+# Parallel speculative attempts at one task.
+#
+# Aspen's strategy is to try a task many times, in different ways, until one attempt
+# works. AttemptScheduler runs those attempts side by side instead of one after
+# another. Attempts can differ in system prompt, model role or model options such as
+# temperature. Each attempt works in its own copy-on-write clone of the workspace (see
+# workspaces.py), selected for its run with `use_workspace`, so the attempts don't see
+# each other's edits.
+#
+# When an attempt finishes, a pluggable check scores its clone. A CommandCheck runs a
+# command such as the test suite there. The clone's files are detached from the
+# workspace's first (WorkspaceClone.detach), so the command can't change the original.
+# The first attempt that passes wins: the other attempts are cancelled at once, which
+# also frees their model slots and kills their subprocesses. The winner's changes can
+# then be promoted into the real workspace. If no attempt passes, the best score is
+# reported and nothing is promoted. Without a check, the first attempt that finishes
+# without an error wins.
+#
+# The model calls of all attempts go through the shared model pool, so how many run at
+# the same time is bounded by the role's max_concurrency and the Ollama server.
+
+import asyncio
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Sequence
+
+from langchain_core.messages import HumanMessage
+
+from src.instrumentation import logger
+from src.tools import file_system_tools
+from src.tools.file_system_tools import use_workspace
+from src.workspaces import DEFAULT_CLONES_DIR, WorkspaceClone, WorkspaceConflict, clone_workspace
+
+# Seconds a check command may run before it's killed (and the attempt fails its check)
+CHECK_TIMEOUT = 300.0
+# Characters of check output kept for the report
+CHECK_OUTPUT_CHARS = 4000
+
+
+@dataclass
+class AttemptSpec:
+    name: str
+    # System prompt for this attempt's agent (None: the agent's default)
+    prompt: Optional[str] = None
+    role: str = "chat"
+    # Overrides of the role's model options, e.g. {"temperature": 0.2}
+    options: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CheckResult:
+    passed: bool
+    score: float
+    output: str = ""
+
+
+Check = Callable[[Path], Awaitable[CheckResult]]
+
+
+class CommandCheck:
+    """Scores a workspace by running a shell command in it: 1.0 if it exits with 0."""
+
+    def __init__(self, command: str, timeout: float = CHECK_TIMEOUT):
+        self.command = command
+        self.timeout = timeout
+
+    async def __call__(self, workspace: Path) -> CheckResult:
+        # In its own process group, so a timeout or cancel kills the test runner and its
+        # children, not just the shell that started them
+        process = await asyncio.create_subprocess_shell(
+            self.command,
+            cwd=workspace,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return CheckResult(False, 0.0, f"Check timed out after {self.timeout:.0f}s: {self.command}")
+        text = output.decode("utf-8", errors="replace")[-CHECK_OUTPUT_CHARS:]
+        passed = process.returncode == 0
+        return CheckResult(passed, 1.0 if passed else 0.0, text)
+
+
+@dataclass
+class Attempt:
+    spec: AttemptSpec
+    workspace: WorkspaceClone
+    status: str = "running"  # running | finished | failed | cancelled
+    answer: str = ""
+    error: Optional[str] = None
+    check: Optional[CheckResult] = None
+    started: float = field(default_factory=time.perf_counter)
+    seconds: float = 0.0
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "name": self.spec.name,
+            "status": self.status,
+            "seconds": round(self.seconds, 3),
+            "passed": self.check.passed if self.check else None,
+            "score": self.check.score if self.check else None,
+            "check_output": self.check.output if self.check and not self.check.passed else None,
+            "error": self.error,
+            "answer": self.answer,
+        }
+
+
+class AttemptScheduler:
+    """Runs attempts of a task concurrently in workspace clones and picks a winner.
+
+    `build_graph(spec)` returns the compiled agent graph an attempt runs (so prompt,
+    model role and options can differ per attempt).
+    """
+
+    def __init__(
+        self,
+        build_graph: Callable[[AttemptSpec], Any],
+        check: Optional[Check] = None,
+        clones_dir: Path = DEFAULT_CLONES_DIR,
+    ):
+        self.build_graph = build_graph
+        self.check = check
+        self.clones_dir = clones_dir
+
+    async def _run_attempt(self, attempt: Attempt, message: str, thread_id: str) -> Attempt:
+        graph = self.build_graph(attempt.spec)
+        config = {"configurable": {"thread_id": f"{thread_id}:{attempt.spec.name}"}}
+        try:
+            # Every tool call of this run (and the check) sees the attempt's own clone
+            with use_workspace(attempt.workspace.root):
+                state = await graph.ainvoke({"messages": [HumanMessage(content=message)]}, config=config)
+                last = state["messages"][-1]
+                attempt.answer = last.content if isinstance(last.content, str) else str(last.content)
+                if self.check is not None:
+                    # The check may rewrite files in place (formatters, --fix, snapshot
+                    # updates): don't let it write through the clone's hardlinks
+                    await asyncio.to_thread(attempt.workspace.detach)
+                    attempt.check = await self.check(attempt.workspace.root)
+                else:
+                    attempt.check = CheckResult(True, 1.0)
+            attempt.status = "finished"
+        except asyncio.CancelledError:
+            attempt.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("attempt %s failed", attempt.spec.name)
+            attempt.status = "failed"
+            attempt.error = str(e)
+        finally:
+            attempt.seconds = time.perf_counter() - attempt.started
+        return attempt
+
+    async def run(
+        self,
+        message: str,
+        specs: Sequence[AttemptSpec],
+        thread_id: str,
+        promote: bool = True,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Runs the attempts and yields progress events as they happen:
+        {"attempt": {...}} when one starts or ends, then a final {"result": {...}}
+        with the winner, its diff and whether it was promoted."""
+        base = file_system_tools.workspace_root()
+        clones = await asyncio.gather(
+            *(asyncio.to_thread(clone_workspace, base, self.clones_dir, spec.name) for spec in specs),
+            return_exceptions=True,
+        )
+        failed = [c for c in clones if isinstance(c, BaseException)]
+        if failed:
+            for clone in clones:
+                if isinstance(clone, WorkspaceClone):
+                    clone.remove()
+            raise failed[0]
+
+        attempts = [Attempt(spec, clone) for spec, clone in zip(specs, clones)]
+        tasks = {asyncio.create_task(self._run_attempt(a, message, thread_id)): a for a in attempts}
+        winner: Optional[Attempt] = None
+        try:
+            for attempt in attempts:
+                yield {"attempt": {"name": attempt.spec.name, "status": "started",
+                                   "clone_seconds": round(attempt.workspace.seconds, 3),
+                                   "clone_method": attempt.workspace.method}}
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Among attempts finishing in the same wakeup, the earliest started wins
+                for task in sorted(done, key=lambda t: tasks[t].started):
+                    attempt = tasks[task]
+                    yield {"attempt": attempt.report()}
+                    if winner is None and attempt.status == "finished" and attempt.check.passed:
+                        winner = attempt
+            # First pass wins: the remaining attempts are cancelled
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                yield {"attempt": tasks[task].report()}
+
+            result: dict[str, Any] = {"winner": None, "promoted": False, "changes": [], "diff": ""}
+            if winner is None:
+                scored = [a for a in attempts if a.check is not None]
+                if scored:
+                    best = max(scored, key=lambda a: a.check.score)
+                    result["best"] = {"name": best.spec.name, "score": best.check.score}
+            else:
+                changes = await asyncio.to_thread(winner.workspace.changes)
+                result["winner"] = winner.spec.name
+                result["answer"] = winner.answer
+                result["changes"] = [{"path": c.path, "kind": c.kind} for c in changes]
+                result["diff"] = await asyncio.to_thread(winner.workspace.diff, changes)
+                if promote and changes:
+                    try:
+                        await asyncio.to_thread(winner.workspace.promote, changes)
+                        result["promoted"] = True
+                    except WorkspaceConflict as e:
+                        result["error"] = str(e)
+            yield {"result": result}
+        finally:
+            # Also reached when the consumer goes away mid-run
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for attempt in attempts:
+                await asyncio.to_thread(attempt.workspace.remove)
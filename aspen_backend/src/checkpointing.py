@@ -0,0 +1,449 @@
+# SQLite-backed LangGraph checkpointer.
+#
+# Replaces the process-global MemorySaver: sessions survive restarts, memory no longer
+# grows with every conversation, and several uvicorn workers on one box can share the
+# same database (SQLite in WAL mode handles the cross-process locking).
+#
+# Storage layout follows the Postgres/in-memory savers: a checkpoint row holds
+# everything but the channel values, and each channel value is stored once per
+# *version* in `blobs`, so a channel that didn't change between steps isn't rewritten.
+# Large blobs are zlib-compressed. Old checkpoint versions are pruned per thread, and
+# whole threads are evicted when idle past a TTL or when the database exceeds a size
+# budget (least recently used first).
+#
+# Note: pruning keeps only the newest checkpoints of a thread, which is safe for the
+# graphs in this repo (create_react_agent stores full message lists, not DeltaChannels).
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+DEFAULT_CHECKPOINT_DB = Path(__file__).parent.parent / "data" / "checkpoints.sqlite"
+
+# Checkpoints kept per (thread, namespace); older ones (and their writes/blobs) are pruned
+MAX_CHECKPOINTS_PER_THREAD = 20
+# Threads idle for longer than this are deleted by maintenance
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+# Soft cap on the stored bytes; least recently used threads are evicted above it
+MAX_DB_BYTES = 512 * 1024 * 1024
+# How often (at most) a process runs TTL/size maintenance, piggybacked on put()
+MAINTENANCE_INTERVAL = 60.0
+# Blobs larger than this are zlib-compressed
+COMPRESS_MIN_BYTES = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+"""
+
+
+def _pack(type_: str, data: bytes) -> tuple[str, bytes]:
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return "z:" + type_, zlib.compress(data, 1)
+    return type_, data
+
+
+def _unpack(type_: str, data: bytes) -> tuple[str, bytes]:
+    if type_.startswith("z:"):
+        return type_[2:], zlib.decompress(data)
+    return type_, data
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """Durable, bounded checkpointer safe to share between worker processes."""
+
+    def __init__(
+        self,
+        path: "str | Path" = DEFAULT_CHECKPOINT_DB,
+        *,
+        max_checkpoints_per_thread: int = MAX_CHECKPOINTS_PER_THREAD,
+        session_ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_db_bytes: int = MAX_DB_BYTES,
+        serde=None,
+    ) -> None:
+        super().__init__(serde=serde)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.session_ttl_seconds = session_ttl_seconds
+        self.max_db_bytes = max_db_bytes
+        # sqlite3 connections can't be shared between threads; keep one per thread
+        self._local = threading.local()
+        self._last_maintenance = time.monotonic()
+        conn = self._conn()
+        # Must be set before the first table is created to take effect; lets maintenance
+        # hand pages freed by evictions back to the OS without a blocking VACUUM
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.executescript(_SCHEMA)
+
+    # --- connection handling ---
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    class _Transaction:
+        def __init__(self, conn: sqlite3.Connection):
+            self.conn = conn
+
+        def __enter__(self) -> sqlite3.Connection:
+            # IMMEDIATE takes the write lock up front so concurrent workers queue on
+            # busy_timeout instead of failing with "database is locked" mid-transaction
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+    def _transaction(self) -> "_Transaction":
+        return self._Transaction(self._conn())
+
+    # --- serialization helpers ---
+
+    def _dumps(self, value: Any) -> tuple[str, bytes]:
+        return _pack(*self.serde.dumps_typed(value))
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        return self.serde.loads_typed(_unpack(type_, data))
+
+    def _load_channel_values(self, conn, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        values: dict[str, Any] = {}
+        for channel, version in versions.items():
+            row = conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            values[channel] = self._loads(row[0], row[1])
+        return values
+
+    def _build_tuple(self, conn, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint: Checkpoint = self._loads(type_, checkpoint_blob)
+        # Same order as langgraph's writes_sort_key: task path, task id, write index
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(conn, thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self._loads(metadata_type, metadata_blob),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self._loads(t, v)) for task_id, channel, t, v in writes],
+        )
+
+    # --- BaseCheckpointSaver API ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        conn = self._conn()
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id := get_checkpoint_id(config):
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._build_tuple(conn, thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns=?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id<?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        conn = self._conn()
+        remaining = limit
+        for thread_id, checkpoint_ns, *row in conn.execute(query, params).fetchall():
+            if remaining is not None and remaining <= 0:
+                break
+            if filter:
+                metadata = self._loads(row[4], row[5])
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if remaining is not None:
+                remaining -= 1
+            yield self._build_tuple(conn, thread_id, checkpoint_ns, row)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values: dict[str, Any] = stored.pop("channel_values")
+        type_, checkpoint_blob = self._dumps(stored)
+        metadata_type, metadata_blob = self._dumps(get_checkpoint_metadata(config, metadata))
+        blob_rows = []
+        for channel, version in new_versions.items():
+            if channel in values:
+                blob_type, blob = self._dumps(values[channel])
+            else:
+                blob_type, blob = "empty", b""
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), blob_type, blob))
+
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    checkpoint_blob,
+                    metadata_type,
+                    metadata_blob,
+                ),
+            )
+            conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+            self._prune_thread(conn, thread_id, checkpoint_ns)
+
+        if time.monotonic() - self._last_maintenance > MAINTENANCE_INTERVAL:
+            self.maintenance()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel, *self._dumps(value), task_path))
+        # Special writes (errors, interrupts, ...) have negative indexes and are replaced;
+        # regular writes keep the first stored copy, as in the other savers
+        replace = all(WRITES_IDX_MAP.get(channel, 0) < 0 for channel, _ in writes)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._transaction() as conn:
+            conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._transaction() as conn:
+            self._delete_thread(conn, thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Same scheme as InMemorySaver: zero-padded counter plus a random tiebreaker,
+        # so versions sort correctly as strings
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- pruning / eviction ---
+
+    def _delete_thread(self, conn: sqlite3.Connection, thread_id: str) -> None:
+        for table in ("checkpoints", "blobs", "writes", "threads"):
+            conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+
+    def _prune_thread(self, conn: sqlite3.Connection, thread_id: str, checkpoint_ns: str) -> None:
+        """Drops all but the newest checkpoints of a thread, their writes, and the
+        channel blobs no surviving checkpoint references."""
+        keep = self.max_checkpoints_per_thread
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM checkpoints WHERE thread_id=? AND checkpoint_ns=?", (thread_id, checkpoint_ns)
+        ).fetchone()
+        if count <= keep:
+            return
+        oldest_kept = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, keep - 1),
+        ).fetchone()[0]
+        params = (thread_id, checkpoint_ns, oldest_kept)
+        conn.execute("DELETE FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id<?", params)
+        conn.execute("DELETE FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id<?", params)
+
+        referenced: set[tuple[str, str]] = set()
+        for type_, blob in conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id=? AND checkpoint_ns=?", (thread_id, checkpoint_ns)
+        ):
+            for channel, version in self._loads(type_, blob)["channel_versions"].items():
+                referenced.add((channel, str(version)))
+        stale = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id=? AND checkpoint_ns=?", (thread_id, checkpoint_ns)
+            ).fetchall()
+            if (channel, version) not in referenced
+        ]
+        conn.executemany("DELETE FROM blobs WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?", stale)
+
+    def stored_bytes(self) -> int:
+        """Approximate payload bytes stored across all threads."""
+        conn = self._conn()
+        total = 0
+        for query in (
+            "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints",
+            "SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM blobs",
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes",
+        ):
+            total += conn.execute(query).fetchone()[0]
+        return total
+
+    def maintenance(self) -> dict[str, int]:
+        """Evicts threads idle past the TTL, then least recently used threads until the
+        stored bytes fit the budget. Safe to run from several processes at once."""
+        self._last_maintenance = time.monotonic()
+        expired = evicted = 0
+        cutoff = time.time() - self.session_ttl_seconds
+        with self._transaction() as conn:
+            for (thread_id,) in conn.execute("SELECT thread_id FROM threads WHERE last_access<?", (cutoff,)).fetchall():
+                self._delete_thread(conn, thread_id)
+                expired += 1
+        while self.stored_bytes() > self.max_db_bytes:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT thread_id FROM threads ORDER BY last_access LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._delete_thread(conn, row[0])
+                evicted += 1
+        if expired or evicted:
+            # Return freed pages to the OS incrementally; a full VACUUM would block other workers
+            self._conn().execute("PRAGMA incremental_vacuum").fetchall()
+        return {"expired": expired, "evicted": evicted}
@@ -0,0 +1,261 @@
+# Content-addressed cache of model completions.
+#
+# Aspen retries a task many times with a local model, and every retry of an identical
+# prompt prefix pays the full generation again. This cache sits in front of the pooled
+# chat models (src/model_pool.py): a completion is stored under a hash of everything
+# that determines it, and an identical call later replays the stored chunks as a stream
+# without touching Ollama or waiting for a model slot.
+#
+# The key covers the model, its options (temperature, num_ctx, ...), the call's bound
+# parameters (tools, stop, format), caller-supplied extras such as the thinking-mode flag,
+# and the full message list. Message and tool call ids are left out: Ollama never sees
+# them and they are random per run, so including them would defeat re-runs of a thread.
+# Replayed tool calls get fresh ids for the same reason.
+#
+# Modes (ASPEN_COMPLETION_CACHE):
+#   off           - disabled (default);
+#   deterministic - only calls made at temperature 0, whose output a rerun would repeat;
+#   all           - every call, i.e. record/replay (benchmarks, re-running a thread after
+#                   a crash without paying for the steps it already did).
+#
+# Entries live in SQLite (WAL, one connection per thread, as in checkpointing.py) with
+# the chunk list zlib-compressed. When the stored bytes exceed the budget, the least
+# recently used entries are evicted.
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk
+
+COMPLETION_CACHE_MODES = ("off", "deterministic", "all")
+COMPLETION_CACHE_MODE = os.environ.get("ASPEN_COMPLETION_CACHE", "off").lower()
+DEFAULT_COMPLETION_CACHE_DB = Path(__file__).parent.parent / "data" / "completions.sqlite"
+COMPLETION_CACHE_MAX_BYTES = int(float(os.environ.get("ASPEN_COMPLETION_CACHE_MAX_MB", "256")) * 1024 * 1024)
+# Eviction frees space down to this fraction of the budget, so it doesn't run on every put
+EVICT_TO_FRACTION = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access);
+-- Running total of the stored bytes (one row), kept by triggers so put() doesn't have
+-- to sum the table; shared by every process using the database
+CREATE TABLE IF NOT EXISTS completion_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bytes INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS completions_size_insert AFTER INSERT ON completions BEGIN
+    UPDATE completion_stats SET bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS completions_size_update AFTER UPDATE OF size ON completions BEGIN
+    UPDATE completion_stats SET bytes = bytes + NEW.size - OLD.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS completions_size_delete AFTER DELETE ON completions BEGIN
+    UPDATE completion_stats SET bytes = bytes - OLD.size WHERE id = 1;
+END;
+-- Seeded once, from a database created before the total was kept
+INSERT OR IGNORE INTO completion_stats (id, bytes) SELECT 1, COALESCE(SUM(size), 0) FROM completions;
+"""
+
+
+def _message_key(message: BaseMessage) -> dict[str, Any]:
+    """The parts of a message that reach the model."""
+    entry: dict[str, Any] = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        entry["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+    name = getattr(message, "name", None)
+    if name:
+        entry["name"] = name
+    return entry
+
+
+def completion_key(model: str, params: dict[str, Any], messages: Sequence[BaseMessage]) -> str:
+    payload = {"model": model, "params": params, "messages": [_message_key(m) for m in messages]}
+    # default=str keeps odd parameter values hashable (worst case they never match)
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def chunk_record(chunk: ChatGeneration) -> dict[str, Any]:
+    """JSON-able form of a streamed chunk (or of a whole non-streamed generation)."""
+    message = chunk.message
+    record: dict[str, Any] = {"content": message.content}
+    if message.additional_kwargs:
+        record["additional_kwargs"] = message.additional_kwargs
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        record["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in tool_calls]
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record["usage_metadata"] = dict(usage)
+    if chunk.generation_info:
+        record["generation_info"] = chunk.generation_info
+    return record
+
+
+def replay_chunks(records: list[dict[str, Any]]) -> list[ChatGenerationChunk]:
+    """Chunks equivalent to the recorded ones. The last one is tagged with
+    completion_cache=hit in its generation info (it ends up in response_metadata)."""
+    chunks = []
+    for i, record in enumerate(records):
+        generation_info = dict(record.get("generation_info") or {})
+        if i == len(records) - 1:
+            generation_info["completion_cache"] = "hit"
+        tool_calls = [
+            {"name": call["name"], "args": call["args"], "id": str(uuid.uuid4()), "type": "tool_call"}
+            for call in record.get("tool_calls", ())
+        ]
+        message = AIMessageChunk(
+            content=record["content"],
+            additional_kwargs=record.get("additional_kwargs", {}),
+            tool_calls=tool_calls,
+            usage_metadata=record.get("usage_metadata"),
+        )
+        chunks.append(ChatGenerationChunk(message=message, generation_info=generation_info or None))
+    return chunks
+
+
+class CompletionCache:
+    """Disk-backed completion store with a byte budget and LRU eviction."""
+
+    def __init__(
+        self,
+        path: "str | Path" = DEFAULT_COMPLETION_CACHE_DB,
+        *,
+        mode: str = COMPLETION_CACHE_MODE,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+        key_extras: Optional[Callable[[], dict[str, Any]]] = None,
+    ) -> None:
+        if mode not in COMPLETION_CACHE_MODES:
+            raise ValueError(f"Unknown completion cache mode '{mode}'. Expected one of: {', '.join(COMPLETION_CACHE_MODES)}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        # Settings outside the call that change what the model produces (e.g. thinking mode)
+        self.key_extras = key_extras
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field_name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, field_name, getattr(self, field_name) + amount)
+
+    # --- keys ---
+
+    def key_for(self, model: str, params: dict[str, Any], messages: Sequence[BaseMessage], temperature: Optional[float]) -> Optional[str]:
+        """Cache key of a call, or None if the mode excludes it."""
+        if self.mode == "off" or (self.mode == "deterministic" and temperature != 0):
+            self._count("skipped")
+            return None
+        if self.key_extras is not None:
+            params = {**params, "extras": self.key_extras()}
+        return completion_key(model, params, messages)
+
+    # --- storage ---
+
+    def get(self, key: str) -> Optional[list[dict[str, Any]]]:
+        conn = self._conn()
+        row = conn.execute("SELECT payload FROM completions WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        conn.execute("UPDATE completions SET last_access=? WHERE key=?", (time.time(), key))
+        self._count("hits")
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, model: str, records: list[dict[str, Any]]) -> None:
+        payload = zlib.compress(json.dumps(records, ensure_ascii=False, default=str).encode("utf-8"), 1)
+        now = time.time()
+        conn = self._conn()
+        # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete doesn't fire
+        # the delete trigger, which would leave the old size in the running total
+        conn.execute(
+            "INSERT INTO completions (key, model, created, last_access, size, payload) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET model=excluded.model, created=excluded.created, "
+            "last_access=excluded.last_access, size=excluded.size, payload=excluded.payload",
+            (key, model, now, now, len(payload), payload),
+        )
+        self._count("stores")
+        total = self._stored_bytes(conn)
+        if total > self.max_bytes:
+            self._evict(conn, total)
+
+    def _stored_bytes(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT bytes FROM completion_stats WHERE id = 1").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, total: int) -> None:
+        target = self.max_bytes * EVICT_TO_FRACTION
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_access"):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM completions WHERE key=?", doomed)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("evictions", len(doomed))
+
+    async def aget(self, key: str) -> Optional[list[dict[str, Any]]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, model: str, records: list[dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.put, key, model, records)
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM completions")
+
+    def stats(self) -> dict[str, Any]:
+        conn = self._conn()
+        entries = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        stored = self._stored_bytes(conn)
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": entries,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "skipped": self.skipped,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,318 @@
+# Token-budgeted context compaction for long-running agent threads.
+#
+# create_react_agent re-sends the whole message history to the model on every step, so
+# prefill time grows with the thread until the context overflows. ContextManager runs as
+# the graph's pre_model_hook: it keeps a running token estimate per thread and, once the
+# history crosses CONTEXT_TOKEN_BUDGET, rewrites it in two stages:
+#   1. stale tool outputs (outside the recent window) are replaced by a one-line stub
+#   2. if that's not enough, the older turns are summarized by a small model
+# The leading system/task messages are never touched, so the prompt prefix stays stable
+# (and Ollama can keep reusing its KV cache for it).
+#
+# Each step records the estimated prompt size before/after compaction, and the actual
+# prefill tokens/latency Ollama reported for that step (prompt_eval_count/_duration).
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src.instrumentation import logger
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("ASPEN_CONTEXT_TOKEN_BUDGET", "12000"))
+# After compacting, aim for this fraction of the budget so we don't compact every step
+COMPACT_TARGET_RATIO = 0.6
+# The newest messages worth this many tokens are always kept verbatim
+KEEP_RECENT_TOKENS = 3000
+# Tool outputs longer than this outside the recent window are elided
+STALE_TOOL_OUTPUT_CHARS = 300
+# Steps remembered per thread for reporting, and threads tracked at once
+STEP_HISTORY = 200
+MAX_TRACKED_THREADS = 256
+
+SUMMARY_PREFIX = "[Summary of earlier work in this session]"
+SUMMARY_PROMPT = (
+    "You are compressing the history of a coding agent's session so it fits in its context window.\n"
+    "Summarize the conversation below. Keep: the decisions made, files read or changed (with paths), "
+    "facts discovered, sub-tasks that are finished, and anything still unresolved. "
+    "Drop raw file contents and tool output. Be concise.\n\n{history}"
+)
+
+
+def estimate_tokens(message: AnyMessage) -> int:
+    """Cheap token estimate (~4 chars/token plus per-message overhead). Only used to
+    decide when to compact; the real prefill counts come back from Ollama."""
+    content = message.content
+    if not isinstance(content, str):
+        content = str(content)
+    chars = len(content)
+    for tool_call in getattr(message, "tool_calls", None) or ():
+        chars += len(tool_call.get("name", "")) + len(str(tool_call.get("args", "")))
+    return chars // 4 + 4
+
+
+@dataclass
+class StepRecord:
+    step: int
+    estimated_tokens_before: int
+    estimated_tokens_after: int
+    compacted: bool = False
+    compaction_seconds: float = 0.0
+    elided_tool_outputs: int = 0
+    summarized_messages: int = 0
+    # Filled in from the model's response metadata once the step has run
+    prefill_tokens: Optional[int] = None
+    prefill_seconds: Optional[float] = None
+
+
+@dataclass
+class ThreadContext:
+    token_counts: dict[str, int] = field(default_factory=dict)
+    steps: deque = field(default_factory=lambda: deque(maxlen=STEP_HISTORY))
+    step_counter: int = 0
+    compactions: int = 0
+
+    def count(self, messages: list[AnyMessage]) -> int:
+        counts = self.token_counts
+        total = 0
+        for message in messages:
+            if message.id is None:
+                total += estimate_tokens(message)
+                continue
+            tokens = counts.get(message.id)
+            if tokens is None:
+                tokens = counts[message.id] = estimate_tokens(message)
+            total += tokens
+        return total
+
+    def forget_missing(self, messages: list[AnyMessage]) -> None:
+        live = {m.id for m in messages}
+        for message_id in [k for k in self.token_counts if k not in live]:
+            del self.token_counts[message_id]
+
+
+class ContextManager:
+    def __init__(
+        self,
+        summarizer: Optional[BaseChatModel] = None,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        keep_recent_tokens: int = KEEP_RECENT_TOKENS,
+    ):
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.keep_recent_tokens = keep_recent_tokens
+        self._threads: "OrderedDict[str, ThreadContext]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _thread(self, thread_id: str) -> ThreadContext:
+        with self._lock:
+            ctx = self._threads.get(thread_id)
+            if ctx is None:
+                ctx = self._threads[thread_id] = ThreadContext()
+            self._threads.move_to_end(thread_id)
+            while len(self._threads) > MAX_TRACKED_THREADS:
+                self._threads.popitem(last=False)
+            return ctx
+
+    def as_hook(self) -> RunnableLambda:
+        """The pre_model_hook to pass to create_react_agent."""
+        return RunnableLambda(self._hook_sync, afunc=self._hook_async, name="context_manager")
+
+    # --- hook ---
+
+    def _record_last_prefill(self, ctx: ThreadContext, messages: list[AnyMessage]) -> None:
+        """Attaches Ollama's prefill numbers for the previous model call to its step."""
+        if not ctx.steps or ctx.steps[-1].prefill_tokens is not None:
+            return
+        for message in reversed(messages):
+            if isinstance(message, AIMessage):
+                metadata = message.response_metadata or {}
+                if "prompt_eval_count" in metadata:
+                    ctx.steps[-1].prefill_tokens = metadata["prompt_eval_count"]
+                    duration_ns = metadata.get("prompt_eval_duration")
+                    if duration_ns is not None:
+                        ctx.steps[-1].prefill_seconds = duration_ns / 1e9
+                return
+
+    def _split(self, messages: list[AnyMessage]) -> tuple[int, int]:
+        """Returns (prefix_end, recent_start): messages[:prefix_end] are the stable prefix,
+        messages[recent_start:] the recent window; everything between may be compacted."""
+        prefix_end = 0
+        while prefix_end < len(messages) and isinstance(messages[prefix_end], SystemMessage):
+            prefix_end += 1
+        # The first user message is the task itself
+        if prefix_end < len(messages) and isinstance(messages[prefix_end], HumanMessage):
+            prefix_end += 1
+
+        recent_start = len(messages)
+        recent_tokens = 0
+        while recent_start > prefix_end:
+            tokens = estimate_tokens(messages[recent_start - 1])
+            if recent_tokens + tokens > self.keep_recent_tokens and recent_start < len(messages):
+                break
+            recent_tokens += tokens
+            recent_start -= 1
+        # Never start the window on a tool result whose tool call would be cut off
+        while recent_start > prefix_end and isinstance(messages[recent_start], ToolMessage):
+            recent_start -= 1
+        return prefix_end, recent_start
+
+    def _elide_tool_outputs(self, messages: list[AnyMessage], start: int, end: int, ctx: ThreadContext) -> int:
+        elided = 0
+        for i in range(start, end):
+            message = messages[i]
+            if isinstance(message, ToolMessage) and len(str(message.content)) > STALE_TOOL_OUTPUT_CHARS:
+                messages[i] = ToolMessage(
+                    content=f"[elided {len(str(message.content))} chars of earlier {message.name or 'tool'} output]",
+                    tool_call_id=message.tool_call_id,
+                    name=message.name,
+                    id=message.id,
+                )
+                ctx.token_counts.pop(message.id, None)
+                elided += 1
+        return elided
+
+    def _summary_request(self, middle: list[AnyMessage]) -> str:
+        lines = []
+        for message in middle:
+            role = message.type
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            for tool_call in getattr(message, "tool_calls", None) or ():
+                content += f"\n(called {tool_call.get('name')} with {tool_call.get('args')})"
+            lines.append(f"{role}: {content}")
+        return SUMMARY_PROMPT.format(history="\n\n".join(lines))
+
+    def _fallback_summary(self, middle: list[AnyMessage]) -> str:
+        return f"{len(middle)} earlier messages were removed to save context."
+
+    def _plan(self, state: dict, config: Optional[RunnableConfig]):
+        messages: list[AnyMessage] = list(state["messages"])
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id", "default")
+        ctx = self._thread(thread_id)
+        self._record_last_prefill(ctx, messages)
+        ctx.step_counter += 1
+        total = ctx.count(messages)
+        record = StepRecord(step=ctx.step_counter, estimated_tokens_before=total, estimated_tokens_after=total)
+        ctx.steps.append(record)
+        return messages, ctx, record
+
+    def _finish(self, ctx, record, messages, started) -> dict:
+        ctx.forget_missing(messages)
+        record.estimated_tokens_after = ctx.count(messages)
+        record.compacted = True
+        record.compaction_seconds = time.perf_counter() - started
+        ctx.compactions += 1
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]}
+
+    def _compact_tool_outputs(self, messages, ctx, record) -> tuple[int, int, bool]:
+        prefix_end, recent_start = self._split(messages)
+        record.elided_tool_outputs = self._elide_tool_outputs(messages, prefix_end, recent_start, ctx)
+        target = int(self.token_budget * COMPACT_TARGET_RATIO)
+        done = ctx.count(messages) <= target
+        return prefix_end, recent_start, done
+
+    def _replace_middle(self, messages, prefix_end, recent_start, summary: str, record) -> list[AnyMessage]:
+        record.summarized_messages = recent_start - prefix_end
+        summary_message = HumanMessage(content=f"{SUMMARY_PREFIX}\n{summary}", id=str(uuid.uuid4()))
+        return messages[:prefix_end] + [summary_message] + messages[recent_start:]
+
+    def _compaction(self, state: dict, config: Optional[RunnableConfig]):
+        """One run of the hook, shared by the sync and async versions. A generator that
+        yields the summary request if the older turns must be summarized, and is sent the
+        summarizer's response (or has its error thrown in). Returns the state update."""
+        messages, ctx, record = self._plan(state, config)
+        if record.estimated_tokens_before <= self.token_budget:
+            return {"messages": []}
+        started = time.perf_counter()
+        prefix_end, recent_start, done = self._compact_tool_outputs(messages, ctx, record)
+        if not done and recent_start > prefix_end:
+            middle = messages[prefix_end:recent_start]
+            if self.summarizer is not None:
+                try:
+                    response = yield self._summary_request(middle)
+                    summary = str(response.content)
+                except Exception:
+                    # A missing summary model or an Ollama error mustn't fail the agent step
+                    logger.exception("summarizing %d messages failed; dropping them without a summary", len(middle))
+                    summary = self._fallback_summary(middle)
+            else:
+                summary = self._fallback_summary(middle)
+            messages = self._replace_middle(messages, prefix_end, recent_start, summary, record)
+        return self._finish(ctx, record, messages, started)
+
+    def _hook_sync(self, state: dict, config: Optional[RunnableConfig] = None) -> dict:
+        steps = self._compaction(state, config)
+        try:
+            request = next(steps)
+            try:
+                response = self.summarizer.invoke(request)
+            except Exception as e:
+                steps.throw(e)
+            else:
+                steps.send(response)
+        except StopIteration as finished:
+            return finished.value
+
+    async def _hook_async(self, state: dict, config: Optional[RunnableConfig] = None) -> dict:
+        steps = self._compaction(state, config)
+        try:
+            request = next(steps)
+            try:
+                response = await self.summarizer.ainvoke(request)
+            except Exception as e:
+                steps.throw(e)
+            else:
+                steps.send(response)
+        except StopIteration as finished:
+            return finished.value
+
+    # --- reporting ---
+
+    def report(self, thread_id: str) -> Optional[dict[str, Any]]:
+        """Per-step prompt sizes and prefill numbers for a thread, plus averages for the
+        steps before vs after its first compaction."""
+        with self._lock:
+            ctx = self._threads.get(thread_id)
+        if ctx is None:
+            return None
+        steps = list(ctx.steps)
+        first_compaction = next((s.step for s in steps if s.compacted), None)
+
+        def summarize(selected: list[StepRecord]) -> dict[str, Any]:
+            measured = [s for s in selected if s.prefill_tokens is not None]
+            timed = [s for s in measured if s.prefill_seconds is not None]
+            return {
+                "steps": len(selected),
+                "avg_prompt_tokens_estimate": (
+                    sum(s.estimated_tokens_after for s in selected) / len(selected) if selected else None
+                ),
+                "avg_prefill_tokens": sum(s.prefill_tokens for s in measured) / len(measured) if measured else None,
+                "avg_prefill_seconds": sum(s.prefill_seconds for s in timed) / len(timed) if timed else None,
+            }
+
+        before = [s for s in steps if first_compaction is None or s.step < first_compaction]
+        after = [s for s in steps if first_compaction is not None and s.step >= first_compaction]
+        return {
+            "thread_id": thread_id,
+            "token_budget": self.token_budget,
+            "current_tokens_estimate": steps[-1].estimated_tokens_after if steps else 0,
+            "compactions": ctx.compactions,
+            "before_compaction": summarize(before),
+            "after_compaction": summarize(after),
+            "steps": [asdict(s) for s in steps],
+        }
@@ -0,0 +1,365 @@
+# Request instrumentation: latency metrics for the streaming endpoints, exposed in the
+# Prometheus text format on /metrics, plus a per-request trace that can be sent back to
+# the client as the last NDJSON record.
+#
+# What is measured per request: time to first token, generated tokens and tokens/sec,
+# the duration of every LangGraph node and tool call, time spent waiting for a model
+# slot (see model_pool.py) and the bytes streamed to the client. Node and tool timings
+# come from a LangChain callback handler attached to the graph run; queue waits are
+# reported by the model pool through the `current_trace` ContextVar, which LangGraph
+# copies into every task it spawns.
+#
+# The metric types are deliberately minimal (counters and fixed-bucket histograms kept
+# in dicts) so the server doesn't need prometheus_client.
+#
+# Debug output goes through the "aspen" logger (level from ASPEN_LOG_LEVEL, default
+# WARNING). Guard anything that builds expensive strings with `debug_enabled()`.
+
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger("aspen")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.environ.get("ASPEN_LOG_LEVEL", "WARNING").upper())
+
+# Histogram buckets (seconds) for latencies from sub-millisecond tool calls to long runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def debug_enabled() -> bool:
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+# --- metric types ---
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labels, values)} {_number(total)}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples are read from a callback when /metrics is scraped."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], collect: Callable[[], dict]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            samples = self.collect()
+        except Exception as e:
+            logger.warning("collecting gauge %s failed: %s", self.name, e)
+            samples = {}
+        for values, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_labels_text(self.labels, values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # label values -> [bucket counts..., sum, count]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labels, values, le)} {_number(cumulative)}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labels, values)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels_text(self.labels, values)} {_number(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str], collect: Callable[[], dict]) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, collect))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter("aspen_requests_total", "Streaming requests by endpoint and outcome.", ("endpoint", "status"))
+ACTIVE_REQUESTS: dict[str, int] = {}
+REGISTRY.gauge(
+    "aspen_active_requests", "Streaming requests currently in progress.", ("endpoint",),
+    lambda: {(endpoint,): count for endpoint, count in ACTIVE_REQUESTS.items()},
+)
+REQUEST_DURATION = REGISTRY.histogram("aspen_request_duration_seconds", "Wall time of a streaming request.", ("endpoint",))
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram("aspen_time_to_first_token_seconds", "Time from request start to the first streamed token.", ("endpoint",))
+GENERATED_TOKENS = REGISTRY.counter("aspen_generated_tokens_total", "Tokens generated by the model.", ("endpoint",))
+TOKENS_PER_SECOND = REGISTRY.histogram("aspen_tokens_per_second", "Generation speed per model call.", ("endpoint",), TOKEN_RATE_BUCKETS)
+STREAM_BYTES = REGISTRY.counter("aspen_stream_bytes_total", "Bytes streamed to clients.", ("endpoint",))
+STREAM_BYTES_PER_REQUEST = REGISTRY.histogram("aspen_stream_bytes", "Bytes streamed per request.", ("endpoint",), BYTES_BUCKETS)
+NODE_DURATION = REGISTRY.histogram("aspen_graph_node_duration_seconds", "Duration of LangGraph node runs.", ("node",))
+TOOL_DURATION = REGISTRY.histogram("aspen_tool_duration_seconds", "Duration of tool calls.", ("tool", "status"))
+QUEUE_WAIT = REGISTRY.histogram("aspen_model_queue_wait_seconds", "Time spent waiting for a model slot.", ("role",))
+COMPLETION_CACHE_LOOKUPS = REGISTRY.counter("aspen_completion_cache_lookups_total", "Completion cache lookups by role and result.", ("role", "result"))
+
+
+# --- per-request traces ---
+
+
+@dataclass
+class RequestTrace:
+    endpoint: str
+    thread_id: Optional[str] = None
+    started: float = field(default_factory=time.perf_counter)
+    first_token_at: Optional[float] = None
+    chunks: int = 0
+    bytes: int = 0
+    # Tokens as counted by the model (eval_count); streamed chunks are the fallback
+    tokens: int = 0
+    generation_seconds: float = 0.0
+    model_calls: int = 0
+    # Model calls replayed from the completion cache (no tokens generated)
+    cached_model_calls: int = 0
+    queue_wait: float = 0.0
+    nodes: dict[str, dict[str, float]] = field(default_factory=dict)
+    tools: list[dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    # The client went away before the stream finished (the run was cancelled)
+    disconnected: bool = False
+
+    def record_chunk(self, text: str, payload_bytes: int) -> None:
+        if self.first_token_at is None and text:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+        self.bytes += payload_bytes
+
+    def record_node(self, node: str, seconds: float) -> None:
+        stats = self.nodes.setdefault(node, {"calls": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+
+    def summary(self) -> dict[str, Any]:
+        now = time.perf_counter()
+        tokens = self.tokens or self.chunks
+        return {
+            "thread_id": self.thread_id,
+            "duration_s": round(now - self.started, 4),
+            "time_to_first_token_s": round(self.first_token_at - self.started, 4) if self.first_token_at else None,
+            "tokens": tokens,
+            "tokens_per_s": round(tokens / self.generation_seconds, 2) if self.generation_seconds else None,
+            "model_calls": self.model_calls,
+            "cached_model_calls": self.cached_model_calls,
+            "queue_wait_s": round(self.queue_wait, 4),
+            "stream_bytes": self.bytes,
+            "nodes": {name: {"calls": int(s["calls"]), "seconds": round(s["seconds"], 4)} for name, s in self.nodes.items()},
+            "tools": self.tools,
+            "error": self.error,
+            "disconnected": self.disconnected,
+        }
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("aspen_request_trace", default=None)
+
+
+def record_queue_wait(role: str, seconds: float) -> None:
+    """Called by the model pool once a slot is acquired."""
+    QUEUE_WAIT.observe(seconds, role)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.queue_wait += seconds
+
+
+def start_trace(endpoint: str, thread_id: Optional[str] = None) -> tuple[RequestTrace, contextvars.Token]:
+    trace = RequestTrace(endpoint=endpoint, thread_id=thread_id)
+    ACTIVE_REQUESTS[endpoint] = ACTIVE_REQUESTS.get(endpoint, 0) + 1
+    return trace, current_trace.set(trace)
+
+
+def finish_trace(trace: RequestTrace, token: contextvars.Token) -> None:
+    """Folds a finished request into the process-wide metrics."""
+    try:
+        current_trace.reset(token)
+    except ValueError:
+        # The stream generator was closed from another context (client disconnect)
+        pass
+    endpoint = trace.endpoint
+    ACTIVE_REQUESTS[endpoint] = ACTIVE_REQUESTS.get(endpoint, 1) - 1
+    REQUESTS.inc(endpoint, "disconnected" if trace.disconnected else "error" if trace.error else "ok")
+    REQUEST_DURATION.observe(time.perf_counter() - trace.started, endpoint)
+    if trace.first_token_at is not None:
+        TIME_TO_FIRST_TOKEN.observe(trace.first_token_at - trace.started, endpoint)
+    GENERATED_TOKENS.inc(endpoint, amount=trace.tokens or trace.chunks)
+    STREAM_BYTES.inc(endpoint, amount=trace.bytes)
+    STREAM_BYTES_PER_REQUEST.observe(trace.bytes, endpoint)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("request finished: %s", trace.summary())
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Times LangGraph nodes, tool calls and model calls of one request.
+
+    run_inline keeps the callbacks on the event loop instead of a thread pool hop per
+    event; every method only does dict bookkeeping.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._nodes: dict[UUID, tuple[str, float]] = {}
+        self._tools: dict[UUID, tuple[str, float]] = {}
+        self._models: dict[UUID, float] = {}
+
+    # Graph nodes: LangGraph runs each node as a chain named after the node
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self._nodes[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_node(run_id)
+
+    def _end_node(self, run_id: UUID) -> None:
+        started = self._nodes.pop(run_id, None)
+        if started is not None:
+            node, t0 = started
+            seconds = time.perf_counter() - t0
+            NODE_DURATION.observe(seconds, node)
+            self.trace.record_node(node, seconds)
+
+    # Tools
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        self._tools[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, "error")
+
+    def _end_tool(self, run_id: UUID, status: str) -> None:
+        started = self._tools.pop(run_id, None)
+        if started is not None:
+            name, t0 = started
+            seconds = time.perf_counter() - t0
+            TOOL_DURATION.observe(seconds, name, status)
+            self.trace.tools.append({"tool": name, "seconds": round(seconds, 4), "status": status})
+
+    # Model calls: token counts and generation speed from Ollama's response metadata
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._models[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        t0 = self._models.pop(run_id, None)
+        if t0 is None:
+            return
+        self.trace.model_calls += 1
+        info: dict[str, Any] = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                info = getattr(message, "response_metadata", None) or generation.generation_info or {}
+        if info.get("completion_cache") == "hit":
+            # Replayed: the recorded eval counts describe the original generation
+            self.trace.cached_model_calls += 1
+            return
+        eval_count = info.get("eval_count")
+        eval_seconds = (info.get("eval_duration") or 0) / 1e9
+        if eval_count:
+            self.trace.tokens += eval_count
+            if eval_seconds:
+                self.trace.generation_seconds += eval_seconds
+                TOKENS_PER_SECOND.observe(eval_count / eval_seconds, self.trace.endpoint)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._models.pop(run_id, None)
@@ -0,0 +1,610 @@
+# Journal of the file mutations made by the agent's tools.
+#
+# Every write_file / edit_file (and every promoted attempt, see workspaces.py) goes
+# through MutationJournal.write(). The old and new contents of the file are stored as
+# content-addressed blobs (sha256, zlib) in an append-only pack file. A log entry records
+# the path, both blob hashes, the thread and the LangGraph checkpoint the tool call ran
+# from. The file itself is replaced atomically (temp file + rename), so a crash leaves
+# either the old or the new content, never a torn file.
+#
+# Durability is group-committed. A write appends to the pack and the log and renames
+# the file, without an fsync. A committer thread then fsyncs everything written since
+# the last commit in one go: the pack, the written files and their directories, then
+# the log. Bursts of edits share one commit instead of paying an fsync each.
+#   "batch" (default)  writes return at once; commits run every JOURNAL_SYNC_INTERVAL.
+#                      A crash can lose the log entries of the last interval, but
+#                      never corrupts a file.
+#   "wait"             a write returns once a commit covering it is durable. Concurrent
+#                      writers share the commits.
+#
+# Rollback to a log position (or to a thread's checkpoint) restores, for every path
+# touched after it, the content from before its first later entry. Its cost depends on
+# the number of writes since the target, not on the history or the workspace size. The
+# rollback is journaled itself, so it can be rolled back too. A file changed outside the
+# tools since its last journaled write is a conflict; nothing is restored unless forced.
+#
+# Compaction drops the oldest entries, and the blobs only they referenced, once the
+# journal exceeds JOURNAL_MAX_BYTES or JOURNAL_MAX_ENTRIES. Positions before the oldest
+# kept entry can no longer be rolled back to.
+#
+# Sequence numbers, blob offsets and compaction state live in the process, so a journal
+# directory is held by one process at a time (an exclusive flock). With several uvicorn
+# workers, open_journal() gives each further worker the first free worker-N directory
+# under the configured one: every worker has its own log and rolls back its own writes
+# (a file another worker changed since shows up as a conflict).
+
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from src.instrumentation import logger
+from src.tools.write_events import notify_file_written
+
+JOURNAL_ENABLED = os.environ.get("ASPEN_JOURNAL", "1") != "0"
+DEFAULT_JOURNAL_DIR = Path(__file__).parent.parent / "data" / "journal"
+JOURNAL_SYNC = os.environ.get("ASPEN_JOURNAL_SYNC", "batch")
+JOURNAL_SYNC_INTERVAL = float(os.environ.get("ASPEN_JOURNAL_SYNC_MS", "20")) / 1000
+JOURNAL_MAX_BYTES = int(float(os.environ.get("ASPEN_JOURNAL_MAX_MB", "512")) * 1024 * 1024)
+JOURNAL_MAX_ENTRIES = 100_000
+# worker-N directories tried when the configured one is held by another process
+MAX_JOURNAL_SLOTS = 64
+# Fraction of the newest entries a compaction keeps
+COMPACT_KEEP = 0.5
+
+# Pack record: sha256 digest, length of the compressed data, then the data
+_RECORD = struct.Struct(">32sI")
+_PACK_NAME = "blobs.pack"
+_LOG_NAME = "journal.log"
+_LOCK_NAME = "lock"
+
+
+class JournalError(Exception):
+    """A journal operation that can't be carried out (e.g. a rollback past the horizon)."""
+
+
+class JournalConflict(JournalError):
+    """Files to be restored were changed outside the journal since their last entry."""
+
+
+class JournalLocked(JournalError):
+    """The journal directory is held by another process."""
+
+
+@dataclass
+class JournalEntry:
+    seq: int
+    time: float
+    # Path relative to the workspace root, with "/" separators
+    path: str
+    op: str  # "write" | "delete" | "rollback"
+    # Blob hashes of the content before and after; None: the file didn't exist
+    before: Optional[str]
+    after: Optional[str]
+    thread_id: Optional[str] = None
+    checkpoint_id: Optional[str] = None
+    # For op "rollback": the position rolled back to
+    target: Optional[int] = None
+
+    def to_json(self) -> str:
+        # Optional tags are left out when unset; before/after are always written
+        fields = {k: v for k, v in vars(self).items() if v is not None or k in ("before", "after")}
+        return json.dumps(fields, separators=(",", ":"))
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fsync_path(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # deleted (or replaced again) since; a later commit covers it
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class MutationJournal:
+    """Content-addressed, group-committed journal of the writes under `workspace`."""
+
+    def __init__(
+        self,
+        workspace: Path,
+        directory: Path = DEFAULT_JOURNAL_DIR,
+        sync: str = JOURNAL_SYNC,
+        sync_interval: float = JOURNAL_SYNC_INTERVAL,
+        max_bytes: int = JOURNAL_MAX_BYTES,
+        max_entries: int = JOURNAL_MAX_ENTRIES,
+    ):
+        if sync not in ("batch", "wait"):
+            raise ValueError(f"Unknown journal sync mode '{sync}' (use 'batch' or 'wait')")
+        self.workspace = Path(workspace).resolve()
+        self._prefix = str(self.workspace).rstrip(os.sep) + os.sep
+        self.directory = Path(directory)
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Released when the file is closed (close(), or the process exiting)
+        self._lock_file = open(self.directory / _LOCK_NAME, "ab")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise JournalLocked(f"Journal directory {self.directory} is in use by another process") from None
+
+        self._lock = threading.RLock()
+        # Held by a commit or a compaction (which replaces the files being fsynced)
+        self._commit_lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._closed = False
+        self._committer: Optional[threading.Thread] = None
+
+        # digest -> (offset of the compressed data in the pack, its length)
+        self._blobs: dict[str, tuple[int, int]] = {}
+        self._entries: list[JournalEntry] = []
+        # Last seq ever written; rollbacks can go back to the horizon at the earliest
+        self._last_seq = 0
+        self._horizon = 0
+        # path -> digest of its content after the last entry (None: deleted)
+        self._latest: dict[str, Optional[str]] = {}
+        # path -> (digest, mtime_ns, size, inode) of files as the journal last saw them
+        self._known: dict[str, tuple[str, int, int, int]] = {}
+        # Written since the last commit
+        self._dirty: set[Path] = set()
+        self._durable_seq = 0
+        self._compact_requested = False
+        self.stats = {"writes": 0, "rollbacks": 0, "commits": 0, "fsyncs": 0, "compactions": 0,
+                      "commit_seconds": 0.0}
+
+        self._load()
+        self._pack = open(self.directory / _PACK_NAME, "ab")
+        self._log = open(self.directory / _LOG_NAME, "ab")
+
+    # --- loading ---
+
+    def _load(self) -> None:
+        pack_path = self.directory / _PACK_NAME
+        log_path = self.directory / _LOG_NAME
+        valid = 0
+        if pack_path.exists():
+            size = pack_path.stat().st_size
+            # Only the record headers are read
+            with open(pack_path, "rb") as f:
+                while True:
+                    header = f.read(_RECORD.size)
+                    if len(header) < _RECORD.size:
+                        break
+                    digest, length = _RECORD.unpack(header)
+                    start = valid + _RECORD.size
+                    if start + length > size:
+                        break
+                    self._blobs[digest.hex()] = (start, length)
+                    valid = start + length
+                    f.seek(valid)
+            if valid < size:
+                # Torn tail from a crash mid-append
+                with open(pack_path, "r+b") as f:
+                    f.truncate(valid)
+
+        if log_path.exists():
+            valid = 0
+            with open(log_path, "rb") as f:
+                for raw in f:
+                    try:
+                        entry = JournalEntry(**json.loads(raw))
+                    except (ValueError, TypeError):
+                        break
+                    # The log may have reached the disk before the blobs it references
+                    if any(d is not None and d not in self._blobs for d in (entry.before, entry.after)):
+                        break
+                    self._entries.append(entry)
+                    valid += len(raw)
+            if valid < log_path.stat().st_size:
+                with open(log_path, "r+b") as f:
+                    f.truncate(valid)
+        if self._entries:
+            self._horizon = self._entries[0].seq - 1
+            self._last_seq = self._durable_seq = self._entries[-1].seq
+        for entry in self._entries:
+            self._latest[entry.path] = entry.after
+
+    # --- blobs ---
+
+    def _put_blob(self, data: bytes) -> str:
+        digest = _digest(data)
+        if digest not in self._blobs:
+            compressed = zlib.compress(data, 1)
+            self._pack.write(_RECORD.pack(bytes.fromhex(digest), len(compressed)))
+            offset = self._pack.tell()
+            self._pack.write(compressed)
+            self._blobs[digest] = (offset, len(compressed))
+        return digest
+
+    def read_blob(self, digest: str) -> bytes:
+        with self._lock:
+            offset, length = self._blobs[digest]
+            self._pack.flush()
+        with open(self.directory / _PACK_NAME, "rb") as f:
+            f.seek(offset)
+            return zlib.decompress(f.read(length))
+
+    # --- files ---
+
+    def _relative(self, path: Path) -> str:
+        # Callers pass resolved paths (the tools check them against the workspace);
+        # normalizing is enough here and saves the syscalls of resolve()
+        absolute = os.path.abspath(path)
+        if not absolute.startswith(self._prefix):
+            raise JournalError(f"{path} is outside the journaled workspace {self.workspace}")
+        return absolute[len(self._prefix):].replace(os.sep, "/")
+
+    def _current(self, path: Path, rel: str) -> Optional[str]:
+        """Digest of the file's current content (stored as a blob), None if it doesn't exist.
+        Files unchanged since the journal last saw them aren't read again."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        known = self._known.get(rel)
+        if known is not None and known[1:] == (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+            return known[0]
+        with open(path, "rb") as f:
+            digest = self._put_blob(f.read())
+        self._remember(path, rel, digest)
+        return digest
+
+    def _remember(self, path: Path, rel: str, digest: Optional[str]) -> None:
+        if digest is None:
+            self._known.pop(rel, None)
+            return
+        stat = os.stat(path)
+        self._known[rel] = (digest, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _replace(self, path: Path, data: bytes) -> None:
+        """Temp file + rename, without an fsync (the next commit syncs it)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                os.chmod(tmp_name, os.stat(path).st_mode & 0o7777)
+            except OSError:
+                pass
+            os.replace(tmp_name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+        self._dirty.add(path)
+
+    def _append(self, rel: str, op: str, before: Optional[str], after: Optional[str], **tags: Any) -> JournalEntry:
+        self._last_seq += 1
+        entry = JournalEntry(self._last_seq, time.time(), rel, op, before, after, **tags)
+        self._log.write(entry.to_json().encode("utf-8") + b"\n")
+        self._entries.append(entry)
+        self._latest[rel] = after
+        if len(self._entries) > self.max_entries or self._pack.tell() > self.max_bytes:
+            self._compact_requested = True
+        return entry
+
+    # --- mutations ---
+
+    def write(
+        self,
+        path: Path,
+        data: Union[str, bytes],
+        thread_id: Optional[str] = None,
+        checkpoint_id: Optional[str] = None,
+    ) -> JournalEntry:
+        """Replaces the file at `path` with `data` and journals the change."""
+        rel = self._relative(path)
+        path = self.workspace / rel
+        content = data.encode("utf-8") if isinstance(data, str) else data
+        with self._lock:
+            before = self._current(path, rel)
+            after = self._put_blob(content)
+            self._replace(path, content)
+            self._remember(path, rel, after)
+            entry = self._append(rel, "write", before, after, thread_id=thread_id, checkpoint_id=checkpoint_id)
+            self.stats["writes"] += 1
+        self._committed_after(entry.seq)
+        return entry
+
+    def delete(self, path: Path, thread_id: Optional[str] = None, checkpoint_id: Optional[str] = None) -> Optional[JournalEntry]:
+        """Deletes the file at `path` (its content stays in the journal)."""
+        rel = self._relative(path)
+        path = self.workspace / rel
+        with self._lock:
+            before = self._current(path, rel)
+            if before is None:
+                return None
+            os.unlink(path)
+            self._dirty.add(path)
+            self._remember(path, rel, None)
+            entry = self._append(rel, "delete", before, None, thread_id=thread_id, checkpoint_id=checkpoint_id)
+            self.stats["writes"] += 1
+        self._committed_after(entry.seq)
+        return entry
+
+    # --- rollback ---
+
+    def seq_for_checkpoint(self, thread_id: str, checkpoint_id: str) -> int:
+        """The position to roll back to for the workspace as it was at `checkpoint_id`
+        of `thread_id`: just before the first write made by a step that ran from that
+        checkpoint or a later one (checkpoint ids sort in time order)."""
+        with self._lock:
+            target = self._last_seq
+            for entry in reversed(self._entries):
+                if entry.thread_id != thread_id or entry.checkpoint_id is None:
+                    continue
+                if entry.checkpoint_id < checkpoint_id:
+                    break
+                target = entry.seq - 1
+            return target
+
+    def rollback(self, target_seq: int, force: bool = False) -> list[JournalEntry]:
+        """Restores every file written after `target_seq` to its content at that point.
+        Returns the rollback's own entries (one per restored file)."""
+        with self._lock:
+            if target_seq < self._horizon:
+                raise JournalError(
+                    f"Position {target_seq} is older than the journal's horizon ({self._horizon}); it was compacted away"
+                )
+            if target_seq >= self._last_seq:
+                return []
+            base = self._entries[0].seq
+            restore: dict[str, Optional[str]] = {}
+            for entry in self._entries[target_seq + 1 - base:]:
+                restore.setdefault(entry.path, entry.before)
+
+            conflicts = []
+            for rel in restore:
+                path = self.workspace / rel
+                current = self._current(path, rel)
+                if current != self._latest.get(rel):
+                    conflicts.append(rel)
+            if conflicts and not force:
+                raise JournalConflict(
+                    f"Changed outside the journal since their last write: {', '.join(sorted(conflicts))}"
+                )
+
+            restored = []
+            for rel, digest in restore.items():
+                path = self.workspace / rel
+                current = self._current(path, rel)
+                if current == digest:
+                    continue
+                if digest is None:
+                    os.unlink(path)
+                    self._dirty.add(path)
+                else:
+                    self._replace(path, self.read_blob(digest))
+                self._remember(path, rel, digest)
+                restored.append(self._append(rel, "rollback", current, digest, target=target_seq))
+            self.stats["rollbacks"] += 1
+        for entry in restored:
+            notify_file_written(self.workspace / entry.path)
+        if restored:
+            self._committed_after(restored[-1].seq)
+        return restored
+
+    # --- group commit ---
+
+    def _committed_after(self, seq: int) -> None:
+        if self._committer is None:
+            with self._lock:
+                if self._committer is None and not self._closed:
+                    self._committer = threading.Thread(target=self._commit_loop, daemon=True, name="aspen-journal")
+                    self._committer.start()
+        self._wake.set()
+        if self.sync == "wait":
+            with self._committed:
+                while self._durable_seq < seq and not self._closed:
+                    self._committed.wait()
+
+    def _commit_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait()
+            if self.sync == "batch" and not self._closed:
+                # Let the burst of writes in progress join this commit
+                time.sleep(self.sync_interval)
+            self._wake.clear()
+            try:
+                self.commit()
+                if self._compact_requested:
+                    self.compact()
+            except Exception:
+                logger.exception("journal commit failed (%s)", self.directory)
+
+    def commit(self) -> int:
+        """Makes everything written so far durable. Returns the last durable seq."""
+        with self._commit_lock:
+            with self._lock:
+                seq = self._last_seq
+                if seq == self._durable_seq:
+                    return seq
+                self._pack.flush()
+                self._log.flush()
+                dirty, self._dirty = self._dirty, set()
+            started = time.perf_counter()
+            # Blobs before the log: an entry must never be durable without its blobs
+            os.fsync(self._pack.fileno())
+            directories = set()
+            for path in dirty:
+                _fsync_path(path)
+                directories.add(path.parent)
+            for directory in directories:
+                _fsync_path(directory)
+            os.fsync(self._log.fileno())
+            with self._lock:
+                self._durable_seq = seq
+                self.stats["commits"] += 1
+                self.stats["fsyncs"] += 2 + len(dirty) + len(directories)
+                self.stats["commit_seconds"] += time.perf_counter() - started
+                self._committed.notify_all()
+            return seq
+
+    # --- compaction ---
+
+    def compact(self, keep: Optional[int] = None) -> int:
+        """Drops all but the newest `keep` entries (default: COMPACT_KEEP of the maximum)
+        and the blobs no kept entry references. Returns the number of entries dropped."""
+        self.commit()
+        with self._commit_lock, self._lock:
+            self._compact_requested = False
+            if keep is None:
+                keep = max(1, int(min(len(self._entries), self.max_entries) * COMPACT_KEEP))
+            dropped = max(0, len(self._entries) - keep)
+            kept = self._entries[dropped:]
+            referenced = {d for e in kept for d in (e.before, e.after) if d is not None}
+            referenced.update(known[0] for known in self._known.values())
+
+            self._pack.flush()
+            self._log.flush()
+            old_pack = self.directory / _PACK_NAME
+            new_blobs: dict[str, tuple[int, int]] = {}
+            pack_tmp = self.directory / (_PACK_NAME + ".tmp")
+            log_tmp = self.directory / (_LOG_NAME + ".tmp")
+            with open(old_pack, "rb") as src, open(pack_tmp, "wb") as dst:
+                for digest in referenced:
+                    offset, length = self._blobs[digest]
+                    src.seek(offset)
+                    compressed = src.read(length)
+                    dst.write(_RECORD.pack(bytes.fromhex(digest), length))
+                    new_blobs[digest] = (dst.tell(), length)
+                    dst.write(compressed)
+                dst.flush()
+                os.fsync(dst.fileno())
+            with open(log_tmp, "wb") as dst:
+                for entry in kept:
+                    dst.write(entry.to_json().encode("utf-8") + b"\n")
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            self._pack.close()
+            self._log.close()
+            # Log first: the new log only references blobs the old pack also has
+            os.replace(log_tmp, self.directory / _LOG_NAME)
+            os.replace(pack_tmp, old_pack)
+            _fsync_path(self.directory)
+            self._pack = open(old_pack, "ab")
+            self._log = open(self.directory / _LOG_NAME, "ab")
+            self._blobs = new_blobs
+            self._entries = kept
+            self._horizon = kept[0].seq - 1 if kept else self._last_seq
+            self.stats["compactions"] += 1
+            return dropped
+
+    # --- reporting ---
+
+    def entries(self, limit: int = 50, thread_id: Optional[str] = None) -> list[dict[str, Any]]:
+        """The newest entries (optionally of one thread), newest first."""
+        with self._lock:
+            selected = []
+            for entry in reversed(self._entries):
+                if thread_id is None or entry.thread_id == thread_id:
+                    selected.append(asdict(entry))
+                    if len(selected) >= limit:
+                        break
+            return selected
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workspace": str(self.workspace),
+                "directory": str(self.directory),
+                "sync": self.sync,
+                "entries": len(self._entries),
+                "last_seq": self._last_seq,
+                "durable_seq": self._durable_seq,
+                "horizon": self._horizon,
+                "blobs": len(self._blobs),
+                "pack_bytes": self._pack.tell(),
+                **{k: round(v, 4) if isinstance(v, float) else v for k, v in self.stats.items()},
+            }
+
+    def close(self) -> None:
+        self.commit()
+        with self._lock:
+            self._closed = True
+            self._committed.notify_all()
+        self._wake.set()
+        if self._committer is not None:
+            self._committer.join(timeout=5)
+        with self._lock:
+            self._pack.close()
+            self._log.close()
+            self._lock_file.close()
+
+
+_journals: dict[Path, MutationJournal] = {}
+# workspace -> the directory open_journal() was given (the journal may be in a slot below it)
+_journal_bases: dict[Path, Path] = {}
+_journals_lock = threading.Lock()
+
+
+def open_journal(workspace: Path, directory: Path = DEFAULT_JOURNAL_DIR, **kwargs: Any) -> MutationJournal:
+    """Opens (or returns the already open) journal of `workspace`; the file tools then
+    route their writes under it through the journal. If another process holds
+    `directory`, the journal is opened in the first free `directory/worker-N` (the same
+    slot tends to be picked up again by a restarted worker, with its history)."""
+    workspace = Path(workspace).resolve()
+    directory = Path(directory)
+    with _journals_lock:
+        journal = _journals.get(workspace)
+        if journal is not None:
+            return journal
+        for slot in range(MAX_JOURNAL_SLOTS + 1):
+            candidate = directory / f"worker-{slot}" if slot else directory
+            try:
+                journal = MutationJournal(workspace, candidate, **kwargs)
+            except JournalLocked:
+                continue
+            if slot:
+                logger.warning("journal %s is held by another process; this process journals to %s",
+                               directory, candidate)
+            _journals[workspace] = journal
+            _journal_bases[workspace] = directory.resolve()
+            return journal
+        raise JournalLocked(f"Journal directory {directory} and its {MAX_JOURNAL_SLOTS} worker slots are all in use")
+
+
+def close_journal(workspace: Path) -> None:
+    with _journals_lock:
+        journal = _journals.pop(Path(workspace).resolve(), None)
+        _journal_bases.pop(Path(workspace).resolve(), None)
+    if journal is not None:
+        journal.close()
+
+
+def journal_for(root: Path) -> Optional[MutationJournal]:
+    """The open journal of the workspace `root`, if there is one. Attempt clones have
+    none: their writes are journaled when promoted."""
+    if not _journals:
+        return None
+    journal = _journals.get(root)
+    return journal if journal is not None else _journals.get(Path(root).resolve())
+
+
+def journal_directories() -> set[Path]:
+    """Directories of the open journals, and the ones they were configured with (which
+    hold the other workers' slots). Left out of workspace clones; the file tools don't
+    write under them."""
+    return {journal.directory.resolve() for journal in list(_journals.values())} | set(_journal_bases.values())
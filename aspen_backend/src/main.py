@@ -1,25 +1,41 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from langchain_ollama import ChatOllama
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 # Removed legacy agent imports
 # from langchain.agents import AgentExecutor, create_react_agent
 # from langchain import hub
 # from langchain.prompts import PromptTemplate
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
 import json
+import os
+from pathlib import Path
+import uuid
 # Removed callback imports
 # from typing import Any, Dict, List, Optional
 # from langchain_core.callbacks import BaseCallbackHandler
 # from langchain_core.outputs import LLMResult
 
 # LangGraph imports
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import ToolNode, create_react_agent
 # Remove StateGraph, MessagesState, START import
 
 # Import our tools
+from src.tools import file_system_tools
 from src.tools.file_system_tools import FileReadTool, ListDirectoryTool, GrepTool, FileWriteTool, FileEditTool
+from src.tools.result_cache import TOOL_RESULT_CACHE
+from src.tools.symbol_index import DEFAULT_SYMBOL_DB, start_background_build as start_symbol_index
+from src.tools.symbol_tools import CodeSymbolsTool
+from src.tools.tool_scheduler import ToolCallScheduler
+from src.checkpointing import SQLiteCheckpointSaver, DEFAULT_CHECKPOINT_DB
+from src.context_manager import ContextManager
+from src.model_pool import ModelPool, ModelRole, request_priority
+from src.attempts import AttemptScheduler, AttemptSpec, CommandCheck
+from src.completion_cache import COMPLETION_CACHE_MODE, CompletionCache, DEFAULT_COMPLETION_CACHE_DB
+from src.instrumentation import REGISTRY, TraceCallbackHandler, debug_enabled, finish_trace, logger, start_trace
+from src.streaming import STREAM_FRAMING, ndjson_stream, wait_for_disconnect
+from src.journal import DEFAULT_JOURNAL_DIR, JOURNAL_ENABLED, JournalConflict, JournalError, close_journal, open_journal
 
 # --- Removed Custom Callback Handler ---
 # class PrintPromptHandler(BaseCallbackHandler):
@@ -33,22 +49,105 @@ enable_thinking_mode = False  # Default to True as per Qwen3 docs
 # Define the request body model
 class ChatRequest(BaseModel):
     message: str
+    # Conversation to continue. Omit to start a new one; the id is returned in the
+    # X-Thread-Id response header.
+    thread_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    # Queue priority for model calls; interactive chat is served before background work
+    priority: Literal["interactive", "normal", "background"] = "interactive"
+    # Append a {"trace": {...}} record with this request's timings to the stream
+    trace: bool = False
+    # "token": one line per model chunk; "coalesce": chunks merged into frames every few
+    # ms (same {"text": ...} records). Default: ASPEN_STREAM_FRAMING
+    framing: Optional[Literal["token", "coalesce"]] = None
     # Add chat history later if needed
     # chat_history: list[tuple[str, str]] = []
 
+
+class AttemptConfig(BaseModel):
+    name: Optional[str] = None
+    # System prompt for this attempt (default: the agent's)
+    prompt: Optional[str] = None
+    # Model role from the pool, and option overrides for it
+    role: str = "chat"
+    temperature: Optional[float] = None
+
+
+class AttemptsRequest(ChatRequest):
+    # Different temperatures by default: the same task, tried in different ways
+    attempts: list[AttemptConfig] = Field(
+        default_factory=lambda: [AttemptConfig(temperature=t) for t in (0.2, 0.7, 1.0)], min_length=1, max_length=8
+    )
+    # Apply the winner's changes to the workspace (otherwise only report its diff)
+    promote: bool = True
+
+
+class RollbackRequest(BaseModel):
+    # Journal position to restore the workspace to (see GET /journal)...
+    seq: Optional[int] = None
+    # ...or the workspace as it was at this checkpoint of a thread
+    thread_id: Optional[str] = None
+    checkpoint_id: Optional[str] = None
+    # Restore even files that were changed outside the tools since their last write
+    force: bool = False
+
 # --- Agent Setup ----
 
+# Opt-in cache of model completions (ASPEN_COMPLETION_CACHE=deterministic|all, see
+# src/completion_cache.py). The thinking-mode flag is part of the key.
+completion_cache = None
+if COMPLETION_CACHE_MODE != "off":
+    completion_cache = CompletionCache(
+        os.environ.get("ASPEN_COMPLETION_CACHE_DB", DEFAULT_COMPLETION_CACHE_DB),
+        key_extras=lambda: {"thinking_mode": enable_thinking_mode},
+    )
+
+# Journal of the tools' file writes, for crash-safe writes and rollback (ASPEN_JOURNAL=0
+# disables it, see src/journal.py)
+journal = None
+if JOURNAL_ENABLED:
+    journal = open_journal(
+        file_system_tools.WORKSPACE_ROOT, Path(os.environ.get("ASPEN_JOURNAL_DIR", DEFAULT_JOURNAL_DIR))
+    )
+
+# Model roles served through the dispatch pool (see src/model_pool.py)
+model_pool = ModelPool(
+    [
+        ModelRole("chat", os.environ.get("ASPEN_CHAT_MODEL", "qwen3:4b"), max_concurrency=2, keep_alive="30m", preload=True),
+        # Small model used to summarize old turns when a thread outgrows its context budget.
+        # Greedy decoding: a summary doesn't need variety, and it makes the step cacheable
+        ModelRole(
+            "summarizer", os.environ.get("ASPEN_SUMMARY_MODEL", "qwen3:1.7b"), max_concurrency=1, keep_alive="10m",
+            options={"temperature": 0},
+        ),
+    ],
+    base_url=os.environ.get("OLLAMA_BASE_URL"),
+    completion_cache=completion_cache,
+)
+
+REGISTRY.gauge(
+    "aspen_model_queue_depth", "Model calls waiting for a slot, per role.", ("role",),
+    lambda: {(name,): m["queue_depth"] for name, m in model_pool.metrics()["roles"].items()},
+)
+REGISTRY.gauge(
+    "aspen_model_in_flight", "Model calls currently running, per role.", ("role",),
+    lambda: {(name,): m["in_flight"] for name, m in model_pool.metrics()["roles"].items()},
+)
+
 # Initialize LLM (Removed callback handler)
-llm = ChatOllama(model="qwen3:4b")
+llm = model_pool.chat_model("chat")
+summary_llm = model_pool.chat_model("summarizer")
 
 # Instantiate tools
 tools = [
     FileReadTool(),
     ListDirectoryTool(),
     GrepTool(),
+    CodeSymbolsTool(),
     FileWriteTool(),
     FileEditTool()
     ]
+# Runs independent tool calls of one step in parallel, conflicting ones in call order
+tool_node = ToolNode(tools, awrap_tool_call=ToolCallScheduler().awrap)
 
 # --- Removed Prompt Template Logic ---
 # with open("src/prompts/react_agent_prompt.txt", "r") as f:
@@ -59,39 +158,85 @@ tools = [
 # -------------------------------------
 
 # --- LangGraph Setup ---
-# Instantiate memory saver
-memory = MemorySaver()
+# Durable checkpointer shared by all workers on this box (SQLite in WAL mode)
+memory = SQLiteCheckpointSaver(os.environ.get("ASPEN_CHECKPOINT_DB", DEFAULT_CHECKPOINT_DB))
+
+# Compacts long threads before each model call (see src/context_manager.py)
+context_manager = ContextManager(summarizer=summary_llm)
 
 # Restore the LangGraph agent
-agent_graph = create_react_agent(llm, tools, checkpointer=memory)
+agent_graph = create_react_agent(llm, tool_node, checkpointer=memory, pre_model_hook=context_manager.as_hook())
+
+
+def build_attempt_graph(spec: AttemptSpec):
+    """Agent graph for one speculative attempt (its own prompt, model role and options)."""
+    model = model_pool.chat_model(spec.role, **spec.options)
+    return create_react_agent(
+        model, tool_node, checkpointer=memory, prompt=spec.prompt, pre_model_hook=context_manager.as_hook()
+    )
+
+
+# Parallel attempts in workspace clones (see src/attempts.py). The check that decides
+# which attempt succeeded is a server-side command (e.g. "pytest -q"), never taken from
+# the request; without one the first attempt to finish wins.
+attempt_check_command = os.environ.get("ASPEN_ATTEMPT_CHECK")
+attempt_scheduler = AttemptScheduler(
+    build_attempt_graph,
+    check=CommandCheck(attempt_check_command) if attempt_check_command else None,
+)
 
 # --- FastAPI App ---
 
-app = FastAPI(title="Aspen Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the preloaded model roles now (and keep them loaded) so the first request
+    # doesn't pay the model load
+    model_pool.start_keep_warm()
+    # Build (or catch up) the persistent symbol index of the workspace for code_symbols
+    start_symbol_index(
+        file_system_tools.WORKSPACE_ROOT, Path(os.environ.get("ASPEN_SYMBOL_DB", DEFAULT_SYMBOL_DB))
+    )
+    yield
+    await model_pool.stop_keep_warm()
+    if journal is not None:
+        close_journal(journal.workspace)
+
+
+app = FastAPI(title="Aspen Backend", lifespan=lifespan)
 
 # Simple test endpoint to check direct LLM streaming
 @app.post("/test_llm_stream")
-async def test_llm_stream(request: ChatRequest):
+async def test_llm_stream(request: ChatRequest, http_request: Request):
     """Directly streams response from the base LLM to test streaming."""
+    async def llm_text(callbacks):
+        logger.debug("testing direct LLM stream")
+        async for chunk in llm.astream(request.message, config={"callbacks": callbacks}):
+            # chunk is typically an AIMessageChunk here
+            if isinstance(chunk, AIMessageChunk) and chunk.content:
+                if debug_enabled():
+                    logger.debug("LLM yielding: %r", chunk.content)
+                yield chunk.content
+        logger.debug("LLM stream finished")
+
     async def stream_llm():
+        trace, trace_token = start_trace("test_llm_stream")
         try:
-            print("--- DEBUG: Testing direct LLM stream ---")
-            async for chunk in llm.astream(request.message):
-                # chunk is typically an AIMessageChunk here
-                if isinstance(chunk, AIMessageChunk) and chunk.content:
-                    print(f"--- DEBUG: LLM yielding: {repr(chunk.content)} ---")
-                    yield json.dumps({"text": chunk.content}) + "\\n"
-                else:
-                    print(f"--- DEBUG: LLM received non-AIMessageChunk or empty: {type(chunk)} ---")
-            print("--- DEBUG: LLM stream finished ---")
+            with request_priority(request.priority):
+                # Runs in its own task, cancelled if the client disconnects
+                async for line in ndjson_stream(
+                    llm_text([TraceCallbackHandler(trace)]), trace,
+                    disconnected=wait_for_disconnect(http_request.receive),
+                    framing=request.framing or STREAM_FRAMING,
+                ):
+                    yield line
         except Exception as e:
-            error_message = json.dumps({"error": str(e)}) + "\\n"
-            print(f"--- ERROR: Exception during direct LLM stream: {e} ---")
-            import traceback
-            traceback.print_exc()
-            yield error_message
+            trace.error = str(e)
+            logger.exception("Exception during direct LLM stream")
+            yield json.dumps({"error": str(e)}) + "\n"
         finally:
-            print("--- DEBUG: Exiting direct LLM stream generator ---")
+            finish_trace(trace, trace_token)
+        if request.trace:
+            yield json.dumps({"trace": trace.summary()}) + "\n"
 
     return StreamingResponse(stream_llm(), media_type="application/x-ndjson")
 
@@ -114,51 +259,167 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/threads/{thread_id}/context")
+def thread_context_stats(thread_id: str):
+    """Per-step prompt size and prefill latency for a thread, before and after compaction."""
+    report = context_manager.report(thread_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No context stats for thread {thread_id}")
+    return report
+
+
+@app.get("/model_pool/stats")
+def model_pool_stats():
+    """Queue depth, in-flight calls and queue wait times per model role."""
+    return model_pool.metrics()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, token, node, tool and queue metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/tool_cache/stats")
+def tool_cache_stats():
+    """Hit/miss/eviction counters of the read-only tool result cache."""
+    return TOOL_RESULT_CACHE.snapshot()
+
+
+@app.get("/completion_cache/stats")
+def completion_cache_stats():
+    """Mode, size and hit/miss counters of the model completion cache."""
+    if completion_cache is None:
+        return {"mode": "off"}
+    return completion_cache.stats()
+
+
+@app.get("/journal")
+def journal_entries(limit: int = 50, thread_id: Optional[str] = None):
+    """Newest entries of the mutation journal (optionally of one thread) and its stats."""
+    if journal is None:
+        raise HTTPException(status_code=404, detail="The mutation journal is disabled")
+    return {"stats": journal.snapshot(), "entries": journal.entries(limit, thread_id)}
+
+
+@app.post("/journal/rollback")
+def journal_rollback(request: RollbackRequest):
+    """Restores the files the tools wrote after a journal position or a thread's checkpoint."""
+    if journal is None:
+        raise HTTPException(status_code=404, detail="The mutation journal is disabled")
+    if request.seq is not None:
+        target = request.seq
+    elif request.thread_id and request.checkpoint_id:
+        target = journal.seq_for_checkpoint(request.thread_id, request.checkpoint_id)
+    else:
+        raise HTTPException(status_code=400, detail="Pass either seq, or thread_id and checkpoint_id")
+    try:
+        restored = journal.rollback(target, force=request.force)
+    except JournalConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JournalError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"target": target, "restored": [entry.path for entry in restored]}
+
+
+@app.post("/journal/compact")
+def journal_compact(keep: Optional[int] = None):
+    """Drops old journal entries (and their blobs); rollbacks past them become impossible."""
+    if journal is None:
+        raise HTTPException(status_code=404, detail="The mutation journal is disabled")
+    dropped = journal.compact(keep)
+    return {"dropped": dropped, "stats": journal.snapshot()}
+
+
 # Modified chat endpoint to use the LangGraph agent and stream responses
 @app.post("/agent_chat")
-async def agent_chat_endpoint(request: ChatRequest):
+async def agent_chat_endpoint(request: ChatRequest, http_request: Request):
     """Receives a message and streams the agent's step-level responses back."""
 
-    async def stream_agent_response():
-        """Async generator to stream agent execution steps using LangGraph agent."""
+    async def agent_text(config):
+        """Text chunks of the agent node, from the LangGraph agent's message stream."""
         agent_input = {"messages": [HumanMessage(content=request.message)]}
-        config = {"configurable": {"thread_id": "user_session_1"}}
-
-        print("--- DEBUG: Starting agent stream (step-level) ---")
+        logger.debug("starting agent stream for thread %s", request.thread_id)
         stream_chunk_count = 0
+        # Use agent_graph.astream with stream_mode="messages"
+        async for step, metadata in agent_graph.astream(agent_input, config=config, stream_mode="messages"):
+            stream_chunk_count += 1
+            if debug_enabled():
+                logger.debug("stream tuple %d: %s %r metadata=%r", stream_chunk_count, type(step).__name__, step, metadata)
+
+            # Only yield if this is a message from the agent node
+            if metadata.get("langgraph_node") == "agent":
+                if isinstance(step, AIMessageChunk) and step.content:
+                    yield step.content
+        logger.debug("agent stream finished after %d chunks", stream_chunk_count)
+
+    async def stream_agent_response():
+        """Async generator to stream agent execution steps using LangGraph agent."""
+        trace, trace_token = start_trace("agent_chat", request.thread_id)
+        config = {"configurable": {"thread_id": request.thread_id}, "callbacks": [TraceCallbackHandler(trace)]}
 
         try:
-            # Use agent_graph.astream with stream_mode="messages"
-            async for step, metadata in agent_graph.astream(agent_input, config=config, stream_mode="messages"):
-                stream_chunk_count += 1
-                print(f"--- DEBUG: Received stream tuple {stream_chunk_count}: ---")
-                print(f"STEP: {type(step)} - {step}")
-                print(f"METADATA: {metadata}")
-                print("--- END DEBUG TUPLE ---")
-
-                # Only yield if this is a message from the agent node
-                if metadata.get("langgraph_node") == "agent":
-                    if isinstance(step, AIMessageChunk) and step.content:
-                        text_chunk = step.content
-                        print(f"--- DEBUG: Yielding text chunk from agent: {repr(text_chunk)} ---")
-                        yield json.dumps({"text": text_chunk}) + "\n"
-                    else:
-                        print(f"--- DEBUG: Agent step is not AIMessageChunk or has no content: {type(step)} ---")
-                else:
-                    pass
-
-            print(f"--- DEBUG: Agent stream finished after {stream_chunk_count} chunks ---")
+            with request_priority(request.priority):
+                # The graph runs in its own task; a client disconnect cancels it (and the
+                # model request in flight) instead of letting it run to completion
+                async for line in ndjson_stream(
+                    agent_text(config), trace,
+                    disconnected=wait_for_disconnect(http_request.receive),
+                    framing=request.framing or STREAM_FRAMING,
+                ):
+                    yield line
 
         except Exception as e:
-            error_message = json.dumps({"error": str(e)}) + "\n"
-            print(f"--- ERROR: Exception during agent execution stream: {e} ---")
-            import traceback
-            traceback.print_exc()
-            yield error_message
+            trace.error = str(e)
+            logger.exception("Exception during agent execution stream")
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            finish_trace(trace, trace_token)
+        if request.trace:
+            # Summary of this request's timings as the last record of the stream
+            yield json.dumps({"trace": trace.summary()}) + "\n"
+
+    return StreamingResponse(
+        stream_agent_response(),
+        media_type="application/x-ndjson",
+        headers={"X-Thread-Id": request.thread_id},
+    )
+
+@app.post("/agent_attempts")
+async def agent_attempts_endpoint(request: AttemptsRequest, http_request: Request):
+    """Runs several attempts at the task in parallel, each in its own workspace clone,
+    and streams their progress and the winner's diff."""
+    specs = []
+    for i, config in enumerate(request.attempts):
+        if config.role not in model_pool.roles:
+            raise HTTPException(status_code=400, detail=f"Unknown model role '{config.role}'")
+        options = {"temperature": config.temperature} if config.temperature is not None else {}
+        specs.append(AttemptSpec(config.name or f"attempt-{i + 1}", config.prompt, config.role, options))
+    if len({spec.name for spec in specs}) != len(specs):
+        raise HTTPException(status_code=400, detail="Attempt names must be unique")
+
+    async def stream_attempts():
+        trace, trace_token = start_trace("agent_attempts", request.thread_id)
+        try:
+            with request_priority(request.priority):
+                # A disconnect cancels every attempt (and removes their workspaces)
+                async for line in ndjson_stream(
+                    attempt_scheduler.run(request.message, specs, request.thread_id, promote=request.promote), trace,
+                    disconnected=wait_for_disconnect(http_request.receive),
+                ):
+                    yield line
+        except Exception as e:
+            trace.error = str(e)
+            logger.exception("Exception during agent attempts")
+            yield json.dumps({"error": str(e)}) + "\n"
         finally:
-             print("--- DEBUG: Exiting stream_agent_response generator ---")
+            finish_trace(trace, trace_token)
 
-    return StreamingResponse(stream_agent_response(), media_type="application/x-ndjson")
+    return StreamingResponse(
+        stream_attempts(),
+        media_type="application/x-ndjson",
+        headers={"X-Thread-Id": request.thread_id},
+    )
 
 # Remove or comment out the old /chat endpoint if desired
 # @app.post("/chat")
@@ -0,0 +1,353 @@
+# Model dispatch pool: named model roles, per-role concurrency, priority queueing and
+# keep-warm preloading.
+#
+# Instead of one ChatOllama created at import time and shared blindly by every request,
+# each role ("chat", "summarizer", ...) names an Ollama model with its own concurrency
+# limit. Calls beyond the limit wait in a per-role priority queue, so interactive chat is
+# served before background work. Roles marked `preload` are loaded into Ollama at startup
+# and periodically pinged with their keep_alive so the first request doesn't pay the
+# model load.
+#
+# Priorities are carried in a ContextVar (set per request with `request_priority`), so
+# they flow through LangGraph into every model call the request makes without having to
+# thread them through the graph state.
+#
+# With a CompletionCache (src/completion_cache.py) attached, a call whose completion is
+# already stored is replayed from it before a slot is requested, so hits never queue.
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence, Union
+
+import ollama
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_ollama import ChatOllama
+
+from src.completion_cache import CompletionCache, chunk_record, replay_chunks
+from src.instrumentation import COMPLETION_CACHE_LOOKUPS, record_queue_wait
+
+# Wait-time samples kept per role for percentiles
+WAIT_SAMPLES = 1000
+# How often preloaded models are pinged to keep them resident
+KEEP_WARM_INTERVAL = 240.0
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("aspen_request_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def request_priority(priority: Union[Priority, str]) -> Iterator[None]:
+    """Sets the priority of every pooled model call made inside the block (and in tasks
+    spawned from it)."""
+    if isinstance(priority, str):
+        priority = Priority[priority.upper()]
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+@dataclass
+class ModelRole:
+    name: str
+    model: str
+    max_concurrency: int = 1
+    # Passed to Ollama with every request; "-1"/-1 keeps the model loaded indefinitely
+    keep_alive: Union[str, int] = "30m"
+    preload: bool = False
+    # Extra ChatOllama parameters (temperature, num_ctx, reasoning, ...)
+    options: dict[str, Any] = field(default_factory=dict)
+
+
+class _RoleScheduler:
+    """Counting semaphore whose waiters are served by (priority, arrival order)."""
+
+    def __init__(self, role: ModelRole):
+        self.role = role
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.served = 0
+        self.served_by_priority = {p.name.lower(): 0 for p in Priority}
+        self.max_queue_depth = 0
+        self.wait_samples: deque = deque(maxlen=WAIT_SAMPLES)
+        self.total_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def queue_depth_by_priority(self) -> dict[str, int]:
+        depths = {p.name.lower(): 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depths[Priority(priority).name.lower()] += 1
+        return depths
+
+    async def acquire(self, priority: Priority) -> float:
+        """Waits for a slot; returns the seconds spent waiting."""
+        started = time.perf_counter()
+        if self.in_flight < self.role.max_concurrency and not self.queue_depth:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed to us just as we were cancelled; pass it on
+                    self.release()
+                raise
+        waited = time.perf_counter() - started
+        self.wait_samples.append(waited)
+        self.total_wait += waited
+        self.served += 1
+        self.served_by_priority[priority.name.lower()] += 1
+        return waited
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter; in_flight is unchanged
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self) -> dict[str, Any]:
+        samples = sorted(self.wait_samples)
+
+        def pct(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+        return {
+            "model": self.role.model,
+            "max_concurrency": self.role.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_depth_by_priority": self.queue_depth_by_priority(),
+            "max_queue_depth": self.max_queue_depth,
+            "served": self.served,
+            "served_by_priority": dict(self.served_by_priority),
+            "wait_seconds": {
+                "mean": self.total_wait / self.served if self.served else 0.0,
+                "p50": pct(50),
+                "p95": pct(95),
+                "p99": pct(99),
+                "max": samples[-1] if samples else 0.0,
+            },
+        }
+
+
+class ModelPool:
+    def __init__(self, roles: Sequence[ModelRole], base_url: Optional[str] = None, completion_cache: Optional[CompletionCache] = None):
+        self.base_url = base_url
+        self.completion_cache = completion_cache
+        self.roles = {role.name: role for role in roles}
+        self._schedulers = {role.name: _RoleScheduler(role) for role in roles}
+        self._models: dict[tuple, ChatOllama] = {}
+        self._keep_warm_task: Optional[asyncio.Task] = None
+        self.preload_errors: dict[str, str] = {}
+
+    def _role(self, role_name: str) -> ModelRole:
+        if role_name not in self.roles:
+            raise KeyError(f"Unknown model role '{role_name}'. Known roles: {', '.join(self.roles)}")
+        return self.roles[role_name]
+
+    def ollama_model(self, role_name: str, overrides: Optional[dict[str, Any]] = None) -> ChatOllama:
+        """The underlying ChatOllama for a role (calls made on it bypass the queue).
+        `overrides` replace some of the role's options (e.g. another temperature)."""
+        key = (role_name, tuple(sorted((overrides or {}).items())))
+        if key not in self._models:
+            role = self._role(role_name)
+            self._models[key] = ChatOllama(
+                model=role.model, keep_alive=role.keep_alive, base_url=self.base_url, **{**role.options, **(overrides or {})}
+            )
+        return self._models[key]
+
+    def chat_model(self, role_name: str, **overrides: Any) -> "PooledChatModel":
+        """A chat model for a role whose calls go through the role's priority queue.
+        Keyword arguments override the role's options for this model only; it still
+        shares the role's queue."""
+        self._role(role_name)
+        return PooledChatModel(pool=self, role=role_name, options=overrides)
+
+    def completion_key(
+        self,
+        role_name: str,
+        overrides: dict[str, Any],
+        messages: list[BaseMessage],
+        stop: Optional[list[str]],
+        kwargs: dict[str, Any],
+    ) -> Optional[str]:
+        """Completion cache key of a call, or None when it isn't cached."""
+        if self.completion_cache is None:
+            return None
+        role = self._role(role_name)
+        options = kwargs.get("options") or {}
+        temperature = options.get("temperature", self.ollama_model(role_name, overrides).temperature)
+        params = {"options": {**role.options, **overrides}, "stop": stop, "call": kwargs}
+        return self.completion_cache.key_for(role.model, params, messages, temperature)
+
+    @asynccontextmanager
+    async def slot(self, role_name: str, priority: Optional[Priority] = None) -> AsyncIterator[None]:
+        scheduler = self._schedulers[self._role(role_name).name]
+        waited = await scheduler.acquire(priority if priority is not None else _current_priority.get())
+        record_queue_wait(role_name, waited)
+        try:
+            yield
+        finally:
+            scheduler.release()
+
+    # --- warm models ---
+
+    async def preload(self) -> None:
+        """Loads every `preload` role into Ollama (an empty generate request loads the
+        model and applies keep_alive without producing tokens)."""
+        client = ollama.AsyncClient(host=self.base_url)
+        for role in self.roles.values():
+            if not role.preload:
+                continue
+            try:
+                await client.generate(model=role.model, prompt="", keep_alive=role.keep_alive)
+                self.preload_errors.pop(role.name, None)
+            except Exception as e:
+                # Ollama may be down or the model not pulled yet; requests will retry the load
+                self.preload_errors[role.name] = str(e)
+
+    async def _keep_warm(self, interval: float) -> None:
+        while True:
+            await self.preload()
+            await asyncio.sleep(interval)
+
+    def start_keep_warm(self, interval: float = KEEP_WARM_INTERVAL) -> None:
+        if self._keep_warm_task is None and any(role.preload for role in self.roles.values()):
+            self._keep_warm_task = asyncio.get_running_loop().create_task(self._keep_warm(interval))
+
+    async def stop_keep_warm(self) -> None:
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "roles": {name: scheduler.metrics() for name, scheduler in self._schedulers.items()},
+            "preload_errors": dict(self.preload_errors),
+            "completion_cache": self.completion_cache.stats() if self.completion_cache is not None else None,
+        }
+
+
+class PooledChatModel(BaseChatModel):
+    """Chat model that runs each call on its role's Ollama model while holding a slot of
+    that role's queue. Drop-in for ChatOllama (tool binding works the same way)."""
+
+    pool: Any
+    role: str
+    # Overrides of the role's options (see ModelPool.chat_model)
+    options: dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "aspen-pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"role": self.role, "model": self.pool.roles[self.role].model, **self.options}
+
+    @property
+    def _inner(self) -> ChatOllama:
+        return self.pool.ollama_model(self.role, self.options)
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        # Same conversion ChatOllama does; the bound `tools` kwarg is forwarded to it
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        return super().bind(tools=formatted_tools, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Synchronous calls aren't queued (the server only uses the async path)
+        return self._inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _cached(self, key: Optional[str]) -> Optional[list[dict[str, Any]]]:
+        if key is None:
+            return None
+        records = await self.pool.completion_cache.aget(key)
+        COMPLETION_CACHE_LOOKUPS.inc(self.role, "hit" if records is not None else "miss")
+        return records
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = self.pool.completion_key(self.role, self.options, messages, stop, kwargs)
+        records = await self._cached(key)
+        if records is not None:
+            chunks = replay_chunks(records)
+            final = chunks[0]
+            for chunk in chunks[1:]:
+                final += chunk
+            return ChatResult(generations=[ChatGeneration(message=message_chunk_to_message(final.message), generation_info=final.generation_info)])
+        async with self.pool.slot(self.role):
+            result = await self._inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if key is not None:
+            await self.pool.completion_cache.aput(key, self.pool.roles[self.role].model, [chunk_record(result.generations[0])])
+        return result
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        key = self.pool.completion_key(self.role, self.options, messages, stop, kwargs)
+        records = await self._cached(key)
+        if records is not None:
+            # BaseChatModel.astream reports each replayed chunk to the callbacks, so the
+            # stream looks the same to LangGraph as a live one
+            for chunk in replay_chunks(records):
+                yield chunk
+            return
+        recorded: list[dict[str, Any]] = []
+        async with self.pool.slot(self.role):
+            async for chunk in self._inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                if key is not None:
+                    recorded.append(chunk_record(chunk))
+                yield chunk
+        # Only complete streams are stored (a consumer that stops early never gets here)
+        if key is not None and recorded:
+            await self.pool.completion_cache.aput(key, self.pool.roles[self.role].model, recorded)
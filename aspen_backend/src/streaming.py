@@ -0,0 +1,146 @@
+# NDJSON response streaming: disconnect handling and frame coalescing.
+#
+# Disconnects. The work behind a stream (a LangGraph run, or a model call) runs in its
+# own task, and a watcher waits for the client's http.disconnect. When the browser or
+# the Next.js proxy goes away, the task is cancelled outright. That cancels the graph's
+# node tasks, and closing the Ollama HTTP request stops the generation. Relying on the
+# response being cancelled isn't enough: Starlette cancels the response through an anyio
+# cancel scope, and a LangGraph run cancelled from inside that scope leaves its node
+# task, and the model generation, running to the end.
+#
+# Framing. "token" mode writes every text chunk as its own line, as before. "coalesce"
+# mode merges consecutive text chunks into one {"text": ...} line, so the schema is
+# unchanged. A frame is flushed when STREAM_FLUSH_BYTES are buffered, or
+# STREAM_FLUSH_INTERVAL after the previous frame. The first chunk after a quiet period
+# goes out at once, so time to first token and slow streams are unaffected. Only
+# fast streams, or many streams on one process, get batched, which is where the
+# per-line json.dumps and network write cost shows.
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+from src.instrumentation import RequestTrace
+
+STREAM_FRAMING = os.environ.get("ASPEN_STREAM_FRAMING", "coalesce")
+STREAM_FLUSH_INTERVAL = float(os.environ.get("ASPEN_STREAM_FLUSH_MS", "25")) / 1000
+STREAM_FLUSH_BYTES = int(os.environ.get("ASPEN_STREAM_FLUSH_BYTES", "2048"))
+
+# An event is streamed text (str) or a record written as its own line (dict)
+StreamEvent = Union[str, dict]
+_DONE = object()
+
+
+async def wait_for_disconnect(receive: Callable[[], Awaitable[dict]]) -> None:
+    """Returns once the ASGI server reports that the client went away."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def ndjson_stream(
+    events: AsyncIterator[StreamEvent],
+    trace: RequestTrace,
+    disconnected: Optional[Awaitable[None]] = None,
+    framing: str = STREAM_FRAMING,
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    flush_bytes: int = STREAM_FLUSH_BYTES,
+) -> AsyncIterator[str]:
+    """Runs `events` in its own task and yields its output as NDJSON lines.
+
+    The task is cancelled when `disconnected` completes or the consumer stops
+    iterating. Exceptions raised by `events` are re-raised here.
+    """
+    # The producer only appends and sets events; the consumer wakes at most once per
+    # frame and drains everything buffered by then, so the per-token cost stays flat
+    items: deque = deque()
+    wake = asyncio.Event()
+    # Set when the buffer must go out without waiting for the interval: enough bytes
+    # are buffered, a record arrived or the stream ended
+    flush_now = asyncio.Event()
+    pending_bytes = 0
+
+    async def produce() -> None:
+        nonlocal pending_bytes
+        try:
+            async for event in events:
+                items.append(event)
+                if isinstance(event, str):
+                    pending_bytes += len(event)
+                    if pending_bytes >= flush_bytes:
+                        flush_now.set()
+                else:
+                    flush_now.set()
+                wake.set()
+        except Exception as e:
+            items.append(e)
+        finally:
+            items.append(_DONE)
+            flush_now.set()
+            wake.set()
+
+    # Created in the caller's context, so request-scoped ContextVars (priority, trace) apply
+    producer = asyncio.create_task(produce())
+    watcher = None
+    if disconnected is not None:
+
+        async def watch() -> None:
+            await disconnected
+            trace.disconnected = True
+            producer.cancel()
+
+        watcher = asyncio.create_task(watch())
+
+    def frame(text: str) -> str:
+        line = json.dumps({"text": text}) + "\n"
+        trace.record_chunk(text, len(line))
+        return line
+
+    last_flush = 0.0
+    try:
+        while True:
+            await wake.wait()
+            if framing == "coalesce" and not flush_now.is_set():
+                delay = last_flush + flush_interval - time.perf_counter()
+                if delay > 0:
+                    # Let more text accumulate until the frame is due
+                    try:
+                        await asyncio.wait_for(flush_now.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            wake.clear()
+            flush_now.clear()
+            batch = list(items)
+            items.clear()
+            pending_bytes = 0
+
+            text: list[str] = []
+            for event in batch:
+                if isinstance(event, str):
+                    if framing == "coalesce":
+                        text.append(event)
+                    else:
+                        yield frame(event)
+                    continue
+                if text:
+                    yield frame("".join(text))
+                    text = []
+                if event is _DONE:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                line = json.dumps(event) + "\n"
+                trace.record_chunk("", len(line))
+                yield line
+            if text:
+                yield frame("".join(text))
+            last_flush = time.perf_counter()
+    finally:
+        # Client gone, consumer stopped or the run finished: nothing may keep running
+        producer.cancel()
+        if watcher is not None:
+            watcher.cancel()
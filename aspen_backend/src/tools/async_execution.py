@@ -0,0 +1,145 @@
+# Async execution layer for the file system tools.
+#
+# The tools in file_system_tools.py are written as blocking `_run` methods. When the
+# agent runs inside the FastAPI event loop, calling those directly from `_arun` stalls
+# token streaming for every other session on the same uvicorn process. This module
+# moves that work off the loop:
+#   - file I/O goes through a small bounded thread pool
+#   - subprocesses (ripgrep) go through asyncio.subprocess and are killed on timeout/cancel
+#   - every tool gets its own concurrency limit and timeout
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+# Size of the shared pool used for blocking file I/O.
+IO_POOL_MAX_WORKERS = int(os.environ.get("ASPEN_TOOL_IO_WORKERS", "8"))
+
+# Per-tool limits: (max concurrent calls, timeout in seconds).
+# Tools not listed here fall back to DEFAULT_TOOL_LIMITS.
+# Mutating tools have no timeout: a pool thread can't be stopped, so a timed-out write
+# could still land after the caller (and the scheduler's per-path lock) moved on.
+DEFAULT_TOOL_LIMITS = (4, 30.0)
+TOOL_LIMITS: dict[str, tuple[int, Optional[float]]] = {
+    "read_file": (8, 10.0),
+    "list_directory": (8, 10.0),
+    "search_file_content": (2, 30.0),
+    "code_symbols": (8, 10.0),
+    "write_file": (4, None),
+    "edit_file": (4, None),
+}
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+# Semaphores are created lazily per event loop so the module can be imported
+# (and the tools used) outside of a running loop. Keyed by the loop itself, weakly:
+# a closed loop's semaphores go with it, and a new loop can't inherit them.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+_semaphores_lock = threading.Lock()
+
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call exceeds its configured timeout."""
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Returns the shared, bounded thread pool used for blocking tool I/O."""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_POOL_MAX_WORKERS, thread_name_prefix="aspen-tool-io")
+    return _io_pool
+
+
+def get_tool_limits(tool_name: str) -> tuple[int, Optional[float]]:
+    return TOOL_LIMITS.get(tool_name, DEFAULT_TOOL_LIMITS)
+
+
+def _get_semaphore(tool_name: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        semaphores = _semaphores.get(loop)
+        if semaphores is None:
+            semaphores = _semaphores[loop] = {}
+    # Only ever touched from the loop's own thread
+    semaphore = semaphores.get(tool_name)
+    if semaphore is None:
+        max_concurrency, _ = get_tool_limits(tool_name)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        semaphores[tool_name] = semaphore
+    return semaphore
+
+
+async def run_tool_in_pool(tool_name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Runs a blocking tool function in the I/O pool, honoring the tool's concurrency limit and timeout.
+
+    If the timeout fires the awaiting coroutine is released immediately; the worker thread
+    finishes its (bounded) file operation in the background. Tools without a timeout
+    (the mutating ones) always run to completion: if the awaiting task is cancelled, the
+    cancellation is re-raised once the worker thread is done.
+    """
+    _, timeout = get_tool_limits(tool_name)
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore(tool_name):
+        # run_in_executor doesn't carry ContextVars into the worker thread (the per-run
+        # workspace root is one); run the call in a copy of the caller's context
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        future = loop.run_in_executor(get_io_pool(), call)
+        if timeout is None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                await asyncio.wait({future})
+                raise
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ToolTimeoutError(f"Tool '{tool_name}' timed out after {timeout:.1f}s")
+
+
+async def _kill_process(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def run_subprocess(
+    tool_name: str,
+    command: Sequence[str],
+    cwd: Optional[os.PathLike] = None,
+) -> tuple[int, str, str]:
+    """Runs a command with asyncio.subprocess under the tool's concurrency limit and timeout.
+
+    Returns (returncode, stdout, stderr). The child process is killed if the call times out
+    or the awaiting task is cancelled (e.g. the client disconnected).
+    Raises FileNotFoundError if the executable does not exist, ToolTimeoutError on timeout.
+    """
+    _, timeout = get_tool_limits(tool_name)
+    async with _get_semaphore(tool_name):
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill_process(process)
+            raise ToolTimeoutError(f"Tool '{tool_name}' timed out after {timeout:.1f}s")
+        except asyncio.CancelledError:
+            await _kill_process(process)
+            raise
+        return (
+            process.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+        )
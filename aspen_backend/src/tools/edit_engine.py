@@ -0,0 +1,256 @@
+# Edit engine behind edit_file.
+#
+# An edit is a sequence of hunks separated by "existing code" marker lines
+# ("# ... existing code ...", "// ... existing code ...", ...). A marker stands for
+# original lines that are kept unchanged. Each hunk replaces a region of the original
+# file: the hunk's first and last lines must be unchanged lines of the original (its
+# anchors) and everything from the first anchor to the last is replaced by the hunk.
+# A hunk whose edges aren't in the file is rejected, since it's impossible to tell
+# whether its new lines replace or insert. Blank lines between a marker and an anchor
+# are outside the replaced region, so they are dropped rather than added a second time
+# next to the file's own. An edit that doesn't begin with a marker starts at the top
+# of the file; one that doesn't end with a marker runs to the end of it. An edit without any marker is a single hunk located by its anchors.
+#
+# Original lines are indexed once per call in a dict (normalized anchor text -> sorted
+# line numbers). Every anchor lookup is a hash probe plus a bisect, not a rescan. An anchor
+# line that occurs more than once is disambiguated by how many of the neighbouring
+# hunk lines also match around each occurrence (and, for end anchors, by how well the
+# distance from the start anchor matches the hunk). If that doesn't single out one place,
+# the edit is rejected with a report listing the candidate line numbers. Nothing is
+# guessed. All hunks are resolved first, then the new file is built in one pass and
+# written atomically.
+
+import os
+import re
+import tempfile
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+
+MARKER_PATTERN = re.compile(r"^\s*(?:#|//|--|;|/\*+|\*|<!--)?\s*(?:\.\.\.|…)\s*existing code\b.*$", re.IGNORECASE)
+# Candidate line numbers listed in an ambiguity report
+MAX_REPORTED_CANDIDATES = 5
+
+
+class EditError(Exception):
+    """The edit can't be applied unambiguously; the message explains why."""
+
+
+@dataclass
+class Hunk:
+    number: int
+    lines: list[str]
+    # 1-based line in code_edit where the hunk starts, for error messages
+    edit_line: int
+    anchored_start: bool
+    anchored_end: bool
+
+
+@dataclass
+class ResolvedHunk:
+    hunk: Hunk
+    # Half-open range of original lines replaced by the hunk
+    start: int
+    end: int
+
+
+def _normalize(line: str) -> str:
+    return line.strip()
+
+
+def _make_hunk(number: int, lines: list[str], edit_line: int, anchored_start: bool, anchored_end: bool) -> Hunk:
+    """A hunk without the blank lines outside its anchors (kept if it has nothing else)."""
+    non_blank = [i for i, line in enumerate(lines) if line.strip()]
+    if non_blank:
+        first = non_blank[0] if anchored_start else 0
+        last = non_blank[-1] if anchored_end else len(lines) - 1
+        lines, edit_line = lines[first:last + 1], edit_line + first
+    return Hunk(number, lines, edit_line, anchored_start, anchored_end)
+
+
+def parse_hunks(code_edit: str) -> list[Hunk]:
+    edit_lines = code_edit.strip("\n").split("\n")
+    hunks: list[Hunk] = []
+    current: list[str] = []
+    current_start = 1
+    seen_marker = False
+    for number, line in enumerate(edit_lines, start=1):
+        if MARKER_PATTERN.match(line):
+            if current:
+                hunks.append(_make_hunk(len(hunks) + 1, current, current_start, anchored_start=seen_marker, anchored_end=True))
+                current = []
+            seen_marker = True
+            current_start = number + 1
+        else:
+            if not current:
+                current_start = number
+            current.append(line.rstrip("\r"))
+    if current:
+        # Without any marker the snippet is located by its own lines, like a hunk
+        # between two markers (use write_file to replace a whole file)
+        hunks.append(_make_hunk(len(hunks) + 1, current, current_start, anchored_start=True, anchored_end=not seen_marker))
+    return hunks
+
+
+class LineIndex:
+    """Normalized original lines and where each anchor text occurs.
+
+    Only the texts in `keys` (the hunk edges, the only lines ever looked up) get
+    position lists; indexing every line of a large file costs several times more.
+    """
+
+    def __init__(self, lines: list[str], keys: set[str]):
+        self.normalized = [_normalize(line) for line in lines]
+        self.positions: dict[str, list[int]] = {key: [] for key in keys if key}
+        positions = self.positions
+        for i, text in enumerate(self.normalized):
+            if text in positions:
+                positions[text].append(i)
+
+    def occurrences(self, text: str, lo: int, hi: int) -> list[int]:
+        """Line numbers in [lo, hi) whose normalized text is `text`."""
+        positions = self.positions.get(text)
+        if not positions:
+            return []
+        return positions[bisect_left(positions, lo):bisect_left(positions, hi)]
+
+
+def _forward_score(index: LineIndex, hunk_norm: list[str], i: int, pos: int) -> int:
+    score = 0
+    while i + score < len(hunk_norm) and pos + score < len(index.normalized) and hunk_norm[i + score] == index.normalized[pos + score]:
+        score += 1
+    return score
+
+
+def _backward_score(index: LineIndex, hunk_norm: list[str], j: int, pos: int, i_min: int, pos_min: int) -> int:
+    score = 0
+    while j - score >= i_min and pos - score >= pos_min and hunk_norm[j - score] == index.normalized[pos - score]:
+        score += 1
+    return score
+
+
+def _pick(candidates: list[int], scores: list, hunk: Hunk, hunk_line: int, text: str, lo: int, role: str) -> int:
+    best = max(scores)
+    winners = [c for c, s in zip(candidates, scores) if s == best]
+    if len(winners) == 1:
+        return winners[0]
+    shown = ", ".join(str(c + 1) for c in winners[:MAX_REPORTED_CANDIDATES])
+    more = f" and {len(winners) - MAX_REPORTED_CANDIDATES} more" if len(winners) > MAX_REPORTED_CANDIDATES else ""
+    raise EditError(
+        f"Ambiguous edit: the {role} line of hunk {hunk.number} ({text!r}, edit line {hunk.edit_line + hunk_line}) "
+        f"matches {len(winners)} places in the file after line {lo}: lines {shown}{more}. "
+        "Include more unchanged lines around it so it matches exactly one place."
+    )
+
+
+def resolve_hunks(index: LineIndex, hunks: list[Hunk]) -> list[ResolvedHunk]:
+    n = len(index.normalized)
+    resolved: list[ResolvedHunk] = []
+    lo = 0
+    for hunk in hunks:
+        hunk_norm = [_normalize(line) for line in hunk.lines]
+        non_blank = [i for i, text in enumerate(hunk_norm) if text]
+        if not non_blank:
+            raise EditError(f"Hunk {hunk.number} (edit line {hunk.edit_line}) only contains blank lines.")
+        first, last = non_blank[0], non_blank[-1]
+
+        if not hunk.anchored_start:
+            start = 0
+        else:
+            text = hunk_norm[first]
+            candidates = index.occurrences(text, lo, n)
+            if not candidates:
+                raise EditError(
+                    f"The first line of hunk {hunk.number} ({text!r}, edit line {hunk.edit_line + first}) "
+                    f"doesn't exist in the file after line {lo}. Start each edited block with the unchanged "
+                    "line just before your change, so it is clear where the change goes."
+                )
+            scores = [_forward_score(index, hunk_norm, first, c) for c in candidates]
+            start = _pick(candidates, scores, hunk, first, text, lo, "first")
+
+        if not hunk.anchored_end:
+            end = n
+        elif last == first and hunk.anchored_start:
+            # A one-line hunk replaces its anchor line
+            end = start + 1
+        else:
+            text = hunk_norm[last]
+            candidates = index.occurrences(text, start, n)
+            if not candidates:
+                raise EditError(
+                    f"The last line of hunk {hunk.number} ({text!r}, edit line {hunk.edit_line + last}) "
+                    f"doesn't exist in the file after line {start}. End each edited block with the unchanged "
+                    "line just after your change, so it is clear which original lines are replaced."
+                )
+            # Among equally good matches prefer the one whose distance from the start
+            # anchor is closest to the hunk's own span
+            scores = [
+                (_backward_score(index, hunk_norm, last, c, first, start), -abs((c - start) - (last - first)))
+                for c in candidates
+            ]
+            end = _pick(candidates, scores, hunk, last, text, start, "last") + 1
+
+        resolved.append(ResolvedHunk(hunk, start, end))
+        lo = end
+    return resolved
+
+
+def apply_edit(original: str, code_edit: str) -> tuple[str, list[ResolvedHunk]]:
+    """Returns the edited text and the resolved hunks; raises EditError."""
+    hunks = parse_hunks(code_edit)
+    if not hunks:
+        raise EditError("The edit contains no code, only 'existing code' markers.")
+    newline = "\r\n" if "\r\n" in original else "\n"
+    original_lines = original.splitlines(keepends=True)
+    keys = set()
+    for hunk in hunks:
+        edges = [_normalize(line) for line in hunk.lines if line.strip()]
+        keys.update(edges[:1] + edges[-1:])
+    index = LineIndex(original_lines, keys)
+    resolved = resolve_hunks(index, hunks)
+
+    parts: list[str] = []
+    cursor = 0
+    for r in resolved:
+        parts.extend(original_lines[cursor:r.start])
+        parts.append(newline.join(r.hunk.lines) + newline)
+        cursor = r.end
+    parts.extend(original_lines[cursor:])
+    text = "".join(parts)
+    if cursor == len(original_lines) and original and not original.endswith(("\n", "\r")):
+        # The last hunk ran to the end of a file without a trailing newline; keep it that way
+        text = text[: -len(newline)]
+    return text, resolved
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """Writes via a temp file in the same directory and renames it over `path`, so
+    readers never see a half-written file."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_name, os.stat(path).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def describe(resolved: list[ResolvedHunk]) -> str:
+    parts = []
+    for r in resolved:
+        if r.end > r.start:
+            span = f"lines {r.start + 1}-{r.end}"
+        else:
+            span = f"insertion before line {r.start + 1}"
+        parts.append(f"hunk {r.hunk.number}: {span} -> {len(r.hunk.lines)} line(s)")
+    return "; ".join(parts)
@@ -0,0 +1,140 @@
+# Windowed file reads backed by mmap and a cached line-offset index.
+#
+# FileReadTool used to read a fixed 5000-char prefix of a file (and then the rest of it
+# just to decide whether to print a truncation note). Here a file is mmapped and we
+# build, once per (mtime, size), an array of the byte offset at which each line starts.
+# Reading "lines 48000-48200" is then two array lookups and a slice of the mapping.
+
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from src.tools.write_events import on_file_written
+
+# Number of per-file line indexes kept in memory (each costs 8 bytes per line).
+LINE_INDEX_CACHE_SIZE = 64
+
+
+@dataclass
+class FileWindow:
+    """A slice of a file plus the information needed to request the next one."""
+    text: str
+    unit: str  # "lines" or "bytes"
+    start: int  # first line (0-based) or byte offset returned
+    end: int  # one past the last line / byte returned
+    total_lines: int
+    total_bytes: int
+    # True when a single line was longer than the char budget and had to be cut
+    clipped: bool = False
+
+    @property
+    def next_offset(self) -> Optional[int]:
+        total = self.total_lines if self.unit == "lines" else self.total_bytes
+        return self.end if self.end < total else None
+
+
+class _LineIndex:
+    __slots__ = ("mtime_ns", "size", "offsets")
+
+    def __init__(self, mtime_ns: int, size: int, offsets: array):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        # offsets[i] is the byte offset where line i starts; offsets[-1] == size (sentinel)
+        self.offsets = offsets
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) - 1
+
+
+_cache: "OrderedDict[str, _LineIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _build_offsets(mm: mmap.mmap, size: int) -> array:
+    offsets = array("Q", [0])
+    find = mm.find
+    pos = find(b"\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    # A trailing newline does not start a new line; a missing one still ends the last line.
+    if offsets[-1] != size:
+        offsets.append(size)
+    return offsets
+
+
+def get_line_index(path: Path, mm: Optional[mmap.mmap], stat: os.stat_result) -> _LineIndex:
+    """Returns the cached line index for `path`, rebuilding it if mtime or size changed."""
+    key = str(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            _cache.move_to_end(key)
+            return cached
+
+    offsets = _build_offsets(mm, stat.st_size) if mm is not None else array("Q", [0])
+    index = _LineIndex(stat.st_mtime_ns, stat.st_size, offsets)
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > LINE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+@on_file_written
+def invalidate(path: Path) -> None:
+    """Drops the cached line index for a file (e.g. after the agent wrote it)."""
+    with _cache_lock:
+        _cache.pop(str(path), None)
+
+
+def read_window(path: Path, offset: int = 0, limit: int = 200, unit: str = "lines", max_chars: Optional[int] = None) -> FileWindow:
+    """Reads `limit` lines (or bytes) of `path` starting at `offset`.
+
+    Only the requested window is decoded. When `max_chars` is set and the window is larger,
+    the window is shortened (at a line boundary in "lines" mode) so `next_offset` always
+    points at the first unread line/byte.
+    """
+    if unit not in ("lines", "bytes"):
+        raise ValueError(f"unit must be 'lines' or 'bytes', got {unit!r}")
+    offset = max(0, offset)
+    limit = max(1, limit)
+
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            # mmap cannot map empty files
+            return FileWindow("", unit, 0, 0, 0, 0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = get_line_index(path, mm, stat)
+            offsets = index.offsets
+            total_lines = index.line_count
+
+            if unit == "bytes":
+                start = min(offset, stat.st_size)
+                end = min(start + limit, stat.st_size)
+                if max_chars is not None:
+                    end = min(end, start + max_chars)
+                text = mm[start:end].decode("utf-8", errors="replace")
+                return FileWindow(text, unit, start, end, total_lines, stat.st_size)
+
+            start = min(offset, total_lines)
+            end = min(start + limit, total_lines)
+            if max_chars is not None and end > start and offsets[end] - offsets[start] > max_chars:
+                # Bytes are an upper bound on decoded chars; keep the whole lines that fit.
+                end = max(start + 1, bisect_right(offsets, offsets[start] + max_chars, start + 1, end + 1) - 1)
+            text = mm[offsets[start]:offsets[end]].decode("utf-8", errors="replace")
+            clipped = False
+            if max_chars is not None and len(text) > max_chars:
+                # A single line longer than the budget; cut it rather than return nothing.
+                text = text[:max_chars]
+                clipped = True
+            return FileWindow(text, unit, start, end, total_lines, stat.st_size, clipped)
@@ -1,83 +1,237 @@
 # Placeholder for tool definitions 
 
+import contextvars
 import os
 import subprocess
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from pydantic.v1 import BaseModel, Field # Use v1 for Langchain compatibility
-from typing import Type
+from typing import Iterator, List, Optional, Type
 
 from langchain.tools import BaseTool
+from langgraph.config import get_config
+
+from src.journal import journal_directories, journal_for
+from src.tools.async_execution import run_subprocess, run_tool_in_pool, ToolTimeoutError
+from src.tools.edit_engine import EditError, apply_edit, describe, write_atomic
+from src.tools.file_index import read_window
+from src.tools.output_budget import budget_chars, continue_page, format_search_output, format_search_page, parse_search_output
+from src.tools.result_cache import TOOL_RESULT_CACHE, SEARCH_RESULT_TTL, stat_signature
+from src.tools.search_index import get_search_index, start_background_build
+from src.tools.tree_listing import TREE_SNAPSHOTS, format_page
+from src.tools.write_events import notify_file_written
 
 # Define common base path (workspace root relative to this file)
 # Adjust this if your execution context changes
 WORKSPACE_ROOT = Path(__file__).parent.parent.parent
 
+# Per-run override of WORKSPACE_ROOT (speculative attempts each work in their own copy,
+# see src/workspaces.py). A ContextVar, so it follows a run through LangGraph's tasks.
+_workspace_override: contextvars.ContextVar[Optional[Path]] = contextvars.ContextVar("aspen_workspace_root", default=None)
+
+
+def workspace_root() -> Path:
+    """The workspace the tools operate on in the current run."""
+    override = _workspace_override.get()
+    return override if override is not None else WORKSPACE_ROOT
+
+
+@contextmanager
+def use_workspace(root: Path) -> Iterator[None]:
+    """Points every tool call made inside the block (and in tasks spawned from it) at `root`."""
+    token = _workspace_override.set(Path(root).resolve())
+    try:
+        yield
+    finally:
+        _workspace_override.reset(token)
+
+def _run_ids() -> tuple[Optional[str], Optional[str]]:
+    """(thread id, checkpoint id) of the graph step making the current tool call, for
+    the mutation journal. (None, None) outside a graph run."""
+    try:
+        configurable = get_config().get("configurable", {})
+    except RuntimeError:
+        return None, None
+    # checkpoint_map[""] is the checkpoint the step runs from
+    return configurable.get("thread_id"), (configurable.get("checkpoint_map") or {}).get("")
+
+
+def _in_journal(full_path: Path) -> bool:
+    """True for paths under a mutation journal's directory, which only the journal
+    itself may write (its log is appended through an open file handle)."""
+    directories = journal_directories()
+    return bool(directories) and any(d == full_path or d in full_path.parents for d in directories)
+
+
+def _write_file(root: Path, full_path: Path, content: str) -> None:
+    """Writes through the workspace's mutation journal when it has one (see
+    src/journal.py), atomically either way."""
+    journal = journal_for(root)
+    if journal is not None:
+        thread_id, checkpoint_id = _run_ids()
+        journal.write(full_path, content, thread_id=thread_id, checkpoint_id=checkpoint_id)
+    else:
+        # Replace rather than truncate: the file may be hardlinked into an
+        # attempt workspace (or the original), which must not see this write
+        write_atomic(full_path, content)
+
+# read_file defaults: lines per call and a hard cap on characters returned per call
+# (the per-call tool output budget, see output_budget.py)
+READ_DEFAULT_LIMIT = 200
+READ_MAX_CHARS = budget_chars()
+
+# Levels a recursive list_directory descends by default
+LIST_DEFAULT_DEPTH = 8
+
+# Backend for search_file_content: "rg" spawns ripgrep per call, "index" answers from an
+# in-process trigram index of the workspace (falling back to rg when it can't)
+SEARCH_BACKEND = os.environ.get("ASPEN_SEARCH_BACKEND", "rg")
+
 
 class FilePathInput(BaseModel):
     file_path: str = Field(description="Relative path to the file within the workspace")
 
+class FileReadInput(BaseModel):
+    file_path: str = Field(description="Relative path to the file within the workspace")
+    offset: int = Field(description="0-based line (or byte) offset to start reading from. Pass the 'next_offset' from a previous read to continue.", default=0)
+    limit: int = Field(description="Maximum number of lines (or bytes) to read", default=READ_DEFAULT_LIMIT)
+    unit: str = Field(description="Either 'lines' (default) or 'bytes'", default="lines")
+
 class ListDirectoryInput(BaseModel):
     dir_path: str = Field(description="Relative path to the directory within the workspace", default=".")
+    recursive: bool = Field(description="List the whole tree below the directory (skipping .gitignore'd paths) instead of one level", default=False)
+    max_depth: int = Field(description="With recursive, how many levels to descend", default=LIST_DEFAULT_DEPTH)
+    exclude: List[str] = Field(description="Glob patterns (.gitignore syntax, e.g. '*.lock', 'dist/') of paths to leave out", default_factory=list)
+    include_details: bool = Field(description="Also show file sizes and modification times", default=False)
+    cursor: Optional[str] = Field(description="Pass the 'next_cursor' from a previous listing to get the next page", default=None)
 
 class GrepInput(BaseModel):
     pattern: str = Field(description="The regex pattern to search for")
     path: str = Field(description="Relative path to the file or directory to search within", default=".")
+    continuation: Optional[str] = Field(description="Pass the continuation value from a previous search to get its next page (the search isn't run again)", default=None)
 
 
 class FileReadTool(BaseTool):
     name: str = "read_file"
-    description: str = "Reads the content of a specified file. Input should be the relative path to the file."
-    args_schema: Type[BaseModel] = FilePathInput
+    description: str = (
+        "Reads a window of a specified file. Input requires 'file_path' (relative path) and optionally "
+        "'offset' and 'limit' (in lines by default, or bytes with unit='bytes'). "
+        "The result ends with the total line count and the 'next_offset' to pass back to read the next window."
+    )
+    args_schema: Type[BaseModel] = FileReadInput
 
-    def _run(self, file_path: str) -> str:
-        """Reads a file."""
+    def _run(self, file_path: str, offset: int = 0, limit: int = READ_DEFAULT_LIMIT, unit: str = "lines") -> str:
+        """Reads a window of a file."""
         try:
-            full_path = (WORKSPACE_ROOT / file_path).resolve()
+            root = workspace_root()
+            full_path = (root / file_path).resolve()
             # Security check: Ensure the path is within the workspace root
-            if WORKSPACE_ROOT not in full_path.parents and full_path != WORKSPACE_ROOT:
+            if root not in full_path.parents and full_path != root:
                  return f"Error: Access denied. Path is outside the allowed workspace: {file_path}"
             if not full_path.is_file():
                 return f"Error: File not found at {file_path}"
-            with open(full_path, 'r', encoding='utf-8') as f:
-                # Limit read size for safety, consider adding start/end lines later
-                content = f.read(5000) # Limit to 5000 chars for now
-                if len(f.read()) > 0:
-                    content += "\n... (file truncated due to length)"
-                return content
+            if unit not in ("lines", "bytes"):
+                return f"Error: unit must be 'lines' or 'bytes', got '{unit}'"
+
+            cache_args = (str(full_path), offset, limit, unit)
+            cached = TOOL_RESULT_CACHE.get(self.name, cache_args)
+            if cached is not None:
+                return cached
+            signature = stat_signature(full_path)
+            started = time.perf_counter()
+
+            window = read_window(full_path, offset, limit, unit, max_chars=READ_MAX_CHARS)
+            content = window.text
+            if content and not content.endswith("\n"):
+                content += "\n"
+            if window.clipped:
+                content += "... (line truncated due to length)\n"
+
+            if window.total_bytes == 0:
+                return "(empty file)"
+            if unit == "lines":
+                summary = f"[lines {window.start}-{max(window.start, window.end - 1)} of {window.total_lines} (0-based)"
+            else:
+                summary = f"[bytes {window.start}-{window.end} of {window.total_bytes}; {window.total_lines} lines"
+            if window.next_offset is not None:
+                summary += f"; next_offset={window.next_offset}]"
+            else:
+                summary += "; end of file]"
+            result = content + summary
+            TOOL_RESULT_CACHE.put(self.name, cache_args, result, deps=[full_path], signatures=[signature],
+                                  compute_seconds=time.perf_counter() - started)
+            return result
         except Exception as e:
             return f"Error reading file {file_path}: {e}"
 
-    async def _arun(self, file_path: str) -> str:
-        # For now, just use the sync version. Can implement async file IO later if needed.
-        return self._run(file_path)
+    async def _arun(self, file_path: str, offset: int = 0, limit: int = READ_DEFAULT_LIMIT, unit: str = "lines") -> str:
+        # Run the blocking read in the tool I/O pool so it doesn't stall the event loop.
+        try:
+            return await run_tool_in_pool(self.name, self._run, file_path, offset, limit, unit)
+        except ToolTimeoutError as e:
+            return f"Error reading file {file_path}: {e}"
 
 
 class ListDirectoryTool(BaseTool):
     name: str = "list_directory"
-    description: str = "Lists the contents (files and directories) of a specified directory. Input is the relative path to the directory."
+    description: str = (
+        "Lists the contents (files and directories) of a specified directory. Input is the relative path to the directory. "
+        "Set 'recursive' to map a whole subtree in one call (paths ignored by .gitignore are skipped). "
+        "Long listings are paged: pass the returned 'next_cursor' to continue."
+    )
     args_schema: Type[BaseModel] = ListDirectoryInput
 
-    def _run(self, dir_path: str = ".") -> str:
+    def _run(
+        self,
+        dir_path: str = ".",
+        recursive: bool = False,
+        max_depth: int = LIST_DEFAULT_DEPTH,
+        exclude: Optional[List[str]] = None,
+        include_details: bool = False,
+        cursor: Optional[str] = None,
+    ) -> str:
         """Lists directory contents."""
         try:
-            full_path = (WORKSPACE_ROOT / dir_path).resolve()
+            root = workspace_root()
+            full_path = (root / dir_path).resolve()
             # Security check
-            if WORKSPACE_ROOT not in full_path.parents and full_path != WORKSPACE_ROOT:
+            if root not in full_path.parents and full_path != root:
                  return f"Error: Access denied. Path is outside the allowed workspace: {dir_path}"
             if not full_path.is_dir():
                 return f"Error: Directory not found at {dir_path}"
 
-            items = []
-            for item in os.listdir(full_path):
-                item_path = full_path / item
-                item_type = "[dir]" if item_path.is_dir() else "[file]"
-                items.append(f"{item_type} {item}")
-            return "\n".join(items) if items else "Directory is empty."
+            # Snapshots are cached and re-validated by directory mtimes (see tree_listing.py)
+            snapshot = TREE_SNAPSHOTS.get(
+                full_path,
+                max_depth=max(1, max_depth) if recursive else 1,
+                excludes=tuple(exclude or ()),
+                use_gitignore=recursive,
+                details=include_details,
+                workspace_root=root,
+            )
+            try:
+                return format_page(snapshot, cursor, include_details, max_chars=budget_chars())
+            except ValueError:
+                return f"Error: Invalid cursor '{cursor}'. Pass the next_cursor value from the previous listing."
         except Exception as e:
             return f"Error listing directory {dir_path}: {e}"
 
-    async def _arun(self, dir_path: str = ".") -> str:
-        return self._run(dir_path)
+    async def _arun(
+        self,
+        dir_path: str = ".",
+        recursive: bool = False,
+        max_depth: int = LIST_DEFAULT_DEPTH,
+        exclude: Optional[List[str]] = None,
+        include_details: bool = False,
+        cursor: Optional[str] = None,
+    ) -> str:
+        try:
+            return await run_tool_in_pool(
+                self.name, self._run, dir_path, recursive, max_depth, exclude, include_details, cursor
+            )
+        except ToolTimeoutError as e:
+            return f"Error listing directory {dir_path}: {e}"
 
 
 class GrepTool(BaseTool):
@@ -85,39 +239,144 @@ class GrepTool(BaseTool):
     description: str = (
         "Searches for a specific regex pattern within a file or directory using ripgrep (rg). "
         "Input requires 'pattern' (regex) and optionally 'path' (relative path, default is current directory '.'). "
-        "Remember to escape regex special characters in the pattern if needed."
+        "Remember to escape regex special characters in the pattern if needed. "
+        "Matches are grouped by file, with the most relevant files first. Long results are paged: "
+        "pass the returned 'continuation' (with the same pattern) to get the next page."
     )
     args_schema: Type[BaseModel] = GrepInput
 
-    def _run(self, pattern: str, path: str = ".") -> str:
-        """Uses ripgrep (rg) to search for a pattern."""
+    def _resolve(self, path: str):
+        """Returns (full_path, None) or (None, error message) for the search path."""
+        root = workspace_root()
+        full_path = (root / path).resolve()
+        # Security check
+        if root not in full_path.parents and full_path != root:
+            return None, f"Error: Access denied. Path is outside the allowed workspace: {path}"
+        return full_path, None
+
+    def _build_command(self, pattern: str, full_path: Path) -> list[str]:
+        # Basic command construction (consider adding more rg flags like --max-count, --glob)
+        # Always "path<NUL>line:text", even for a single file, so results can be grouped by
+        # file; the NUL (not ':') ends the path, so paths containing ':' parse correctly
+        return ["rg", "--max-count=50", "--line-number", "--with-filename", "--no-heading", "--color=never",
+                "--null", "--glob=!{.git,node_modules,.venv/*}", "-e", pattern, str(full_path)]
+
+    def _format_result(self, returncode: int, stdout: str, stderr: str) -> str:
+        if returncode == 0:
+            return stdout if stdout else "Pattern found, but no specific lines matched (or rg configuration hides them)."
+        elif returncode == 1:
+            return "Pattern not found."
+        else:
+            return f"Error running grep (ripgrep): {stderr}"
+
+    def _present(self, output: str, full_path: Path) -> str:
+        """Turns the raw hits (as cached) into the first page within the output budget."""
+        if output.startswith("Error") or output == "Pattern not found.":
+            return output
+        hits = parse_search_output(output, workspace_root())
+        if not hits:
+            return output
+        return format_search_page(self.name, hits, full_path)
+
+    def _continue(self, continuation: str) -> str:
+        page = continue_page(self.name, continuation)
+        if page is None:
+            return (f"Error: Unknown or expired continuation '{continuation}' (results are dropped after a while "
+                    "or when files under the searched path are written). Run the search again.")
+        return page
+
+    def _cache_get(self, pattern: str, full_path: Path):
+        return TOOL_RESULT_CACHE.get(self.name, (pattern, str(full_path)))
+
+    def _cache_put(self, pattern: str, full_path: Path, result: str, signature, compute_seconds: float) -> None:
+        if result.startswith("Error"):
+            return
+        if full_path.is_dir():
+            # Results depend on every file below full_path: scope the entry to the directory
+            # so tool writes under it invalidate it, and expire it to bound external edits.
+            TOOL_RESULT_CACHE.put(self.name, (pattern, str(full_path)), result, deps=[full_path],
+                                  signatures=[signature], scopes=[full_path], ttl=SEARCH_RESULT_TTL,
+                                  compute_seconds=compute_seconds)
+        else:
+            TOOL_RESULT_CACHE.put(self.name, (pattern, str(full_path)), result, deps=[full_path],
+                                  signatures=[signature], compute_seconds=compute_seconds)
+
+    def _search_index(self, pattern: str, full_path: Path):
+        """Answers the query from the workspace search index. Returns None if the index is
+        disabled, still building, or can't handle this pattern, so the caller uses rg."""
+        if SEARCH_BACKEND != "index":
+            return None
+        root = workspace_root()
+        index = get_search_index(root)
+        if not index.ready:
+            start_background_build(root)
+            return None
+        matches = index.search(pattern, full_path)
+        if matches is None:
+            return None
+        if not matches:
+            return "Pattern not found."
+        # Same text as rg's, so both backends' results are cached and paged alike
+        return format_search_output(
+            (os.path.relpath(match_path, root), line_number, line) for match_path, line_number, line in matches
+        )
+
+    def _run(self, pattern: str, path: str = ".", continuation: Optional[str] = None) -> str:
+        """Searches for a pattern with the search index, or ripgrep (rg) as the fallback."""
         try:
-            full_path = (WORKSPACE_ROOT / path).resolve()
-            # Security check
-            if WORKSPACE_ROOT not in full_path.parents and full_path != WORKSPACE_ROOT:
-                 return f"Error: Access denied. Path is outside the allowed workspace: {path}"
-
-            # Basic command construction (consider adding more rg flags like --max-count, --glob)
-            command = ["rg", "--max-count=50", "--glob=!{.git,node_modules,.venv/*}", "-e", pattern, str(full_path)]
-
-            result = subprocess.run(command, capture_output=True, text=True, check=False, cwd=WORKSPACE_ROOT)
-
-            if result.returncode == 0:
-                return result.stdout if result.stdout else "Pattern found, but no specific lines matched (or rg configuration hides them)."
-            elif result.returncode == 1:
-                return "Pattern not found."
-            else:
-                return f"Error running grep (ripgrep): {result.stderr}"
+            if continuation:
+                return self._continue(continuation)
+            full_path, error = self._resolve(path)
+            if error:
+                return error
+
+            cached = self._cache_get(pattern, full_path)
+            if cached is not None:
+                return self._present(cached, full_path)
+            signature = stat_signature(full_path)
+            started = time.perf_counter()
+
+            output = self._search_index(pattern, full_path)
+            if output is None:
+                command = self._build_command(pattern, full_path)
+                result = subprocess.run(command, capture_output=True, text=True, check=False, cwd=workspace_root())
+                output = self._format_result(result.returncode, result.stdout, result.stderr)
+            self._cache_put(pattern, full_path, output, signature, time.perf_counter() - started)
+            return self._present(output, full_path)
         except FileNotFoundError:
              return "Error: 'rg' (ripgrep) command not found. Please ensure ripgrep is installed and in your PATH."
         except Exception as e:
             return f"Error running grep: {e}"
 
-    async def _arun(self, pattern: str, path: str = ".") -> str:
-        # Subprocess can be tricky to make truly async without asyncio.subprocess
-        # For now, we run it synchronously in the async context
-        # Consider libraries like 'asyncio.subprocess' or 'anyio' for true async later
-        return self._run(pattern, path)
+    async def _arun(self, pattern: str, path: str = ".", continuation: Optional[str] = None) -> str:
+        """Runs ripgrep via asyncio.subprocess so the event loop keeps streaming while it searches.
+        The rg process is killed if the call times out or is cancelled."""
+        try:
+            if continuation:
+                return self._continue(continuation)
+            full_path, error = self._resolve(path)
+            if error:
+                return error
+
+            cached = self._cache_get(pattern, full_path)
+            if cached is not None:
+                return self._present(cached, full_path)
+            signature = stat_signature(full_path)
+            started = time.perf_counter()
+
+            output = None
+            if SEARCH_BACKEND == "index":
+                output = await run_tool_in_pool(self.name, self._search_index, pattern, full_path)
+            if output is None:
+                command = self._build_command(pattern, full_path)
+                returncode, stdout, stderr = await run_subprocess(self.name, command, cwd=workspace_root())
+                output = self._format_result(returncode, stdout, stderr)
+            self._cache_put(pattern, full_path, output, signature, time.perf_counter() - started)
+            return self._present(output, full_path)
+        except FileNotFoundError:
+             return "Error: 'rg' (ripgrep) command not found. Please ensure ripgrep is installed and in your PATH."
+        except Exception as e:
+            return f"Error running grep: {e}"
 
 # --- New Tools --- 
 
@@ -133,28 +392,32 @@ class FileWriteTool(BaseTool):
     def _run(self, file_path: str, content: str) -> str:
         """Writes content to a file, overwriting if it exists."""
         try:
-            full_path = (WORKSPACE_ROOT / file_path).resolve()
+            root = workspace_root()
+            full_path = (root / file_path).resolve()
             # Security check: Ensure the path is within the workspace root and not manipulating directories above
-            if WORKSPACE_ROOT not in full_path.parents and full_path.parent != WORKSPACE_ROOT:
+            if root not in full_path.parents and full_path.parent != root:
                  return f"Error: Access denied. Path is outside the allowed workspace or attempts directory traversal: {file_path}"
+            if _in_journal(full_path):
+                return f"Error: Access denied. Path is inside the write journal: {file_path}"
             
             # Create parent directories if they don't exist
             full_path.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            _write_file(root, full_path, content)
+            notify_file_written(full_path)
             return f"Successfully wrote content to {file_path}"
         except Exception as e:
             return f"Error writing file {file_path}: {e}"
 
     async def _arun(self, file_path: str, content: str) -> str:
-        return self._run(file_path, content)
+        # No timeout (see TOOL_LIMITS): the result always reflects whether the write happened
+        return await run_tool_in_pool(self.name, self._run, file_path, content)
 
 
 class FileEditInput(BaseModel):
     file_path: str = Field(description="Relative path to the file within the workspace to edit.")
     code_edit: str = Field(
-        description="The precise code changes to apply. Use comments like '# ... existing code ...' (adjusting for language) to represent unchanged sections between your edits. The tool will replace sections of the original file based on this structure."
+        description="The precise code changes to apply. Use comments like '# ... existing code ...' (adjusting for language) to represent unchanged sections between your edits. Each edited section must start and end with an unchanged line from the file so it can be located; several sections can be edited in one call."
     )
 
 class FileEditTool(BaseTool):
@@ -163,6 +426,8 @@ class FileEditTool(BaseTool):
         "Applies structured code edits to an existing file. "
         "Takes a 'code_edit' string that specifies exact changes, using comments like '# ... existing code ...' "
         "(adjust comment style for the target language) to indicate unchanged blocks. "
+        "Start and end every edited block with an unchanged line of the original so it can be located; "
+        "if such a line occurs several times, include more surrounding lines. "
         "Use 'write_file' to create or fully replace a file. "
         "Input requires 'file_path' (relative path) and 'code_edit'."
     )
@@ -171,110 +436,32 @@ class FileEditTool(BaseTool):
     def _run(self, file_path: str, code_edit: str) -> str:
         """Applies structured edits to a file."""
         try:
-            full_path = (WORKSPACE_ROOT / file_path).resolve()
+            root = workspace_root()
+            full_path = (root / file_path).resolve()
             # Security check
-            if WORKSPACE_ROOT not in full_path.parents and full_path != WORKSPACE_ROOT:
+            if root not in full_path.parents and full_path != root:
                  return f"Error: Access denied. Path is outside the allowed workspace: {file_path}"
+            if _in_journal(full_path):
+                return f"Error: Access denied. Path is inside the write journal: {file_path}"
             if not full_path.is_file():
                 return f"Error: File not found at {file_path}"
 
-            # --- Read Original File --- 
-            with open(full_path, 'r', encoding='utf-8') as f:
-                original_lines = f.readlines()
-
-            # --- Parse code_edit and Apply Changes --- 
-            # Basic parsing assuming '# ... existing code ...' or similar standard comment markers
-            # A more robust parser would detect language and use appropriate comment syntax
-            # For now, we'll crudely look for lines starting with comment markers common in Python/JS/etc.
-            # and containing '... existing code ...'
-            import re
-            # Regex to find 'existing code' markers (e.g., #, //, /*, --) potentially with leading whitespace
-            marker_pattern = re.compile(r"^\\s*(#|//|--|\\\*\\*?|/\*).*existing code.*") 
-            
-            edit_lines = code_edit.strip().split('\n')
-            
-            new_file_lines = []
-            original_line_idx = 0
-            edit_line_idx = 0
-
-            while edit_line_idx < len(edit_lines):
-                edit_line = edit_lines[edit_line_idx]
-                is_marker = marker_pattern.match(edit_line)
-
-                if is_marker:
-                    # Find the next non-marker line in the edit
-                    next_edit_marker_idx = -1
-                    for i in range(edit_line_idx + 1, len(edit_lines)):
-                        if marker_pattern.match(edit_lines[i]):
-                            next_edit_marker_idx = i
-                            break
-                    
-                    # Determine corresponding lines in original file
-                    # This is the tricky part and relies on the LLM generating correct context.
-                    # A simple approach: Advance in original until the context *after* the marker matches.
-                    # This is fragile. A diff-based approach would be more robust but complex.
-                    
-                    # Heuristic: Assume the marker corresponds to the current position in original_lines
-                    # If the *next* line in edit_lines is also a marker, it implies skipping original lines.
-                    if edit_line_idx + 1 < len(edit_lines) and marker_pattern.match(edit_lines[edit_line_idx+1]):
-                         # LLM wants to skip some original code block
-                         # We need a way to know how much to skip. This format doesn't specify explicitly.
-                         # Let's *assume* (dangerous!) the LLM provided the *next* block of code it wants *after* the skip.
-                         # We search forward in original_lines for the start of that next block.
-                         next_code_block_start_in_edit = ""
-                         for i in range(edit_line_idx + 2, len(edit_lines)):
-                            if not marker_pattern.match(edit_lines[i]):
-                                next_code_block_start_in_edit = edit_lines[i]
-                                break
-                        
-                         if next_code_block_start_in_edit:
-                             found_match = False
-                             search_start_idx = original_line_idx
-                             while original_line_idx < len(original_lines):
-                                 if original_lines[original_line_idx].strip() == next_code_block_start_in_edit.strip():
-                                      # Found the start of the next block LLM wants, skip complete.
-                                      found_match = True
-                                      break
-                                 original_line_idx += 1
-                             if not found_match:
-                                 # If we can't find the next block, the edit is likely ambiguous/malformed
-                                 original_line_idx = search_start_idx # backtrack search
-                                 return f"Error: Ambiguous edit. Could not determine how much original code to skip based on marker at edit line {edit_line_idx + 1}. Edit:\n{code_edit}"
-                         else: 
-                             # Two markers in a row, but no code after? Assume skip to end of original file.
-                             original_line_idx = len(original_lines) 
-                   
-                    edit_line_idx += 1 # Consume the marker line
-                else:
-                    # This is a line of new/edited code to add
-                    new_file_lines.append(edit_line + '\n')
-                    edit_line_idx += 1
-                    # Crucially, when adding new code, we *don't* advance original_line_idx
-                    # unless the LLM explicitly used markers to skip original lines.
-                    # This assumes insertions/replacements happen *in place* conceptually.
-                    # If the LLM intended replacement, it should have marked the code to be replaced
-                    # with markers before and after the replacement block. 
-                    # If the edit implies replacing original lines *without markers*, this simple logic fails.
-                    # We might need to *advance* original_line_idx if we are conceptually *replacing* 
-                    # based on context, but that's hard to infer reliably without diff/patch logic.
-                    # For now, let's stick to the simpler interpretation: Markers skip, code adds/inserts.
-                   
-            # After processing edit lines, append any remaining original lines if the edit didn't end with a skip-to-end
-            # Check if the last processed edit line was NOT a marker implying skip-to-end
-            last_line_was_marker = marker_pattern.match(edit_lines[-1]) if edit_lines else False
-            # This logic needs refinement: how do we know if the last marker meant skip *some* or skip *all remaining*?
-            # Heuristic: if the edit finished, and we haven't reached the end of original, append the rest.
-            if original_line_idx < len(original_lines):
-                 new_file_lines.extend(original_lines[original_line_idx:])
-
-            # --- Write New File Content --- 
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.writelines(new_file_lines)
-               
-            return f"Successfully applied edits to {file_path}"
+            with open(full_path, 'r', encoding='utf-8', newline='') as f:
+                original = f.read()
+
+            # Hunks are located by their unchanged first/last lines (see edit_engine.py)
+            try:
+                new_content, resolved = apply_edit(original, code_edit)
+            except EditError as e:
+                return f"Error editing file {file_path}: {e}"
+
+            _write_file(root, full_path, new_content)
+            notify_file_written(full_path)
+
+            return f"Successfully applied edits to {file_path} ({describe(resolved)})"
         except Exception as e:
             return f"Error editing file {file_path}: {e}\nEdit attempted:\n{code_edit}"
 
     async def _arun(self, file_path: str, code_edit: str) -> str:
-        # As this involves file I/O, run synchronously for now.
-        return self._run(file_path, code_edit) 
\ No newline at end of file
+        # No timeout (see TOOL_LIMITS): the result always reflects whether the edit happened
+        return await run_tool_in_pool(self.name, self._run, file_path, code_edit) 
\ No newline at end of file
@@ -0,0 +1,262 @@
+# Token budget for tool outputs, and continuation handles for the rest.
+#
+# Every tool result lands in the context and is prefilled again on each later step of
+# the run, so one unbounded search over a large tree can cost tens of thousands of
+# prompt tokens for the rest of the task. Each tool call therefore returns at most
+# TOOL_OUTPUT_TOKENS (estimated at ~4 chars/token, as in context_manager.py):
+#   - read_file caps its window at budget_chars() (and says where to continue)
+#   - list_directory ends its page when the budget is spent (next_cursor continues it)
+#   - search_file_content groups hits by file, ranks the files, elides long lines and
+#     returns the first page. What didn't fit is kept here, and the page ends with a
+#     continuation handle. Passing the handle back returns the next page from memory,
+#     without running the search again.
+#
+# Continuations are dropped after CONTINUATION_TTL seconds, when the store is full, or
+# when the tools write a file under the searched path (the kept lines would be stale).
+
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+from src.tools.write_events import on_file_written
+
+TOOL_OUTPUT_TOKENS = int(os.environ.get("ASPEN_TOOL_OUTPUT_TOKENS", "2000"))
+CHARS_PER_TOKEN = 4
+# Lines longer than this are shown as their head and tail (minified code, data files)
+MAX_LINE_CHARS = 240
+# Search hits shown per file before moving on to the next file; the remaining hits of
+# a file come after all files have been shown once
+PREVIEW_HITS_PER_FILE = 5
+# Ranking: a hit that looks like a definition counts as this many plain hits
+DEFINITION_WEIGHT = 5
+# Hits kept for paging; a search matching more is reported as truncated
+MAX_SEARCH_HITS = 20_000
+CONTINUATION_TTL = 600.0
+MAX_CONTINUATIONS = 128
+
+_DEFINITION = re.compile(
+    r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?"
+    r"(?:def|class|function|interface|type|enum|struct|fn|func|const|let|var)\b"
+)
+
+
+def budget_chars(tokens: Optional[int] = None) -> int:
+    """Characters a tool result may use for a budget of `tokens` (default TOOL_OUTPUT_TOKENS)."""
+    return max(1, tokens if tokens is not None else TOOL_OUTPUT_TOKENS) * CHARS_PER_TOKEN
+
+
+def elide_line(line: str, max_chars: int = MAX_LINE_CHARS) -> str:
+    """Keeps the head and tail of an over-long line and says how much was left out."""
+    if len(line) <= max_chars:
+        return line
+    keep = max_chars // 2
+    return f"{line[:keep]} ...[{len(line) - 2 * keep} chars]... {line[-keep:]}"
+
+
+@dataclass
+class Block:
+    """A group of output lines (e.g. the hits in one file) under a header line."""
+    header: str
+    lines: list[str]
+    # Hits (or entries) the lines stand for, for the "shown so far" count
+    count: int = 0
+
+
+@dataclass
+class Continuation:
+    tool_name: str
+    scope: Path
+    blocks: list[Block]
+    # Totals of the whole result and how much of it earlier pages showed
+    total_items: int
+    total_groups: int
+    shown_items: int = 0
+    page: int = 1
+    created: float = field(default_factory=time.monotonic)
+
+
+class ContinuationStore:
+    """Bounded, expiring map from opaque handles to the unshown rest of a tool result."""
+
+    def __init__(self, max_entries: int = MAX_CONTINUATIONS, ttl: float = CONTINUATION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Continuation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, continuation: Continuation) -> str:
+        handle = secrets.token_hex(4)
+        with self._lock:
+            self._entries[handle] = continuation
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return handle
+
+    def get(self, tool_name: str, handle: str) -> Optional[Continuation]:
+        """The continuation for `handle`. Handles stay valid until they expire, so a
+        repeated call returns the same page again."""
+        with self._lock:
+            continuation = self._entries.get(handle.strip())
+            if continuation is None or continuation.tool_name != tool_name:
+                return None
+            if time.monotonic() - continuation.created > self.ttl:
+                del self._entries[handle.strip()]
+                return None
+            self._entries.move_to_end(handle.strip())
+            return continuation
+
+    def invalidate_path(self, path: Path) -> None:
+        path = Path(path)
+        with self._lock:
+            for handle in [h for h, c in self._entries.items() if c.scope == path or c.scope in path.parents]:
+                del self._entries[handle]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+CONTINUATIONS = ContinuationStore()
+
+
+@on_file_written
+def _invalidate_written_path(path: Path) -> None:
+    CONTINUATIONS.invalidate_path(path)
+
+
+def take_page(blocks: list[Block], max_chars: int) -> tuple[list[str], int, list[Block]]:
+    """Fills a page with whole blocks, splitting the block that doesn't fit (its header
+    is repeated on the next page). Always takes at least one line so paging advances.
+
+    Returns (page lines, items shown, remaining blocks).
+    """
+    out: list[str] = []
+    used = 0
+    shown = 0
+    for i, block in enumerate(blocks):
+        header_cost = len(block.header) + 1
+        if out and used + header_cost + len(block.lines[0]) + 1 > max_chars:
+            return out, shown, blocks[i:]
+        out.append(block.header)
+        used += header_cost
+        for j, line in enumerate(block.lines):
+            if used + len(line) + 1 > max_chars and (j or len(out) > 1):
+                rest = Block(f"{block.header} (continued)", block.lines[j:], block.count - j)
+                shown += j
+                return out, shown, [rest] + blocks[i + 1:]
+            out.append(line)
+            used += len(line) + 1
+        shown += block.count
+    return out, shown, []
+
+
+def _footer(continuation: Continuation, handle: Optional[str], noun: str) -> str:
+    footer = f"[{continuation.shown_items} of {continuation.total_items} {noun} shown"
+    if handle is None:
+        return footer + "; end of results]"
+    return footer + f"; pass continuation='{handle}' for the next page]"
+
+
+def render_page(continuation: Continuation, max_chars: int, noun: str = "matches", intro: str = "") -> str:
+    """Renders the first page of `continuation` and stores what's left under a new handle."""
+    budget = max_chars - len(intro) - 80  # room for the footer
+    lines, shown, remaining = take_page(continuation.blocks, max(budget, 1))
+    rest = replace(continuation, blocks=remaining, shown_items=continuation.shown_items + shown,
+                   page=continuation.page + 1, created=time.monotonic())
+    handle = CONTINUATIONS.put(rest) if remaining else None
+    parts = [intro] if intro else []
+    parts.extend(lines)
+    parts.append(_footer(rest, handle, noun))
+    return "\n".join(parts)
+
+
+# --- search results ---
+
+
+def _rank(path: str, hits: list[tuple[int, str]]) -> tuple:
+    definitions = sum(1 for _, text in hits if _DEFINITION.match(text))
+    score = len(hits) + DEFINITION_WEIGHT * definitions
+    # Higher score first, then shallower paths, then alphabetical
+    return (-score, path.count("/"), path)
+
+
+def search_blocks(hits: Sequence[tuple[str, int, str]]) -> list[Block]:
+    """Groups (relative path, line number, line) hits by file and ranks the files: files
+    with more hits, and hits that look like definitions, come first. Every file gets a
+    preview of PREVIEW_HITS_PER_FILE hits; the rest of each file follows after all files."""
+    by_file: dict[str, list[tuple[int, str]]] = {}
+    for path, line_number, text in hits:
+        by_file.setdefault(path, []).append((line_number, text))
+    ranked = sorted(by_file.items(), key=lambda item: _rank(*item))
+
+    def hit_lines(file_hits: list[tuple[int, str]]) -> list[str]:
+        return [f"  {line_number}: {elide_line(text.rstrip())}" for line_number, text in file_hits]
+
+    previews, rests = [], []
+    for path, file_hits in ranked:
+        n = len(file_hits)
+        preview = file_hits[:PREVIEW_HITS_PER_FILE]
+        header = f"{path} ({n} match{'es' if n != 1 else ''})"
+        previews.append(Block(header, hit_lines(preview), len(preview)))
+        if n > len(preview):
+            rests.append(Block(f"{path} (matches {len(preview) + 1}-{n})", hit_lines(file_hits[len(preview):]),
+                               n - len(preview)))
+    return previews + rests
+
+
+def format_search_output(hits: Iterable[tuple[str, int, str]]) -> str:
+    """Formats hits the way rg --null -n -H prints them, for caching alongside rg's output."""
+    return "".join(f"{path}\0{line_number}:{text}\n" for path, line_number, text in hits)
+
+
+def parse_search_output(output: str, root: Path) -> list[tuple[str, int, str]]:
+    """Parses "path<NUL>line:text" lines (rg --null -n -H, or format_search_output) into
+    hits with workspace-relative paths. A path can contain ':' but never NUL, so it is
+    split off at the NUL. Lines that don't parse are skipped."""
+    hits = []
+    # Only "\n" ends a line: text may contain other characters splitlines() breaks on
+    for line in output.split("\n"):
+        path, sep, rest = line.partition("\0")
+        line_number, sep2, text = rest.partition(":")
+        if not sep or not sep2 or not line_number.isdigit():
+            continue
+        if os.path.isabs(path):
+            path = os.path.relpath(path, root)
+        hits.append((path.replace(os.sep, "/"), int(line_number), text))
+    return hits
+
+
+def format_search_page(
+    tool_name: str,
+    hits: Sequence[tuple[str, int, str]],
+    scope: Path,
+    max_chars: Optional[int] = None,
+) -> str:
+    """First page of a search result within the token budget."""
+    truncated = len(hits) > MAX_SEARCH_HITS
+    hits = hits[:MAX_SEARCH_HITS]
+    n_files = len({path for path, _, _ in hits})
+    continuation = Continuation(tool_name, Path(scope), search_blocks(hits), total_items=len(hits), total_groups=n_files)
+    intro = (f"{len(hits)} match{'es' if len(hits) != 1 else ''} in {n_files} file{'s' if n_files != 1 else ''}"
+             " (files ranked by matches and definitions)")
+    if truncated:
+        intro += f"; stopped after {MAX_SEARCH_HITS} matches, narrow the pattern or path"
+    return render_page(continuation, max_chars or budget_chars(), intro=intro)
+
+
+def continue_page(tool_name: str, handle: str, max_chars: Optional[int] = None) -> Optional[str]:
+    """Next page for a continuation handle, or None if it's unknown or expired."""
+    continuation = CONTINUATIONS.get(tool_name, handle)
+    if continuation is None:
+        return None
+    intro = f"(page {continuation.page} of the results)"
+    return render_page(continuation, max_chars or budget_chars(), intro=intro)
@@ -0,0 +1,227 @@
+# LRU cache for the results of the read-only tools.
+#
+# Within one task the ReAct loop re-issues identical read_file / search_file_content
+# calls a lot (list_directory keeps its own snapshots, see tree_listing.py). Each
+# cached result remembers the mtime/size of the paths it depends on and is
+# re-validated with a stat() on every hit, so a file changed behind our back is never
+# served stale. Writes made through the file tools invalidate
+# the affected entries immediately (see write_events.py).
+#
+# Search results depend on every file under the searched directory, which is too many
+# to stat on each hit; those entries are scoped to the directory (any tool write under
+# it drops them) and additionally expire after SEARCH_RESULT_TTL seconds to bound how
+# stale an edit made outside the tools can make them.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Hashable, Optional, Sequence
+
+from src.tools.write_events import on_file_written
+
+TOOL_CACHE_ENABLED = os.environ.get("ASPEN_TOOL_CACHE", "1") != "0"
+TOOL_CACHE_MAX_ENTRIES = 512
+TOOL_CACHE_MAX_BYTES = 16 * 1024 * 1024
+SEARCH_RESULT_TTL = 30.0
+
+
+def stat_signature(path: "str | Path") -> tuple[int, int]:
+    """(mtime_ns, size) of a path, or (-1, -1) if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (-1, -1)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+@dataclass
+class _Entry:
+    key: tuple
+    result: str
+    size: int
+    deps: tuple[tuple[str, tuple[int, int]], ...]
+    scopes: tuple[str, ...]
+    expires_at: Optional[float]
+    compute_seconds: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    saved_seconds: float = 0.0
+    by_tool: dict = field(default_factory=dict)
+
+    def record(self, tool_name: str, outcome: str) -> None:
+        counts = self.by_tool.setdefault(tool_name, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+
+class ToolResultCache:
+    """Bounded (by entries and bytes) LRU of tool results with stat-based validation."""
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES, max_bytes: int = TOOL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # path -> keys of entries depending on it; scope dir -> keys of entries scoped to it
+        self._keys_by_dep: dict[str, set[tuple]] = {}
+        self._keys_by_scope: dict[str, set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    # --- bookkeeping ---
+
+    def _unlink(self, entry: _Entry) -> None:
+        self._bytes -= entry.size
+        for dep, _ in entry.deps:
+            keys = self._keys_by_dep.get(dep)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._keys_by_dep[dep]
+        for scope in entry.scopes:
+            keys = self._keys_by_scope.get(scope)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._keys_by_scope[scope]
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unlink(entry)
+
+    # --- public API ---
+
+    def get(self, tool_name: str, args: Sequence[Hashable]) -> Optional[str]:
+        if not TOOL_CACHE_ENABLED:
+            return None
+        key = (tool_name, tuple(args))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                self.stats.record(tool_name, "misses")
+                return None
+            valid = entry.expires_at is None or time.monotonic() < entry.expires_at
+            if valid:
+                valid = all(stat_signature(dep) == signature for dep, signature in entry.deps)
+            if not valid:
+                self._remove(key)
+                self.stats.stale += 1
+                self.stats.misses += 1
+                self.stats.record(tool_name, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            self.stats.saved_seconds += entry.compute_seconds
+            self.stats.record(tool_name, "hits")
+            return entry.result
+
+    def put(
+        self,
+        tool_name: str,
+        args: Sequence[Hashable],
+        result: str,
+        deps: Sequence[Path],
+        scopes: Sequence[Path] = (),
+        ttl: Optional[float] = None,
+        compute_seconds: float = 0.0,
+        signatures: Optional[Sequence[tuple[int, int]]] = None,
+    ) -> None:
+        """Stores a result. `deps` are re-stat'ed on every hit; a tool write to any path
+        under one of `scopes` drops the entry.
+
+        Pass `signatures` taken *before* computing the result to avoid caching a result
+        computed from a file that changed mid-call; otherwise deps are stat'ed now.
+        """
+        if not TOOL_CACHE_ENABLED:
+            return
+        size = len(result.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        key = (tool_name, tuple(args))
+        dep_strs = [str(d) for d in deps]
+        if signatures is None:
+            signatures = [stat_signature(d) for d in dep_strs]
+        entry = _Entry(
+            key=key,
+            result=result,
+            size=size,
+            deps=tuple(zip(dep_strs, signatures)),
+            scopes=tuple(str(s) for s in scopes),
+            expires_at=time.monotonic() + ttl if ttl is not None else None,
+            compute_seconds=compute_seconds,
+        )
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            for dep in dep_strs:
+                self._keys_by_dep.setdefault(dep, set()).add(key)
+            for scope in entry.scopes:
+                self._keys_by_scope.setdefault(scope, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._unlink(evicted)
+                self.stats.evictions += 1
+
+    def invalidate_path(self, path: Path) -> int:
+        """Drops entries affected by a write to `path`: entries depending on the file
+        itself or on its parent directory's listing, and entries scoped to any directory
+        containing it. Returns the number of entries dropped."""
+        path = Path(path)
+        path_str = str(path)
+        affected: set[tuple] = set()
+        with self._lock:
+            for dep in (path_str, str(path.parent)):
+                affected |= self._keys_by_dep.get(dep, set())
+            for candidate in (path, *path.parents):
+                affected |= self._keys_by_scope.get(str(candidate), set())
+            for key in affected:
+                self._remove(key)
+            self.stats.invalidations += len(affected)
+        return len(affected)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_dep.clear()
+            self._keys_by_scope.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> dict:
+        """Counters and occupancy, for the stats endpoint / benchmarks."""
+        with self._lock:
+            lookups = self.stats.hits + self.stats.misses
+            return {
+                "enabled": TOOL_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.stats.hits,
+                "misses": self.stats.misses,
+                "hit_rate": self.stats.hits / lookups if lookups else 0.0,
+                "stale": self.stats.stale,
+                "evictions": self.stats.evictions,
+                "invalidations": self.stats.invalidations,
+                "saved_seconds": round(self.stats.saved_seconds, 6),
+                "by_tool": {name: dict(counts) for name, counts in self.stats.by_tool.items()},
+            }
+
+
+TOOL_RESULT_CACHE = ToolResultCache()
+
+
+@on_file_written
+def _invalidate_written_path(path: Path) -> None:
+    TOOL_RESULT_CACHE.invalidate_path(path)
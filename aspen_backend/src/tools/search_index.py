@@ -0,0 +1,365 @@
+# In-process trigram index of the workspace, used by GrepTool instead of spawning rg.
+#
+# Every indexed file is split into the set of 3-byte substrings (trigrams) of its
+# lowercased content. A regex query is reduced to the literal runs it *must* contain;
+# the files containing all of their trigrams are the only candidates, and only those
+# are actually scanned with the regex. Files are re-indexed when their mtime/size
+# changes (checked at most every REFRESH_INTERVAL seconds) and immediately when the
+# agent writes them through the file tools.
+
+import os
+import re
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Optional
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_parse
+    import sre_constants
+
+from src.journal import journal_directories
+from src.tools.write_events import on_file_written
+
+# Directory names skipped while indexing (same excludes GrepTool passes to rg)
+EXCLUDED_DIRS = {".git", "node_modules", ".venv"}
+# Directories that hold the backend's own state rather than workspace source, e.g. the
+# attempt clones (registered by workspaces.py). rg skips them through .gitignore.
+_internal_dirs: set[Path] = set()
+# Files larger than this, or that look binary, are not indexed; a query whose scope
+# contains one is left to rg
+MAX_INDEXED_FILE_BYTES = 2 * 1024 * 1024
+# How often a query re-checks mtimes of the whole tree
+REFRESH_INTERVAL = 2.0
+# Same per-file cap GrepTool passes to rg
+MAX_MATCHES_PER_FILE = 50
+
+
+def _trigrams(data: bytes) -> set[tuple[int, int, int]]:
+    # Tuples of byte values: building them with zip is ~2x faster than slicing bytes
+    return set(zip(data, data[1:], data[2:]))
+
+
+def required_literals(pattern: str) -> Optional[list[str]]:
+    """Returns literal strings every match of `pattern` must contain, or None if the
+    pattern cannot be parsed by Python's `re`. An empty list means nothing is required."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError):
+        return None
+
+    literals: list[str] = []
+    run: list[str] = []
+
+    def flush():
+        if len(run) >= 3:
+            literals.append("".join(run))
+        run.clear()
+
+    def walk(items):
+        for op, arg in items:
+            if op is sre_constants.LITERAL and arg < 128:
+                run.append(chr(arg))
+            elif op is sre_constants.SUBPATTERN:
+                # A plain group: its contents are required, in sequence
+                walk(arg[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+                # x{1,} / x+ : x is required at least once, but what follows is not adjacent
+                flush()
+                walk(arg[2])
+                flush()
+            elif op is sre_constants.AT:
+                # Anchors (^, $, \b) are zero-width; they don't break a literal run
+                continue
+            else:
+                flush()
+
+    walk(parsed)
+    flush()
+    return literals
+
+
+def register_internal_directory(path: Path) -> None:
+    """Keeps `path` (and everything below it) out of the workspace indexes."""
+    _internal_dirs.add(Path(path).resolve())
+
+
+def internal_prefixes(root: Path) -> tuple[str, ...]:
+    """Path prefixes (ending in a separator) of the attempt clones and journal
+    directories inside `root`. Only directories strictly inside it: an attempt clone's
+    own root lives under the clones directory."""
+    root_prefix = str(root).rstrip(os.sep) + os.sep
+    prefixes = (str(path).rstrip(os.sep) + os.sep for path in _internal_dirs | journal_directories())
+    return tuple(prefix for prefix in prefixes if prefix.startswith(root_prefix) and prefix != root_prefix)
+
+
+class WorkspaceSearchIndex:
+    """Trigram index over the text files of one workspace root."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self._lock = threading.RLock()
+        # absolute path -> (mtime_ns, size) for every file seen, indexable or not
+        self._stats: dict[str, tuple[int, int]] = {}
+        # file id -> absolute path; None for ids whose file was re-indexed or removed
+        self._files: list[Optional[str]] = []
+        self._ids_by_path: dict[str, int] = {}
+        # Tracked files whose content isn't indexed (binary / too large)
+        self._unindexed: set[str] = set()
+        # trigram -> file ids containing it. Stale ids are skipped at query time and
+        # dropped on compaction, so updating a file never has to find its old postings.
+        self._postings: dict[tuple[int, int, int], array] = {}
+        self._dead_ids = 0
+        self._last_refresh = 0.0
+        self.ready = False
+
+    # --- building / updating ---
+
+    def _walk(self):
+        excluded = internal_prefixes(self.root)
+        stack = [str(self.root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        # rg skips hidden files and directories by default; match it
+                        if entry.name.startswith(".") or entry.name in EXCLUDED_DIRS:
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not (entry.path + os.sep).startswith(excluded):
+                                    stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                yield entry.path, entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def _read_indexable(self, path: str, size: int) -> Optional[bytes]:
+        if size > MAX_INDEXED_FILE_BYTES:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None
+        return data
+
+    def _drop(self, path: str) -> None:
+        self._stats.pop(path, None)
+        self._unindexed.discard(path)
+        old_id = self._ids_by_path.pop(path, None)
+        if old_id is not None:
+            self._files[old_id] = None
+            self._dead_ids += 1
+
+    def _add(self, path: str, stat: os.stat_result) -> None:
+        self._drop(path)
+        self._stats[path] = (stat.st_mtime_ns, stat.st_size)
+        data = self._read_indexable(path, stat.st_size)
+        if data is None:
+            # Unindexable (binary / too large): tracked for mtimes, never a candidate, so
+            # searches over it go to rg
+            self._unindexed.add(path)
+            return
+        file_id = len(self._files)
+        self._files.append(path)
+        self._ids_by_path[path] = file_id
+        postings = self._postings
+        for trigram in _trigrams(data.lower()):
+            ids = postings.get(trigram)
+            if ids is None:
+                postings[trigram] = array("I", (file_id,))
+            else:
+                ids.append(file_id)
+
+    def _compact(self) -> None:
+        """Renumbers live files and rebuilds postings without stale ids."""
+        remap: dict[int, int] = {}
+        files: list[Optional[str]] = []
+        for old_id, path in enumerate(self._files):
+            if path is not None and self._ids_by_path.get(path) == old_id:
+                remap[old_id] = len(files)
+                files.append(path)
+        postings: dict[tuple[int, int, int], array] = {}
+        for trigram, ids in self._postings.items():
+            kept = array("I", (remap[i] for i in ids if i in remap))
+            if kept:
+                postings[trigram] = kept
+        self._files = files
+        self._postings = postings
+        self._ids_by_path = {path: new_id for new_id, path in enumerate(files)}
+        self._dead_ids = 0
+
+    def refresh(self, force: bool = False) -> None:
+        """Re-indexes files whose mtime/size changed and forgets deleted files."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.ready and now - self._last_refresh < REFRESH_INTERVAL:
+                return
+            seen: set[str] = set()
+            for path, stat in self._walk():
+                seen.add(path)
+                if self._stats.get(path) != (stat.st_mtime_ns, stat.st_size):
+                    self._add(path, stat)
+            for path in list(self._stats):
+                if path not in seen:
+                    self._drop(path)
+            if self._dead_ids > max(1000, len(self._ids_by_path)):
+                self._compact()
+            self._last_refresh = time.monotonic()
+            self.ready = True
+
+    def update_file(self, path: Path) -> None:
+        """Re-indexes (or forgets) a single file right away."""
+        path = Path(path)
+        if self.root not in path.parents or str(path).startswith(internal_prefixes(self.root)):
+            return  # outside the workspace, or e.g. in an attempt clone inside it
+        with self._lock:
+            try:
+                stat = path.stat()
+            except OSError:
+                self._drop(str(path))
+                return
+            if path.is_file():
+                self._add(str(path), stat)
+
+    # --- querying ---
+
+    def covers(self, scope: Path) -> bool:
+        """Whether every file rg would search under `scope` has its content indexed.
+        Not for hidden or excluded paths (rg searches those when asked explicitly),
+        internal directories, or scopes holding binary or over-large files."""
+        scope_str = str(scope)
+        if scope != self.root and self.root not in scope.parents:
+            return False
+        parts = scope.relative_to(self.root).parts
+        if any(part.startswith(".") or part in EXCLUDED_DIRS for part in parts):
+            return False
+        if (scope_str + os.sep).startswith(internal_prefixes(self.root)):
+            return False
+        scope_prefix = scope_str.rstrip(os.sep) + os.sep
+        with self._lock:
+            if scope_str in self._stats:
+                return scope_str not in self._unindexed
+            if not scope.is_dir():
+                return False  # not seen yet, or not there: rg says which
+            return not any(path.startswith(scope_prefix) for path in self._unindexed)
+
+    def candidates(self, literals: list[str]) -> Optional[list[str]]:
+        """Paths of files that contain every trigram of every literal, or None if the
+        literals give the index nothing to narrow on."""
+        trigrams = set()
+        for literal in literals:
+            trigrams |= _trigrams(literal.lower().encode("utf-8"))
+        if not trigrams:
+            return None
+        with self._lock:
+            lists = []
+            for trigram in trigrams:
+                ids = self._postings.get(trigram)
+                if ids is None:
+                    return []
+                lists.append(ids)
+            lists.sort(key=len)
+            result = set(lists[0])
+            for ids in lists[1:]:
+                result.intersection_update(ids)
+                if not result:
+                    return []
+            paths = []
+            for file_id in result:
+                path = self._files[file_id]
+                if path is not None and self._ids_by_path.get(path) == file_id:
+                    paths.append(path)
+            return sorted(paths)
+
+    def search(self, pattern: str, scope: Path) -> Optional[list[tuple[str, int, str]]]:
+        """Runs `pattern` over the indexed files under `scope`.
+
+        Returns (absolute path, line number, line) tuples, or None when the index can't
+        answer the query (Python can't compile the regex, it has no usable literal, or the
+        index doesn't cover all of `scope`) and the caller should fall back to rg.
+        """
+        literals = required_literals(pattern)
+        if literals is None:
+            return None
+        try:
+            regex = re.compile(pattern, re.MULTILINE)
+        except re.error:
+            return None
+        self.refresh()
+        scope = Path(scope).resolve()
+        if not self.covers(scope):
+            return None
+        paths = self.candidates(literals)
+        if paths is None:
+            return None
+
+        scope_str = str(scope)
+        scope_prefix = scope_str.rstrip(os.sep) + os.sep
+        matches: list[tuple[str, int, str]] = []
+        for path in paths:
+            if path != scope_str and not path.startswith(scope_prefix):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError:
+                continue
+            # Cheap whole-file check first; matching is line oriented like rg
+            if regex.search(text) is None:
+                continue
+            count = 0
+            # Lines end at "\n" only, as in rg (splitlines() also breaks on \f, \x1c, ...)
+            for line_number, line in enumerate(text.split("\n"), start=1):
+                if regex.search(line):
+                    matches.append((path, line_number, line))
+                    count += 1
+                    if count >= MAX_MATCHES_PER_FILE:
+                        break
+        return matches
+
+
+_indexes: dict[str, WorkspaceSearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(root: Path) -> WorkspaceSearchIndex:
+    """Returns the (lazily created, not yet built) index for a workspace root."""
+    key = str(Path(root).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = WorkspaceSearchIndex(Path(key))
+            _indexes[key] = index
+        return index
+
+
+def start_background_build(root: Path) -> WorkspaceSearchIndex:
+    """Builds the index for `root` in a daemon thread; `index.ready` flips when done."""
+    index = get_search_index(root)
+    if not index.ready:
+        threading.Thread(target=index.refresh, kwargs={"force": True}, daemon=True, name="aspen-search-index").start()
+    return index
+
+
+def drop_search_index(root: Path) -> None:
+    """Forgets the index of `root`, e.g. when an attempt clone is removed."""
+    with _indexes_lock:
+        _indexes.pop(str(Path(root).resolve()), None)
+
+
+@on_file_written
+def _update_indexes(path: Path) -> None:
+    for index in list(_indexes.values()):
+        if index.ready:
+            index.update_file(path)
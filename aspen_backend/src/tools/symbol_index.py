@@ -0,0 +1,644 @@
+# Persistent index of the definitions in the workspace, for the code_symbols tool.
+#
+# Finding a function used to take a search_file_content call and one or more read_file
+# calls, each adding hundreds or thousands of tokens, for what is a structural lookup.
+# This index records, per source file, its classes, functions, methods, module-level
+# variables and imports with their line ranges, so "where is X defined" and "outline
+# of file Y" are answered from a table.
+#
+#   Python      the ast module (a file with a syntax error, e.g. mid-edit, falls back
+#               to a line scan for def/class)
+#   TS / JS     a lightweight scanner: comments and strings are blanked, declarations
+#               are matched per line, and braces are counted for the line ranges.
+#               Top-level declarations, class members and namespaces are recorded,
+#               not the locals inside function bodies.
+#
+# The index is a SQLite database (data/symbols.sqlite for the workspace), so it
+# survives restarts. It's built by a background thread. Rebuilding only reparses files
+# whose mtime or size changed. Files written through the tools are reparsed at once
+# (see write_events.py), and a file about to be outlined, or holding a match, is
+# re-checked with a stat first. Attempt clones and journals under the workspace are
+# skipped; a clone gets its own in-memory index when code_symbols runs in it.
+
+import ast
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.tools.search_index import EXCLUDED_DIRS, internal_prefixes
+from src.tools.write_events import on_file_written
+
+DEFAULT_SYMBOL_DB = Path(__file__).parent.parent.parent / "data" / "symbols.sqlite"
+LANGUAGES = {
+    ".py": "python", ".pyi": "python",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".mts": "typescript", ".cts": "typescript",
+}
+# Larger files (bundles, generated code) aren't parsed
+MAX_SYMBOL_FILE_BYTES = 1024 * 1024
+# Queries trigger a background re-check of the tree at most this often
+REFRESH_INTERVAL = 10.0
+# Characters of a declaration kept as its signature
+MAX_SIGNATURE_CHARS = 160
+# Files parsed per transaction while building
+BUILD_BATCH = 200
+# Stored as the database's user_version; a persisted index from another version of the
+# parsers is rebuilt from scratch
+PARSER_VERSION = 2
+
+
+@dataclass
+class Symbol:
+    name: str
+    # Dotted container path plus name, e.g. "MutationJournal.write"
+    qualname: str
+    kind: str  # class | function | method | interface | type | enum | namespace | variable | import
+    line: int  # 1-based, first line (decorators included)
+    end_line: int
+    signature: str
+
+
+def _compact(text: str) -> str:
+    text = " ".join(text.split()).replace("( ", "(").replace(", )", ")").replace(" )", ")")
+    return text if len(text) <= MAX_SIGNATURE_CHARS else text[:MAX_SIGNATURE_CHARS - 3] + "..."
+
+
+# --- Python ---
+
+
+def parse_python(text: str) -> list[Symbol]:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return _scan_python(text)
+    lines = text.splitlines()
+    symbols: list[Symbol] = []
+
+    def header(node: ast.AST) -> str:
+        # The def/class line(s) up to the first line of the body
+        first = node.lineno - 1
+        last = max(first, node.body[0].lineno - 2)
+        parts = []
+        for line in lines[first:last + 1]:
+            parts.append(line.strip())
+            if line.split("#", 1)[0].rstrip().endswith(":"):
+                break
+        return _compact(" ".join(parts))
+
+    def visit(body: list[ast.stmt], parent: str, in_class: bool) -> None:
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{parent}.{node.name}" if parent else node.name
+                if isinstance(node, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if in_class else "function"
+                start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+                symbols.append(Symbol(node.name, qualname, kind, start, node.end_lineno or node.lineno, header(node)))
+                # Methods and nested classes; a function's locals aren't recorded
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, qualname, True)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)) and not parent:
+                statement = _compact(" ".join(lines[node.lineno - 1:(node.end_lineno or node.lineno)]).strip())
+                for alias in node.names:
+                    name = alias.asname or alias.name.split(".")[0]
+                    symbols.append(Symbol(name, name, "import", node.lineno, node.end_lineno or node.lineno, statement))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        qualname = f"{parent}.{target.id}" if parent else target.id
+                        symbols.append(Symbol(target.id, qualname, "variable", node.lineno,
+                                              node.end_lineno or node.lineno, _compact(lines[node.lineno - 1])))
+            elif isinstance(node, (ast.If, ast.Try)) and not parent:
+                # Module-level "if TYPE_CHECKING:" / "try: import x except ImportError:"
+                visit(node.body, parent, in_class)
+                for handler in getattr(node, "handlers", []):
+                    visit(handler.body, parent, in_class)
+                visit(node.orelse, parent, in_class)
+
+    visit(tree.body, "", False)
+    return symbols
+
+
+_PY_DEF = re.compile(r"^(\s*)(?:async\s+def|def|class)\s+(\w+)")
+
+
+def _scan_python(text: str) -> list[Symbol]:
+    """def/class lines of a file ast can't parse; a block ends before the next line
+    indented at most as far."""
+    symbols = []
+    open_blocks: list[tuple[int, Symbol]] = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        # Closing brackets of a multi-line signature or literal don't end a block
+        if not stripped or stripped.startswith("#") or stripped[0] in ")]}":
+            continue
+        indent = len(line) - len(line.lstrip())
+        while open_blocks and indent <= open_blocks[-1][0]:
+            open_blocks.pop()
+        for _, symbol in open_blocks:
+            symbol.end_line = number
+        match = _PY_DEF.match(line)
+        if match is None:
+            continue
+        parent = open_blocks[-1][1] if open_blocks else None
+        name = match.group(2)
+        if stripped.startswith("class"):
+            kind = "class"
+        else:
+            kind = "method" if parent is not None and parent.kind == "class" else "function"
+        symbol = Symbol(name, f"{parent.qualname}.{name}" if parent else name, kind, number, number, _compact(stripped))
+        # Locals of a function are tracked for the ranges but not recorded
+        if parent is None or parent.kind == "class":
+            symbols.append(symbol)
+        open_blocks.append((indent, symbol))
+    return symbols
+
+
+# --- TypeScript / JavaScript ---
+
+
+def _blank_code(text: str) -> str:
+    """Replaces comments and string/template literal contents with spaces, keeping
+    newlines, so declarations and braces can be found with line-based matching."""
+    out = list(text)
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == "/" and i + 1 < n and text[i + 1] in "/*":
+            end = text.find("\n", i) if text[i + 1] == "/" else text.find("*/", i + 2)
+            end = n if end < 0 else (end if text[i + 1] == "/" else end + 2)
+            for j in range(i, end):
+                if out[j] != "\n":
+                    out[j] = " "
+            i = end
+        elif c in "'\"`":
+            j = i + 1
+            while j < n and text[j] != c:
+                if text[j] == "\\":
+                    j += 1
+                elif text[j] == "\n" and c != "`":
+                    break  # unterminated; don't swallow the file
+                j += 1
+            for k in range(i + 1, min(j, n)):
+                if out[k] != "\n":
+                    out[k] = " "
+            i = j + 1
+        else:
+            i += 1
+    return "".join(out)
+
+
+_TS_PREFIX = r"^\s*(?:export\s+)?(?:default\s+)?(?:declare\s+)?(?:abstract\s+)?(?:async\s+)?"
+_TS_DECLARATIONS = [
+    (re.compile(_TS_PREFIX + r"function\s*\*?\s*(\w+)"), "function"),
+    (re.compile(_TS_PREFIX + r"class\s+(\w+)"), "class"),
+    (re.compile(_TS_PREFIX + r"interface\s+(\w+)"), "interface"),
+    (re.compile(_TS_PREFIX + r"type\s+(\w+)\s*(?:<[^=]*>)?\s*="), "type"),
+    (re.compile(_TS_PREFIX + r"(?:const\s+)?enum\s+(\w+)"), "enum"),
+    (re.compile(_TS_PREFIX + r"(?:namespace|module)\s+([\w.]+)\s*\{"), "namespace"),
+    (re.compile(_TS_PREFIX + r"(?:const|let|var)\s+(\w+)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|\w+\s*=>|\(|<)"), "function"),
+    (re.compile(_TS_PREFIX + r"(?:const|let|var)\s+(\w+)"), "variable"),
+]
+_TS_MEMBER = re.compile(
+    r"^\s*(?:(?:public|private|protected|static|readonly|async|override|abstract|declare|get|set)\s+)*"
+    r"\*?\s*(#?\w+)\s*[?!]?\s*(?:<[^>]*>)?\s*(\(|=\s*(?:async\s+)?\(|=\s*(?:async\s+)?\w+\s*=>)"
+)
+_TS_NOT_MEMBERS = {"if", "for", "while", "switch", "catch", "return", "function", "super", "new", "await"}
+# A declaration line ending in one of these continues on the next line
+_TS_CONTINUES = ("=", "=>", "(", "[", ",", "|", "&", "?", ":", "+", "-", "<")
+# ...as does one followed by a line starting with one of these
+_TS_LEADS = ("|", "&", ".", "?", ":", "+", "=>")
+_TS_IMPORT = re.compile(r"""^\s*import\s[^'"]*?(?:from\s*)?['"]([^'"]+)['"]|^\s*import\s*['"]([^'"]+)['"]""")
+_TS_REQUIRE = re.compile(r"""^\s*(?:const|let|var)\s+(\w+|\{[^}]*\})\s*=\s*require\(\s*['"]([^'"]+)['"]""")
+_CONTAINERS = ("class", "namespace")
+_TS_IMPORT_CLAUSE = re.compile(r"""^\s*import\s+(?:type\s+)?(.*?)\s*from\s*['"]""", re.S)
+
+
+def _import_bindings(statement: str, module: str) -> list[str]:
+    """Names an import (or require) statement binds: default, `* as ns`, `{ a, b as c }`
+    and destructured `{ a, b: c }`. A side-effect import binds nothing and is recorded
+    under its module path."""
+    require = _TS_REQUIRE.match(statement)
+    if require:
+        target = require.group(1)
+        if not target.startswith("{"):
+            return [target]
+        names = [part.split(":")[-1].strip() for part in target.strip("{}").split(",")]
+        return [name for name in names if name] or [module]
+    match = _TS_IMPORT_CLAUSE.match(statement)
+    if match is None:
+        return [module]
+    clause, names, named = match.group(1), [], []
+    braces = re.search(r"\{([^}]*)\}", clause)
+    if braces:
+        for part in braces.group(1).split(","):
+            part = re.sub(r"^\s*type\s+", "", part).strip()
+            if part:
+                named.append(re.split(r"\s+as\s+", part)[-1].strip())
+        clause = clause[:braces.start()] + clause[braces.end():]
+    for part in clause.split(","):
+        part = part.strip()
+        if part.startswith("*"):
+            names.append(part.split()[-1])
+        elif re.fullmatch(r"[\w$]+", part):
+            names.append(part)
+    return names + named or [module]
+
+
+def parse_script(text: str) -> list[Symbol]:
+    raw_lines = text.splitlines()
+    code_lines = _blank_code(text).splitlines()
+    symbols: list[Symbol] = []
+    # (symbol, depth its braces opened at); symbols waiting for their "{" are pending
+    scopes: list[tuple[Symbol, int]] = []
+    pending: Optional[tuple[Symbol, int]] = None
+    depth = 0
+    import_lines: list[str] = []
+
+    def add_import(statement: str, module: str, first: int, last: int) -> None:
+        # One symbol per imported binding, as parse_python records them
+        for name in _import_bindings(statement, module):
+            symbols.append(Symbol(name, name, "import", first, last, _compact(statement)))
+
+    for number, code in enumerate(code_lines, start=1):
+        raw = raw_lines[number - 1] if number <= len(raw_lines) else ""
+        container = scopes[-1][0] if scopes else None
+        at_top = depth == 0
+        in_container = container is not None and container.kind in _CONTAINERS and depth == scopes[-1][1] + 1
+
+        if import_lines:
+            import_lines.append(raw.strip())
+            joined = " ".join(import_lines)
+            match = _TS_IMPORT.match(joined)
+            if match or len(import_lines) > 30 or code.rstrip().endswith(";"):
+                module = (match.group(1) or match.group(2)) if match else "?"
+                add_import(joined, module, number - len(import_lines) + 1, number)
+                import_lines = []
+            continue
+
+        symbol = None
+        if at_top and re.match(r"^\s*import[\s{*]", code):
+            match = _TS_IMPORT.match(raw)
+            if match:
+                add_import(raw, match.group(1) or match.group(2), number, number)
+            else:
+                import_lines = [raw.strip()]
+            continue
+        if at_top and (match := _TS_REQUIRE.match(raw)):
+            add_import(raw, match.group(2), number, number)
+        elif at_top or (container is not None and container.kind == "namespace" and in_container):
+            parent = container.qualname if not at_top else ""
+            for pattern, kind in _TS_DECLARATIONS:
+                match = pattern.match(code)
+                if match:
+                    name = match.group(1)
+                    symbol = Symbol(name, f"{parent}.{name}" if parent else name, kind, number, number, _compact(raw))
+                    break
+        elif in_container and container.kind == "class":
+            match = _TS_MEMBER.match(code)
+            if match and match.group(1) not in _TS_NOT_MEMBERS:
+                name = match.group(1)
+                symbol = Symbol(name, f"{container.qualname}.{name}", "method", number, number, _compact(raw))
+
+        if symbol is not None:
+            symbols.append(symbol)
+            pending = (symbol, depth)
+
+        for c in code:
+            if c == "{":
+                if pending is not None and depth == pending[1]:
+                    scopes.append(pending)
+                    pending = None
+                depth += 1
+            elif c == "}":
+                depth = max(0, depth - 1)
+                if scopes and depth == scopes[-1][1]:
+                    scopes.pop()[0].end_line = number
+            elif c == ";" and pending is not None and depth == pending[1]:
+                pending[0].end_line = number
+                pending = None
+        if pending is not None:
+            pending[0].end_line = number
+            # "const x = 1" / "type T = A | B" without a semicolon ends with its line
+            stripped = code.rstrip()
+            following = code_lines[number].lstrip() if number < len(code_lines) else ""
+            if pending[0].kind in ("variable", "type") and depth == pending[1] and stripped \
+                    and not stripped.endswith(_TS_CONTINUES) and not following.startswith(_TS_LEADS):
+                pending = None
+    return symbols
+
+
+def parse_source(text: str, language: str) -> list[Symbol]:
+    return parse_python(text) if language == "python" else parse_script(text)
+
+
+# --- the index ---
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    language TEXT NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    qualname TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_by_name ON symbols (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS symbols_by_path ON symbols (path);
+"""
+
+# Definitions before variables, variables before imports when ranking matches
+_KIND_RANK = "CASE kind WHEN 'import' THEN 2 WHEN 'variable' THEN 1 ELSE 0 END"
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@dataclass
+class SymbolMatch:
+    path: str
+    symbol: Symbol
+
+
+class SymbolIndex:
+    """Symbols of the source files under `root`, kept in SQLite (in memory when
+    `db_path` is None, e.g. for short-lived attempt workspaces)."""
+
+    def __init__(self, root: Path, db_path: Optional[Path] = None):
+        self.root = Path(root).resolve()
+        self._prefix = str(self.root).rstrip(os.sep) + os.sep
+        if db_path is not None:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path) if db_path is not None else ":memory:", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != PARSER_VERSION:
+            self._conn.execute("DELETE FROM symbols")
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute(f"PRAGMA user_version = {PARSER_VERSION}")
+            self._conn.commit()
+        self._lock = threading.RLock()
+        self._building = threading.Lock()
+        self._last_refresh = 0.0
+        # A persisted index from an earlier run answers at once; the build catches up
+        self.ready = self.file_count() > 0
+        self.build_seconds: Optional[float] = None
+
+    # --- building / updating ---
+
+    def _walk(self) -> Iterator[tuple[str, os.stat_result]]:
+        # Attempt clones and journals kept inside the workspace aren't part of its source
+        excluded = internal_prefixes(self.root)
+        stack = [str(self.root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.name.startswith(".") or entry.name in EXCLUDED_DIRS:
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not (entry.path + os.sep).startswith(excluded):
+                                    stack.append(entry.path)
+                            elif os.path.splitext(entry.name)[1] in LANGUAGES and entry.is_file(follow_symlinks=False):
+                                yield entry.path, entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def _relative(self, path: str) -> Optional[str]:
+        absolute = os.path.abspath(path)
+        if not absolute.startswith(self._prefix) or absolute.startswith(internal_prefixes(self.root)):
+            return None
+        return absolute[len(self._prefix):].replace(os.sep, "/")
+
+    def _parse_file(self, path: str, stat: os.stat_result) -> Optional[tuple[str, int, list[Symbol]]]:
+        language = LANGUAGES.get(os.path.splitext(path)[1])
+        if language is None or stat.st_size > MAX_SYMBOL_FILE_BYTES:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            return None
+        return language, len(text.splitlines()), parse_source(text, language)
+
+    def _store(self, rel: str, stat: os.stat_result, parsed: Optional[tuple[str, int, list[Symbol]]]) -> None:
+        # Caller holds the lock and commits
+        self._conn.execute("DELETE FROM symbols WHERE path = ?", (rel,))
+        language, lines, symbols = parsed if parsed is not None else ("", 0, [])
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, language, lines) VALUES (?, ?, ?, ?, ?)",
+            (rel, stat.st_mtime_ns, stat.st_size, language, lines),
+        )
+        self._conn.executemany(
+            "INSERT INTO symbols (path, name, qualname, kind, line, end_line, signature) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(rel, s.name, s.qualname, s.kind, s.line, s.end_line, s.signature) for s in symbols],
+        )
+
+    def refresh(self) -> int:
+        """Reparses the files added or changed since the last refresh and drops removed
+        ones. Returns the number of files parsed."""
+        if not self._building.acquire(blocking=False):
+            return 0  # a refresh is already running
+        try:
+            started = time.perf_counter()
+            with self._lock:
+                known = {path: (mtime, size) for path, mtime, size in
+                         self._conn.execute("SELECT path, mtime_ns, size FROM files")}
+            seen = set()
+            changed: list[tuple[str, str, os.stat_result]] = []
+            for path, stat in self._walk():
+                rel = self._relative(path)
+                if rel is None:
+                    continue
+                seen.add(rel)
+                if known.get(rel) != (stat.st_mtime_ns, stat.st_size):
+                    changed.append((rel, path, stat))
+            # Parse outside the lock, store in batches
+            for start in range(0, len(changed), BUILD_BATCH):
+                batch = [(rel, stat, self._parse_file(path, stat)) for rel, path, stat in changed[start:start + BUILD_BATCH]]
+                with self._lock:
+                    for rel, stat, parsed in batch:
+                        self._store(rel, stat, parsed)
+                    self._conn.commit()
+            removed = [rel for rel in known if rel not in seen]
+            if removed:
+                with self._lock:
+                    for rel in removed:
+                        self._conn.execute("DELETE FROM symbols WHERE path = ?", (rel,))
+                        self._conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+                    self._conn.commit()
+            self._last_refresh = time.monotonic()
+            if not self.ready:
+                self.build_seconds = time.perf_counter() - started
+            self.ready = True
+            return len(changed)
+        finally:
+            self._building.release()
+
+    def update_file(self, path: Path) -> None:
+        """Reparses one file (written through the tools) or drops it if it's gone."""
+        rel = self._relative(str(path))
+        if rel is None or os.path.splitext(rel)[1] not in LANGUAGES:
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._conn.execute("DELETE FROM symbols WHERE path = ?", (rel,))
+                self._conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+                self._conn.commit()
+            return
+        parsed = self._parse_file(str(path), stat)
+        with self._lock:
+            self._store(rel, stat, parsed)
+            self._conn.commit()
+
+    def _ensure_fresh(self, rels: set[str]) -> bool:
+        """Re-checks the files a query is about to report (changed outside the tools?).
+        Returns True if any had to be reparsed."""
+        with self._lock:
+            stored = {path: (mtime, size) for path, mtime, size in self._conn.execute(
+                f"SELECT path, mtime_ns, size FROM files WHERE path IN ({','.join('?' * len(rels))})", tuple(rels))}
+        reparsed = False
+        for rel in rels:
+            try:
+                stat = os.stat(self.root / rel)
+                current = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                current = None
+            if stored.get(rel) != current:
+                self.update_file(self.root / rel)
+                reparsed = True
+        return reparsed
+
+    def maybe_refresh_in_background(self) -> None:
+        if time.monotonic() - self._last_refresh > REFRESH_INTERVAL and not self._building.locked():
+            self._last_refresh = time.monotonic()
+            threading.Thread(target=self.refresh, daemon=True, name="aspen-symbol-index").start()
+
+    # --- queries ---
+
+    def find(self, name: str, kind: Optional[str] = None, under: str = "", limit: int = 50) -> list[SymbolMatch]:
+        """Definitions named `name`, or with the qualified name `name` ("Class.method"),
+        optionally only in the file or directory `under` (relative to the root).
+        Exact matches first, then case-insensitive ones, then names starting with `name`."""
+        rows = self._query(name, kind, under, limit)
+        if rows and self._ensure_fresh({row[0] for row in rows}):
+            rows = self._query(name, kind, under, limit)
+        return [SymbolMatch(row[0], Symbol(*row[1:])) for row in rows]
+
+    def _query(self, name: str, kind: Optional[str], under: str, limit: int) -> list[tuple]:
+        column = "qualname" if "." in name else "name"
+        filters, filter_args = "", ()
+        if kind:
+            filters, filter_args = " AND kind = ?", (kind,)
+        under = under.strip("/")
+        if under and under != ".":
+            filters += " AND (path = ? OR path LIKE ? ESCAPE '\\')"
+            filter_args += (under, _like_escape(under) + "/%")
+        queries = [
+            (f"{column} = ?", (name,)),
+            (f"{column} = ? COLLATE NOCASE", (name,)),
+            (f"{column} LIKE ? ESCAPE '\\'", (_like_escape(name) + "%",)),
+        ]
+        rows: list[tuple] = []
+        for where, args in queries:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT path, name, qualname, kind, line, end_line, signature FROM symbols "
+                    f"WHERE {where}{filters} ORDER BY {_KIND_RANK}, length(path) - length(replace(path, '/', '')), path, line "
+                    "LIMIT ?",
+                    args + filter_args + (limit,),
+                ).fetchall()
+            if rows:
+                break
+        return rows
+
+    def outline(self, rel: str) -> Optional[tuple[str, int, list[Symbol]]]:
+        """(language, line count, symbols in line order) of one file, or None if it isn't
+        a source file the index handles."""
+        if os.path.splitext(rel)[1] not in LANGUAGES:
+            return None
+        self._ensure_fresh({rel})
+        with self._lock:
+            meta = self._conn.execute("SELECT language, lines FROM files WHERE path = ?", (rel,)).fetchone()
+            if meta is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT name, qualname, kind, line, end_line, signature FROM symbols WHERE path = ? ORDER BY line, rowid",
+                (rel,),
+            ).fetchall()
+        return meta[0], meta[1], [Symbol(*row) for row in rows]
+
+    def file_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM files").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            symbols = self._conn.execute("SELECT count(*) FROM symbols").fetchone()[0]
+        return {"ready": self.ready, "files": self.file_count(), "symbols": symbols,
+                "build_seconds": round(self.build_seconds, 3) if self.build_seconds is not None else None}
+
+
+    def close(self) -> None:
+        # Waits for a refresh in progress, which uses the connection
+        with self._building, self._lock:
+            self._conn.close()
+
+
+_indexes: dict[str, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(root: Path, db_path: Optional[Path] = None) -> SymbolIndex:
+    """Returns the index for a workspace root (created on first use, not yet refreshed)."""
+    key = str(Path(root).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SymbolIndex(Path(key), db_path)
+        return index
+
+
+def start_background_build(root: Path, db_path: Optional[Path] = None) -> SymbolIndex:
+    """Refreshes the index of `root` in a daemon thread; `index.ready` is set when done."""
+    index = get_symbol_index(root, db_path)
+    threading.Thread(target=index.refresh, daemon=True, name="aspen-symbol-index").start()
+    return index
+
+
+@on_file_written
+def _update_indexes(path: Path) -> None:
+    for index in list(_indexes.values()):
+        index.update_file(path)
+
+
+def drop_symbol_index(root: Path) -> None:
+    """Forgets (and closes) the index of `root`, e.g. when an attempt clone is removed."""
+    with _indexes_lock:
+        index = _indexes.pop(str(Path(root).resolve()), None)
+    if index is not None:
+        index.close()
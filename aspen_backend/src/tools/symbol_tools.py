@@ -0,0 +1,155 @@
+# The code_symbols tool: definition lookup and file outlines from the symbol index.
+#
+# "Where is X defined?" otherwise takes a search_file_content call (every line that
+# mentions X) and a read_file around each plausible hit. "What's in this file?" takes
+# read_file pages of the whole file. code_symbols answers both in one call of a few
+# hundred tokens, with line ranges that read_file can then fetch exactly.
+
+import os
+import time
+from pathlib import Path
+from pydantic.v1 import BaseModel, Field # Use v1 for Langchain compatibility
+from typing import Optional, Type
+
+from langchain.tools import BaseTool
+
+from src.tools.async_execution import run_tool_in_pool, ToolTimeoutError
+from src.tools.file_system_tools import workspace_root
+from src.tools.output_budget import budget_chars
+from src.tools.symbol_index import LANGUAGES, Symbol, get_symbol_index, start_background_build
+
+# Seconds a call waits for a first build of the index before giving up
+SYMBOL_BUILD_WAIT = float(os.environ.get("ASPEN_SYMBOL_BUILD_WAIT", "5"))
+# Definitions listed per lookup
+MAX_MATCHES = 30
+KINDS = ("class", "function", "method", "interface", "type", "enum", "namespace", "variable", "import")
+
+
+class CodeSymbolsInput(BaseModel):
+    name: Optional[str] = Field(description="Name of a class, function, method, type or variable to find the definition of. 'Class.method' narrows to a method; a prefix matches if nothing matches exactly.", default=None)
+    file_path: Optional[str] = Field(description="Relative path of a file to outline (without 'name'), or of a file or directory to limit the lookup to (with 'name')", default=None)
+    kind: Optional[str] = Field(description="Only symbols of this kind: " + ", ".join(KINDS), default=None)
+
+
+def _range(symbol: Symbol) -> str:
+    return f"{symbol.line}" if symbol.end_line == symbol.line else f"{symbol.line}-{symbol.end_line}"
+
+
+def _limit(lines: list[str], what: str) -> str:
+    """Joins lines up to the output budget, saying how many were left out."""
+    max_chars = budget_chars() - 120
+    out, used = [], 0
+    for line in lines:
+        if used + len(line) + 1 > max_chars and out:
+            out.append(f"[{len(lines) - len(out)} more {what} not shown; narrow with 'kind', 'file_path' or 'name']")
+            break
+        out.append(line)
+        used += len(line) + 1
+    return "\n".join(out)
+
+
+class CodeSymbolsTool(BaseTool):
+    name: str = "code_symbols"
+    description: str = (
+        "Finds where classes, functions, methods, types and variables are defined, or outlines a file, "
+        "from an index of the workspace's Python and TypeScript/JavaScript code. "
+        "Pass 'name' to get each definition's file, line range and signature, or 'file_path' alone to get "
+        "the file's imports and definitions with line ranges. Cheaper than searching and reading whole files: "
+        "use it first, then read_file just the lines you need."
+    )
+    args_schema: Type[BaseModel] = CodeSymbolsInput
+
+    def _index(self):
+        """The index of the current workspace, or None if its first build doesn't finish in time."""
+        root = workspace_root()
+        index = get_symbol_index(root)
+        if not index.ready:
+            start_background_build(root)
+            deadline = time.monotonic() + SYMBOL_BUILD_WAIT
+            while not index.ready and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if not index.ready:
+                return None
+        # Pick up files created or changed outside the tools
+        index.maybe_refresh_in_background()
+        return index
+
+    def _find(self, index, name: str, kind: Optional[str], under: str) -> str:
+        matches = index.find(name, kind=kind, under=under, limit=MAX_MATCHES + 1)
+        if not matches:
+            scope = f" in {under}" if under not in ("", ".") else ""
+            return f"No definitions matching '{name}'{scope}. (search_file_content finds other mentions.)"
+        definitions = [m for m in matches if m.symbol.kind != "import"]
+        imports = [m for m in matches if m.symbol.kind == "import"]
+        lines = []
+        for match in (definitions or imports)[:MAX_MATCHES]:
+            s = match.symbol
+            lines.append(f"{match.path}:{_range(s)} {s.kind} {s.qualname}")
+            lines.append(f"    {s.signature}")
+        if definitions and imports:
+            # Where the name is imported, one line (the definitions are what was asked for)
+            lines.append("imported in: " + ", ".join(f"{m.path}:{m.symbol.line}" for m in imports))
+        shown = definitions or imports
+        header = f"{min(len(shown), MAX_MATCHES)}{'+' if len(matches) > MAX_MATCHES else ''} " \
+                 f"{'definition' if definitions else 'import'}{'s' if len(shown) != 1 else ''} of '{name}' " \
+                 "(path:first-last line, 1-based; read_file offset is first-1):"
+        return _limit([header] + lines, "lines")
+
+    def _outline(self, index, file_path: str, kind: Optional[str]) -> str:
+        root = workspace_root()
+        rel = os.path.relpath((root / file_path).resolve(), root).replace(os.sep, "/")
+        if Path(rel).suffix not in LANGUAGES:
+            return (f"Error: No outline for {file_path}: only Python and TypeScript/JavaScript files are indexed. "
+                    "Use read_file.")
+        outline = index.outline(rel)
+        if outline is None:
+            return f"Error: File not found at {file_path}"
+        language, total_lines, symbols = outline
+        if kind:
+            symbols = [s for s in symbols if s.kind == kind]
+        lines = [f"{rel} ({language}, {total_lines} lines; line ranges are 1-based)"]
+        imports = [s for s in symbols if s.kind == "import"]
+        if imports:
+            names = list(dict.fromkeys(s.name for s in imports))
+            span = Symbol("", "", "import", imports[0].line, imports[-1].end_line, "")
+            lines.append(f"imports (line {_range(span)}): {', '.join(names)}")
+        for s in symbols:
+            if s.kind == "import":
+                continue
+            # The declaration line says what it is ("def", "class", "export interface", ...)
+            lines.append(f"{'  ' * s.qualname.count('.')}{_range(s)} {s.signature}")
+        if len(lines) == 1:
+            lines.append("(no definitions found)")
+        return _limit(lines, "lines")
+
+    def _run(self, name: Optional[str] = None, file_path: Optional[str] = None, kind: Optional[str] = None) -> str:
+        """Looks up a definition or outlines a file."""
+        try:
+            if not name and not file_path:
+                return "Error: Pass 'name' to find a definition, or 'file_path' to outline a file."
+            if kind and kind not in KINDS:
+                return f"Error: kind must be one of {', '.join(KINDS)}, got '{kind}'"
+            root = workspace_root()
+            if file_path:
+                full_path = (root / file_path).resolve()
+                # Security check
+                if root not in full_path.parents and full_path != root:
+                    return f"Error: Access denied. Path is outside the allowed workspace: {file_path}"
+                if not name and not full_path.is_file():
+                    return f"Error: File not found at {file_path}"
+            index = self._index()
+            if index is None:
+                return ("Error: The symbol index is still being built. Try again shortly, or use "
+                        "search_file_content meanwhile.")
+            if name:
+                under = os.path.relpath(full_path, root).replace(os.sep, "/") if file_path else ""
+                return self._find(index, name.strip(), kind, under)
+            return self._outline(index, file_path, kind)
+        except Exception as e:
+            return f"Error looking up symbols: {e}"
+
+    async def _arun(self, name: Optional[str] = None, file_path: Optional[str] = None, kind: Optional[str] = None) -> str:
+        try:
+            return await run_tool_in_pool(self.name, self._run, name, file_path, kind)
+        except ToolTimeoutError as e:
+            return f"Error looking up symbols: {e}"
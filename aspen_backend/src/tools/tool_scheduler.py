@@ -0,0 +1,163 @@
+# Scheduling of the tool calls of one agent step.
+#
+# When the model emits several tool calls in one AIMessage, LangGraph's ToolNode runs
+# them all at once. That is what we want for reads, but not unbounded, and not for a
+# write_file/edit_file racing another call on the same path (or a read that the model
+# listed after the write and expects to see its result).
+#
+# ToolCallScheduler plugs into ToolNode as its `awrap_tool_call`. On the first call of
+# a step it plans the whole step from the AIMessage in the graph state. Each call
+# waits for the earlier calls it conflicts with:
+#   - a write waits for every earlier call touching an overlapping path;
+#   - a read waits for earlier writes to an overlapping path.
+# Paths overlap when they're equal or one contains the other, e.g. a grep over src/
+# conflicts with a write to src/app.py. Independent calls then run in parallel, with at
+# most MAX_PARALLEL_TOOL_CALLS per step. Writes to the same path from different requests
+# are serialized by a per-path lock. ToolNode returns the results in the original call
+# order.
+
+import asyncio
+import os
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+
+from src.tools import file_system_tools
+
+MAX_PARALLEL_TOOL_CALLS = int(os.environ.get("ASPEN_MAX_PARALLEL_TOOLS", "4"))
+# Tool name -> argument holding the path it reads or writes (and the default path)
+READ_ONLY_TOOLS = {
+    "read_file": ("file_path", None),
+    "list_directory": ("dir_path", "."),
+    "search_file_content": ("path", "."),
+    "code_symbols": ("file_path", "."),
+}
+WRITE_TOOLS = {
+    "write_file": ("file_path", None),
+    "edit_file": ("file_path", None),
+}
+# Steps whose plans are kept; a plan is dropped once all its calls finished
+MAX_TRACKED_STEPS = 256
+
+
+@dataclass
+class _CallPlan:
+    index: int
+    write: bool
+    # Resolved workspace path, or None for a call that conflicts with everything
+    path: Optional[Path]
+    depends_on: list[str] = field(default_factory=list)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+@dataclass
+class _StepPlan:
+    calls: dict[str, _CallPlan]
+    slots: asyncio.Semaphore
+    remaining: int
+
+
+def _call_path(name: str, args: dict) -> tuple[bool, Optional[Path]]:
+    """(is_write, resolved path) of a tool call; unknown tools are treated as writes to
+    everything."""
+    if name in READ_ONLY_TOOLS:
+        write, (arg, default) = False, READ_ONLY_TOOLS[name]
+    elif name in WRITE_TOOLS:
+        write, (arg, default) = True, WRITE_TOOLS[name]
+    else:
+        return True, None
+    value = args.get(arg, default) if isinstance(args, dict) else None
+    if not isinstance(value, str):
+        return write, None
+    try:
+        return write, (file_system_tools.workspace_root() / value).resolve()
+    except (OSError, RuntimeError):
+        return write, None
+
+
+def _overlaps(a: Optional[Path], b: Optional[Path]) -> bool:
+    if a is None or b is None:
+        return True
+    return a == b or a in b.parents or b in a.parents
+
+
+def plan_step(tool_calls: list[dict], max_parallel: int = MAX_PARALLEL_TOOL_CALLS) -> _StepPlan:
+    calls: dict[str, _CallPlan] = {}
+    for index, call in enumerate(tool_calls):
+        write, path = _call_path(call["name"], call.get("args") or {})
+        plan = _CallPlan(index, write, path)
+        for earlier_id, earlier in calls.items():
+            if (write or earlier.write) and _overlaps(path, earlier.path):
+                plan.depends_on.append(earlier_id)
+        calls[call["id"]] = plan
+    return _StepPlan(calls, asyncio.Semaphore(max_parallel), len(calls))
+
+
+def _step_tool_calls(state: Any, tool_call_id: str) -> Optional[tuple[str, list[dict]]]:
+    """Finds the AIMessage that issued `tool_call_id`; returns (step key, its calls)."""
+    messages = state.get("messages") if isinstance(state, dict) else getattr(state, "messages", state)
+    if not isinstance(messages, list):
+        return None
+    for message in reversed(messages):
+        if isinstance(message, AIMessage) and message.tool_calls:
+            ids = [call["id"] for call in message.tool_calls]
+            if tool_call_id in ids:
+                return message.id or "|".join(ids), message.tool_calls
+    return None
+
+
+class ToolCallScheduler:
+    def __init__(self, max_parallel: int = MAX_PARALLEL_TOOL_CALLS):
+        self.max_parallel = max_parallel
+        self._steps: "OrderedDict[str, _StepPlan]" = OrderedDict()
+        self._path_locks: "weakref.WeakValueDictionary[Path, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _plan_for(self, request: ToolCallRequest) -> tuple[Optional[str], Optional[_StepPlan]]:
+        call_id = request.tool_call["id"]
+        found = _step_tool_calls(request.state, call_id)
+        if found is None:
+            return None, None
+        key, tool_calls = found
+        plan = self._steps.get(key)
+        if plan is None:
+            plan = self._steps[key] = plan_step(tool_calls, self.max_parallel)
+            while len(self._steps) > MAX_TRACKED_STEPS:
+                self._steps.popitem(last=False)
+        return key, plan
+
+    def _path_lock(self, path: Path) -> asyncio.Lock:
+        lock = self._path_locks.get(path)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._path_locks[path] = lock
+        return lock
+
+    async def awrap(
+        self,
+        request: ToolCallRequest,
+        execute: Callable[[ToolCallRequest], Awaitable["ToolMessage | Command"]],
+    ) -> "ToolMessage | Command":
+        key, step = self._plan_for(request)
+        call = step.calls.get(request.tool_call["id"]) if step is not None else None
+        if call is None:
+            # Not part of a known step (e.g. called outside the graph): run it directly
+            return await execute(request)
+        try:
+            for dep_id in call.depends_on:
+                await step.calls[dep_id].done.wait()
+            async with step.slots:
+                if call.write and call.path is not None:
+                    async with self._path_lock(call.path):
+                        return await execute(request)
+                return await execute(request)
+        finally:
+            call.done.set()
+            step.remaining -= 1
+            if step.remaining <= 0:
+                self._steps.pop(key, None)
@@ -0,0 +1,399 @@
+# Recursive workspace listing for list_directory.
+#
+# One os.scandir pass per directory; the entry type comes from the cached DirEntry
+# (no extra stat per entry) and sizes/mtimes are only stat'ed when asked for.
+# .gitignore files are honoured (root and nested, with negation, anchoring, dir-only
+# and ** patterns), as are caller-supplied exclude globs in the same syntax; ignored
+# directories are not descended into at all.
+#
+# The entries of a scan are kept as a snapshot so that paging through a large tree
+# doesn't rescan it. A snapshot remembers the mtime of every directory it scanned and
+# is re-validated with one stat per directory on each use (entries added, removed or
+# renamed anywhere change some directory's mtime). Writes through the file tools drop
+# the snapshots covering the written path immediately.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+from src.tools.search_index import EXCLUDED_DIRS
+from src.tools.write_events import on_file_written
+
+# Entries per page of a listing
+LIST_PAGE_SIZE = 400
+# Scans stop after this many entries (the listing says so)
+MAX_LISTED_ENTRIES = 200_000
+# Snapshots kept; sizes/mtimes of files can change without any directory mtime
+# changing, so snapshots with details also expire
+MAX_SNAPSHOTS = 32
+DETAILS_SNAPSHOT_TTL = 30.0
+
+
+# --- .gitignore matching ---
+
+
+def _glob_to_regex(glob: str) -> str:
+    out = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("/**", i) and i + 3 == len(glob):
+            out.append("/.*")
+            i += 3
+        elif glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = glob[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+        elif c == "\\" and i + 1 < len(glob):
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+@dataclass
+class _Rule:
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+    # Patterns without a slash match the last path component only
+    basename: bool
+
+
+def _parse_rule(line: str) -> Optional[_Rule]:
+    line = line.rstrip("\n").rstrip("\r")
+    if not line.strip() or line.startswith("#"):
+        return None
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A slash anywhere but at the end anchors the pattern to the .gitignore's directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+    return _Rule(re.compile(f"^{_glob_to_regex(line)}$"), negate, dir_only, basename=not anchored)
+
+
+class IgnoreLayer:
+    """The rules of one .gitignore (or the exclude globs). Paths are relative to the
+    listed directory; `base` is the .gitignore's directory below it, or `prefix` the
+    path of the listed directory below the .gitignore's (for ancestors)."""
+
+    def __init__(self, base: str, lines: Sequence[str], prefix: str = ""):
+        self.base = base
+        self.prefix = prefix
+        self.rules = [rule for rule in (_parse_rule(line) for line in lines) if rule is not None]
+        # Most paths match no rule at all: one combined regex per kind rules them out quickly
+        self._any_name = self._combine([r for r in self.rules if r.basename])
+        self._any_path = self._combine([r for r in self.rules if not r.basename])
+
+    @staticmethod
+    def _combine(rules: list[_Rule]) -> Optional["re.Pattern[str]"]:
+        return re.compile("|".join(f"(?:{r.regex.pattern})" for r in rules)) if rules else None
+
+    def verdict(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True (ignored), False (re-included by a ! rule) or None (no rule matches)."""
+        name = rel_path.rpartition("/")[2]
+        if self.base:
+            rel_path = rel_path[len(self.base) + 1:]
+        elif self.prefix:
+            rel_path = self.prefix + rel_path
+        if not ((self._any_name is not None and self._any_name.match(name))
+                or (self._any_path is not None and self._any_path.match(rel_path))):
+            return None
+        for rule in reversed(self.rules):
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.match(name if rule.basename else rel_path):
+                return not rule.negate
+        return None
+
+
+def _is_ignored(layers: Sequence[IgnoreLayer], rel_path: str, is_dir: bool) -> bool:
+    # Deeper .gitignore files override shallower ones: the last layer with a verdict wins
+    for layer in reversed(layers):
+        verdict = layer.verdict(rel_path, is_dir)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def _read_gitignore(directory: "str | Path") -> Optional[list[str]]:
+    try:
+        with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+            return f.readlines()
+    except OSError:
+        return None
+
+
+def ancestor_layers(root: Path, top: Path) -> list[IgnoreLayer]:
+    """Layers for the .gitignore files of `top` and the directories between it and
+    `root` (exclusive), which also apply to a listing of `root`."""
+    layers = []
+    if root == top or top not in root.parents:
+        return layers
+    for ancestor in reversed([p for p in root.parents if p == top or top in p.parents]):
+        lines = _read_gitignore(ancestor)
+        if lines:
+            layers.append(IgnoreLayer("", lines, prefix=root.relative_to(ancestor).as_posix() + "/"))
+    return layers
+
+
+# --- scanning ---
+
+
+@dataclass(slots=True)
+class TreeEntry:
+    # Path relative to the listed directory, "/"-separated
+    path: str
+    is_dir: bool
+    size: Optional[int] = None
+    mtime: Optional[float] = None
+
+
+@dataclass
+class TreeSnapshot:
+    id: str
+    root: Path
+    entries: list[TreeEntry]
+    # Every scanned directory and its mtime_ns, for validation
+    dir_signatures: dict[str, int]
+    truncated: bool
+    created: float
+    details: bool
+
+
+def scan_tree(
+    root: Path,
+    max_depth: int,
+    excludes: Sequence[str] = (),
+    use_gitignore: bool = True,
+    details: bool = False,
+    skip_dirs: Sequence[str] = (),
+    inherited: Sequence[IgnoreLayer] = (),
+) -> tuple[list[TreeEntry], dict[str, int], bool]:
+    """Entries under `root` down to `max_depth` levels (1 = direct children), in
+    depth-first order with each directory's children sorted, directories first.
+    `inherited` are the layers of .gitignore files above `root`."""
+    entries: list[TreeEntry] = []
+    dir_signatures: dict[str, int] = {}
+    # Exclude globs are checked before (and so win over) any .gitignore re-include
+    exclude_layer = IgnoreLayer("", list(excludes)) if excludes else None
+    truncated = False
+
+    def visit(directory: str, rel_dir: str, depth: int, layers: list[IgnoreLayer]) -> None:
+        nonlocal truncated
+        try:
+            dir_signatures[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                children = list(it)
+        except OSError:
+            return
+        if use_gitignore and any(child.name == ".gitignore" for child in children):
+            lines = _read_gitignore(directory)
+            if lines:
+                layers = layers + [IgnoreLayer(rel_dir, lines)]
+        children.sort(key=lambda e: (not e.is_dir(follow_symlinks=False), e.name))
+        for child in children:
+            if truncated:
+                return
+            try:
+                is_dir = child.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir and child.name in skip_dirs:
+                continue
+            rel_path = f"{rel_dir}/{child.name}" if rel_dir else child.name
+            if exclude_layer is not None and exclude_layer.verdict(rel_path, is_dir):
+                continue
+            if layers and _is_ignored(layers, rel_path, is_dir):
+                continue
+            entry = TreeEntry(rel_path, is_dir)
+            if details:
+                try:
+                    stat = child.stat(follow_symlinks=False)
+                    entry.size = None if is_dir else stat.st_size
+                    entry.mtime = stat.st_mtime
+                except OSError:
+                    pass
+            entries.append(entry)
+            if len(entries) >= MAX_LISTED_ENTRIES:
+                truncated = True
+                return
+            if is_dir and depth < max_depth:
+                visit(child.path, rel_path, depth + 1, layers)
+
+    visit(str(root), "", 1, list(inherited) if use_gitignore else [])
+    return entries, dir_signatures, truncated
+
+
+class TreeSnapshotCache:
+    def __init__(self, max_snapshots: int = MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[tuple, TreeSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _valid(self, snapshot: TreeSnapshot) -> bool:
+        if snapshot.details and time.monotonic() - snapshot.created > DETAILS_SNAPSHOT_TTL:
+            return False
+        for directory, mtime_ns in snapshot.dir_signatures.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, root: Path, max_depth: int, excludes: Sequence[str], use_gitignore: bool, details: bool,
+            workspace_root: Optional[Path] = None) -> TreeSnapshot:
+        """The snapshot of a listing, rescanning only if it's missing or stale.
+        .gitignore files between `workspace_root` and `root` apply too."""
+        key = (str(root), max_depth, tuple(excludes), use_gitignore, details)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if snapshot is not None and self._valid(snapshot):
+            with self._lock:
+                self._snapshots.move_to_end(key)
+                self.hits += 1
+            return snapshot
+        inherited = ancestor_layers(root, workspace_root) if use_gitignore and workspace_root is not None else []
+        entries, dir_signatures, truncated = scan_tree(
+            root, max_depth, excludes, use_gitignore, details,
+            # The directories grep and the search index skip are never worth walking
+            skip_dirs=EXCLUDED_DIRS if use_gitignore else (),
+            inherited=inherited,
+        )
+        with self._lock:
+            self.misses += 1
+            self._next_id += 1
+            snapshot = TreeSnapshot(
+                id=f"s{self._next_id}",
+                root=root,
+                entries=entries,
+                dir_signatures=dir_signatures,
+                truncated=truncated,
+                created=time.monotonic(),
+                details=details,
+            )
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate_path(self, path: Path) -> None:
+        path = Path(path)
+        with self._lock:
+            if path.name == ".gitignore":
+                # May change what listings of its subdirectories include
+                self._snapshots.clear()
+                return
+            for key in [k for k, s in self._snapshots.items() if s.root == path or s.root in path.parents]:
+                del self._snapshots[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+
+TREE_SNAPSHOTS = TreeSnapshotCache()
+
+
+@on_file_written
+def _invalidate_written_path(path: Path) -> None:
+    TREE_SNAPSHOTS.invalidate_path(path)
+
+
+# --- formatting ---
+
+
+def _format_entry(entry: TreeEntry, details: bool) -> str:
+    kind = "[dir]" if entry.is_dir else "[file]"
+    line = f"{kind} {entry.path}"
+    if details:
+        if entry.size is not None:
+            line += f"  {entry.size} B"
+        if entry.mtime is not None:
+            line += "  " + time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.mtime))
+    return line
+
+
+def parse_cursor(cursor: Optional[str]) -> tuple[Optional[str], int]:
+    """(snapshot id, offset) from a cursor like "s12:400"; raises ValueError."""
+    if not cursor:
+        return None, 0
+    snapshot_id, _, offset = cursor.partition(":")
+    return snapshot_id, max(0, int(offset))
+
+
+def format_page(
+    snapshot: TreeSnapshot,
+    cursor: Optional[str],
+    details: bool,
+    page_size: int = LIST_PAGE_SIZE,
+    max_chars: Optional[int] = None,
+) -> str:
+    """One page of a listing: at most `page_size` entries, and with `max_chars` the page
+    ends early once that many characters are used (at least one entry is shown)."""
+    snapshot_id, offset = parse_cursor(cursor)
+    lines = []
+    if snapshot_id is not None and snapshot_id != snapshot.id:
+        lines.append("[note: the tree changed since the previous page; continuing at the same position]")
+    total = len(snapshot.entries)
+    page = snapshot.entries[offset:offset + page_size]
+    if not page:
+        return "Directory is empty." if total == 0 else f"[no entries at offset {offset}; the listing has {total}]"
+    used = 0
+    shown = 0
+    for entry in page:
+        line = _format_entry(entry, details)
+        if max_chars is not None and shown and used + len(line) + 1 > max_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+        shown += 1
+    end = offset + shown
+    footer = f"[entries {offset}-{end - 1} of {total}"
+    if end < total:
+        footer += f"; next_cursor={snapshot.id}:{end}]"
+    else:
+        footer += "; end of listing"
+        if snapshot.truncated:
+            footer += f" (stopped after {MAX_LISTED_ENTRIES} entries; list a subdirectory or exclude more)"
+        footer += "]"
+    lines.append(footer)
+    return "\n".join(lines)
@@ -0,0 +1,34 @@
+# Tiny pub/sub for "the agent just wrote this file".
+#
+# FileWriteTool / FileEditTool call notify_file_written() after every successful write so
+# in-process caches and indexes (line offsets, search index, ...) can update immediately
+# instead of waiting to notice a changed mtime.
+
+from pathlib import Path
+from typing import Callable
+
+from src.instrumentation import logger
+
+_listeners: list[Callable[[Path], None]] = []
+
+
+def on_file_written(listener: Callable[[Path], None]) -> Callable[[Path], None]:
+    """Registers a listener called with the absolute path of every file the tools write.
+    Returns the listener so it can be used as a decorator."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def remove_listener(listener: Callable[[Path], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify_file_written(path: Path) -> None:
+    for listener in list(_listeners):
+        try:
+            listener(path)
+        except Exception:
+            # A broken cache must never fail the write that already happened.
+            logger.exception("write listener %r failed for %s", listener, path)
@@ -0,0 +1,288 @@
+# Cheap isolated copies of the workspace for speculative attempts.
+#
+# Each attempt of a task (src/attempts.py) runs against its own clone of the workspace,
+# so several agent runs can edit files at the same time without seeing each other.
+# A clone is a tree of hardlinks to the original files, not a copy. Cloning costs one
+# link() per file and no data. It stays correct because the file tools never write an
+# existing file in place: edit_file and write_file replace files via rename
+# (write_atomic or the mutation journal), which gives the clone a new inode and leaves
+# the original untouched.
+# Where hardlinks aren't possible (another filesystem) files are reflinked when the
+# filesystem supports it and copied otherwise.
+#
+# Dependency and VCS directories (.git, node_modules, .venv) are symlinked instead of
+# cloned, and caches (__pycache__, ...) and the mutation journal are left out.
+#
+# When an attempt wins, its changes relative to the snapshot the clone was taken from
+# are computed and promoted into the original workspace. For hardlinked files an
+# unchanged inode means an unchanged file. A file changed in the original since the
+# clone was taken is a conflict, and nothing is promoted.
+#
+# A program that rewrites an existing file in place (opening it for writing without
+# replacing it, as formatters and fixers do) would write through the hardlink into the
+# original. Before anything but the file tools runs in a clone (an attempt's check
+# command), detach() gives every file still linked to the original its own copy,
+# reflinked where the filesystem supports it.
+
+import difflib
+import errno
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from src.journal import journal_directories, journal_for
+from src.tools.search_index import EXCLUDED_DIRS, drop_search_index, register_internal_directory
+from src.tools.symbol_index import drop_symbol_index
+from src.tools.write_events import notify_file_written
+
+DEFAULT_CLONES_DIR = Path(__file__).parent.parent / "data" / "attempts"
+# Clones (including ones left behind by a crash) aren't part of the workspace's source
+register_internal_directory(DEFAULT_CLONES_DIR)
+# Symlinked into clones (shared, read-mostly); same set the search tools skip
+SHARED_DIRS = frozenset(EXCLUDED_DIRS)
+# Not cloned at all: regenerated by the tools that use them
+SKIPPED_DIRS = frozenset({"__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache"})
+# Files larger than this are reported as "differs" in diffs instead of diffed line by line
+MAX_DIFF_FILE_BYTES = 1024 * 1024
+# Linux FICLONE ioctl: reflink (copy-on-write clone) of a whole file
+_FICLONE = 0x40049409
+
+
+class WorkspaceConflict(Exception):
+    """The original workspace changed under paths the attempt also changed."""
+
+
+@dataclass
+class FileChange:
+    # Path relative to the workspace root, with "/" separators
+    path: str
+    kind: str  # "added" | "modified" | "deleted"
+
+
+def _reflink_or_copy(src: str, dst: str) -> None:
+    try:
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+
+
+@dataclass
+class WorkspaceClone:
+    base: Path
+    root: Path
+    # "hardlink" or "copy" (set to "copy" when linking failed for at least one file, or
+    # by detach())
+    method: str
+    # Relative path -> (inode, mtime_ns, size) of every original file when it was cloned
+    baseline: dict[str, tuple[int, int, int]] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def _walk(self, top: Path):
+        """Yields (relative path, DirEntry) of the regular files under a tree, with the
+        same directories skipped as when cloning."""
+        stack = [(top, "")]
+        while stack:
+            directory, prefix = stack.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    rel = prefix + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRS and entry.name not in SHARED_DIRS:
+                            stack.append((Path(entry.path), rel + "/"))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield rel, entry
+
+    def changes(self) -> list[FileChange]:
+        changes = []
+        seen = set()
+        for rel, entry in self._walk(self.root):
+            seen.add(rel)
+            original = self.baseline.get(rel)
+            if original is None:
+                changes.append(FileChange(rel, "added"))
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if self.method == "hardlink" and stat.st_ino == original[0]:
+                continue
+            if self.method != "hardlink" and (stat.st_mtime_ns, stat.st_size) == original[1:]:
+                continue
+            base_path = self.base / rel
+            # Rewritten with identical content (e.g. an edit that was reverted) isn't a change
+            if base_path.is_file() and filecmp.cmp(entry.path, base_path, shallow=False):
+                continue
+            changes.append(FileChange(rel, "modified"))
+        changes.extend(FileChange(rel, "deleted") for rel in self.baseline if rel not in seen)
+        changes.sort(key=lambda c: c.path)
+        return changes
+
+    def diff(self, changes: Optional[list[FileChange]] = None) -> str:
+        """Unified diff of the attempt against the original workspace."""
+        parts = []
+        for change in changes if changes is not None else self.changes():
+            old = self.base / change.path if change.kind != "added" else None
+            new = self.root / change.path if change.kind != "deleted" else None
+            old_lines = self._diff_lines(old)
+            new_lines = self._diff_lines(new)
+            if old_lines is None or new_lines is None:
+                parts.append(f"Binary or large file {change.path} {change.kind}\n")
+                continue
+            parts.extend(difflib.unified_diff(
+                old_lines, new_lines,
+                fromfile=f"a/{change.path}" if old else "/dev/null",
+                tofile=f"b/{change.path}" if new else "/dev/null",
+            ))
+        return "".join(parts)
+
+    @staticmethod
+    def _diff_lines(path: Optional[Path]) -> Optional[list[str]]:
+        if path is None:
+            return []
+        try:
+            if path.stat().st_size > MAX_DIFF_FILE_BYTES:
+                return None
+            lines = path.read_text(encoding="utf-8").splitlines(keepends=True)
+        except (OSError, UnicodeDecodeError):
+            return None
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n\\ No newline at end of file\n"
+        return lines
+
+    def promote(self, changes: Optional[list[FileChange]] = None) -> list[FileChange]:
+        """Applies the attempt's changes to the original workspace. Raises
+        WorkspaceConflict (and changes nothing) if any of the touched paths changed
+        in the original since the clone was taken."""
+        changes = changes if changes is not None else self.changes()
+        conflicts = []
+        for change in changes:
+            base_path = self.base / change.path
+            original = self.baseline.get(change.path)
+            try:
+                stat = os.stat(base_path)
+                current = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                current = None
+            if current != (original[1:] if original else None):
+                conflicts.append(change.path)
+        if conflicts:
+            raise WorkspaceConflict(f"Changed in the workspace since the attempt started: {', '.join(conflicts)}")
+
+        # Promotions into a journaled workspace are journaled, so they can be rolled back
+        journal = journal_for(self.base)
+        for change in changes:
+            base_path = self.base / change.path
+            if change.kind == "deleted":
+                if journal is not None:
+                    journal.delete(base_path)
+                else:
+                    try:
+                        base_path.unlink()
+                    except FileNotFoundError:
+                        pass
+            elif journal is not None:
+                journal.write(base_path, (self.root / change.path).read_bytes())
+            else:
+                base_path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(dir=base_path.parent, prefix=f".{base_path.name}.", suffix=".tmp")
+                os.close(fd)
+                try:
+                    shutil.copy2(self.root / change.path, tmp_name)
+                    os.replace(tmp_name, base_path)
+                except BaseException:
+                    try:
+                        os.unlink(tmp_name)
+                    except OSError:
+                        pass
+                    raise
+            notify_file_written(base_path)
+        return changes
+
+    def detach(self) -> int:
+        """Replaces the clone's files that are still hardlinks of the original with
+        copies, so writing them in place can't change the original. Returns how many
+        files were copied."""
+        if self.method != "hardlink":
+            return 0
+        copied = 0
+        for rel, entry in self._walk(self.root):
+            original = self.baseline.get(rel)
+            if original is None or entry.stat(follow_symlinks=False).st_ino != original[0]:
+                continue  # created or already replaced by the attempt
+            fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(entry.path), prefix=f".{entry.name}.", suffix=".tmp")
+            os.close(fd)
+            try:
+                _reflink_or_copy(entry.path, tmp_name)
+                os.replace(tmp_name, entry.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass
+                raise
+            copied += 1
+        # Unchanged files are now told apart by mtime and size (kept by the copy)
+        self.method = "copy"
+        return copied
+
+    def remove(self) -> None:
+        # Indexes built for the clone (search backend, code_symbols) go with it
+        drop_search_index(self.root)
+        drop_symbol_index(self.root)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def clone_workspace(base: Path, clones_dir: Path = DEFAULT_CLONES_DIR, name: str = "attempt") -> WorkspaceClone:
+    """Creates a copy-on-write clone of `base` in a new directory under `clones_dir`."""
+    started = time.perf_counter()
+    base = Path(base).resolve()
+    clones_dir = Path(clones_dir).resolve()
+    clones_dir.mkdir(parents=True, exist_ok=True)
+    register_internal_directory(clones_dir)
+    root = Path(tempfile.mkdtemp(dir=clones_dir, prefix=f"{name}-"))
+    clone = WorkspaceClone(base=base, root=root, method="hardlink")
+    stack = [(base, root, "")]
+    # The journal lives in the workspace but belongs to it, not to an attempt
+    excluded = {clones_dir} | journal_directories()
+    try:
+        while stack:
+            src_dir, dst_dir, prefix = stack.pop()
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    dst = os.path.join(dst_dir, entry.name)
+                    if entry.is_symlink():
+                        os.symlink(os.readlink(entry.path), dst)
+                    elif entry.is_dir():
+                        if entry.name in SKIPPED_DIRS or Path(entry.path) in excluded:
+                            continue
+                        if entry.name in SHARED_DIRS:
+                            os.symlink(entry.path, dst, target_is_directory=True)
+                            continue
+                        os.mkdir(dst)
+                        stack.append((Path(entry.path), Path(dst), prefix + entry.name + "/"))
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        clone.baseline[prefix + entry.name] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                        if clone.method == "hardlink":
+                            try:
+                                os.link(entry.path, dst)
+                                continue
+                            except OSError as e:
+                                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                                    raise
+                                clone.method = "copy"
+                        _reflink_or_copy(entry.path, dst)
+    except BaseException:
+        clone.remove()
+        raise
+    clone.seconds = time.perf_counter() - started
+    return clone
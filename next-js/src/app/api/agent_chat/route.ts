@@ -15,6 +15,9 @@ export async function POST(request: NextRequest) {
         // Add any other headers if needed, like authentication tokens
       },
       body: JSON.stringify(body), // Forward the original body
+      // Abort the backend request when the browser goes away, so the backend
+      // sees the disconnect and stops the agent run
+      signal: request.signal,
     });
 
     // Check if the backend request was successful
@@ -32,14 +35,9 @@ export async function POST(request: NextRequest) {
     }
 
     // Create a ReadableStream to pipe the backend stream
+    const reader = backendResponse.body.getReader();
     const stream = new ReadableStream({
       async start(controller) {
-        if (!backendResponse.body) {
-          controller.close();
-          return;
-        }
-        const reader = backendResponse.body.getReader();
-
         function push() {
           reader.read().then(({ done, value }) => {
             if (done) {
@@ -57,6 +55,12 @@ export async function POST(request: NextRequest) {
         }
 
         push();
+      },
+      // The client stopped reading (closed the tab, navigated away): close the
+      // backend stream too instead of draining it to the end
+      cancel(reason) {
+        console.log('Proxy stream cancelled by client.');
+        reader.cancel(reason).catch(() => {});
       }
     });
 
@@ -7,6 +7,8 @@ export default function Home() {
   const [streamedResponse, setStreamedResponse] = useState<string[]>([]);
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
+  // One conversation per page load; the backend keeps its history under this id
+  const [threadId] = useState<string>(() => crypto.randomUUID());
 
   const handleSubmit = async (e: FormEvent<HTMLFormElement>) => {
     e.preventDefault();
@@ -25,7 +27,7 @@ export default function Home() {
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message }),
+        body: JSON.stringify({ message, thread_id: threadId }),
       });
 
       if (!response.ok) {